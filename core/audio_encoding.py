@@ -0,0 +1,104 @@
+"""
+Audio Encoding
+Tạo bản MP3 mono bitrate thấp (compact) cho audio TTS trước khi cache, và đọc độ dài
+thật của audio thay vì ước tính len/16000.
+
+- encode_compact_mp3: pydub + ffmpeg; trả về None nếu máy không có ffmpeg (dùng bản gốc)
+- mp3_duration_seconds: độ dài từ stream đã decode (pydub) hoặc từ header MP3 frame đầu
+  (edge-tts xuất CBR nên bitrate của frame đầu đúng cho cả file)
+
+Giữ MP3 (không dùng Opus) vì các page phát bằng st.audio(format='audio/mp3') và Safari/iOS
+không phát được Ogg/Opus; giữ nguyên sample rate để ghép chunk cũ/mới không bị lệch.
+"""
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+COMPACT_AUDIO_ENABLED = os.getenv("TTS_COMPACT_AUDIO", "1") == "1"
+COMPACT_BITRATE = os.getenv("TTS_COMPACT_BITRATE", "32k")  # edge-tts mặc định 48k mono
+
+# Bitrate (kbps) theo (MPEG version, layer) - index 1..14 của header
+_BITRATES = {
+    (1, 1): [32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_ffmpeg_missing_logged = False
+
+
+def _skip_id3(data):
+    """Offset sau ID3v2 tag (nếu có)."""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return 10 + size
+    return 0
+
+
+def _first_frame_bitrate_kbps(data):
+    """Bitrate của MP3 frame đầu tiên, None nếu không tìm thấy header hợp lệ."""
+    i = _skip_id3(data)
+    end = min(len(data) - 4, i + 64 * 1024)
+    while i < end:
+        if data[i] == 0xFF and (data[i + 1] & 0xE0) == 0xE0:
+            version_bits = (data[i + 1] >> 3) & 0x03   # 3=MPEG1, 2=MPEG2, 0=MPEG2.5
+            layer_bits = (data[i + 1] >> 1) & 0x03     # 1=Layer III, 2=II, 3=I
+            bitrate_index = (data[i + 2] >> 4) & 0x0F
+            if version_bits != 1 and layer_bits != 0 and 0 < bitrate_index < 15:
+                version = 1 if version_bits == 3 else 2
+                layer = 4 - layer_bits
+                return _BITRATES[(version, layer)][bitrate_index - 1]
+        i += 1
+    return None
+
+
+def mp3_duration_seconds(audio_bytes):
+    """
+    Độ dài (giây) của audio MP3 CBR tính từ bitrate trong header.
+
+    Returns:
+        float hoặc None nếu không đọc được header
+    """
+    if not audio_bytes:
+        return None
+    bitrate = _first_frame_bitrate_kbps(audio_bytes)
+    if not bitrate:
+        return None
+    payload = len(audio_bytes) - _skip_id3(audio_bytes)
+    return payload * 8 / (bitrate * 1000)
+
+
+def encode_compact_mp3(audio_bytes, bitrate=COMPACT_BITRATE):
+    """
+    Decode audio rồi xuất MP3 mono bitrate thấp.
+
+    Returns:
+        (compact_bytes, duration_seconds) hoặc None nếu không encode được
+        (thiếu pydub/ffmpeg, audio lỗi) hoặc bản compact không nhỏ hơn bản gốc
+    """
+    global _ffmpeg_missing_logged
+    if not COMPACT_AUDIO_ENABLED or not audio_bytes:
+        return None
+    try:
+        from pydub import AudioSegment
+        segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
+        buffer = io.BytesIO()
+        segment.set_channels(1).export(buffer, format="mp3", bitrate=bitrate)
+        compact = buffer.getvalue()
+    except (ImportError, FileNotFoundError, OSError) as e:
+        if not _ffmpeg_missing_logged:
+            logger.info(f"Compact audio encoding unavailable (pydub/ffmpeg): {e}")
+            _ffmpeg_missing_logged = True
+        return None
+    except Exception as e:
+        logger.warning(f"Compact audio encoding failed: {e}")
+        return None
+
+    if not compact or len(compact) >= len(audio_bytes):
+        return None
+    return compact, len(segment) / 1000.0
@@ -4,6 +4,7 @@ import time
 import io
 from PIL import Image
 from core.database import supabase
+from core.rate_limiter import LoginLimiter
 from supabase import create_client
 import secrets
 import logging
@@ -26,8 +27,54 @@ def check_session_timeout():
     st.session_state.last_activity = datetime.now()
     return False
 
+# Ký tự wildcard của ilike/PostgREST: username chứa các ký tự này không dùng được fallback ilike
+_ILIKE_SPECIAL_CHARS = set('%_*\\')
+
+def _find_user_by_username(username_clean):
+    """
+    Tìm user để đăng nhập: khớp chính xác trước, sau đó không phân biệt hoa thường.
+    Tra cứu không phân biệt hoa thường dùng RPC find_user_by_username_ci (index trên
+    lower(username)); DB chưa có RPC thì dùng ilike không wildcard, không tải cả bảng Users.
+    
+    Returns:
+        Row Users hoặc None (không tìm thấy, hoặc nhiều user chỉ khác nhau hoa thường)
+    """
+    response = supabase.table("Users").select("*").eq("username", username_clean).execute()
+    if response.data:
+        return response.data[0]
+    
+    logger.warning(f"No user found with username: '{username_clean}'")
+    try:
+        result = supabase.rpc('find_user_by_username_ci', {'p_username': username_clean}).execute()
+        matches = result.data or []
+    except Exception as rpc_error:
+        logger.debug(f"find_user_by_username_ci RPC unavailable, using ilike: {rpc_error}")
+        if any(c in _ILIKE_SPECIAL_CHARS for c in username_clean):
+            return None
+        try:
+            matches = supabase.table("Users").select("*").ilike("username", username_clean).limit(2).execute().data or []
+        except Exception as fallback_error:
+            logger.error(f"Fallback search error: {fallback_error}")
+            return None
+    
+    if isinstance(matches, dict):
+        matches = [matches]
+    if len(matches) == 1:
+        logger.info(f"Found case-insensitive match: '{matches[0].get('username')}' matches '{username_clean}'")
+        return matches[0]
+    if len(matches) > 1:
+        logger.warning(f"Ambiguous case-insensitive username '{username_clean}' ({len(matches)} users), login refused")
+    return None
+
 def check_login(username, password):
-    """Kiểm tra đăng nhập với rate limiting và session management."""
+    """
+    Kiểm tra đăng nhập với rate limiting và session management.
+    
+    Returns:
+        Dict user nếu đúng, "LOCKED" nếu tài khoản bị khoá, "TOO_MANY_ATTEMPTS" nếu
+        nhập sai quá nhiều lần (LoginLimiter, thông báo lưu ở st.session_state.login_error_message),
+        None nếu sai tên đăng nhập/mật khẩu
+    """
     # Kiểm tra session timeout
     if check_session_timeout():
         return None
@@ -35,42 +82,31 @@ def check_login(username, password):
     if not supabase:
         logger.error("Login failed: Supabase client is not initialized.")
         return None
-        
+    
+    # Trim username to handle whitespace issues
+    username_clean = username.strip() if username else ""
+    if not username_clean:
+        logger.warning("Login failed: Empty username")
+        return None
+    
+    attempts = LoginLimiter.check_attempts(username_clean)
+    if not attempts.get('allowed', True):
+        logger.warning(f"Login blocked for '{username_clean}': too many failed attempts")
+        # Thông báo (kèm thời gian chờ) của LoginLimiter để trang login hiển thị
+        st.session_state.login_error_message = attempts.get('message')
+        return "TOO_MANY_ATTEMPTS"
+    
+    user = _check_credentials(username_clean, password)
+    LoginLimiter.log_attempt(username_clean, success=isinstance(user, dict))
+    return user
+
+def _check_credentials(username, password):
+    """Tìm user và kiểm tra mật khẩu (bcrypt hoặc legacy plain text)."""
     try:
-        # Trim username to handle whitespace issues
-        username_clean = username.strip() if username else ""
-        if not username_clean:
-            logger.warning("Login failed: Empty username")
-            return None
-        
-        logger.info(f"Attempting to find user: '{username_clean}'")
-        response = supabase.table("Users").select("*").eq("username", username_clean).execute()
-        
-        # Debug: Log response details
-        logger.info(f"Query response: data_count={len(response.data) if response.data else 0}, response_type={type(response)}")
-        if response.data:
-            logger.info(f"Found user: {response.data[0].get('username')}, id={response.data[0].get('id')}")
-        else:
-            logger.warning(f"No user found with username: '{username_clean}'")
-            # Try case-insensitive search as fallback
-            try:
-                all_users = supabase.table("Users").select("username, id").execute()
-                if all_users.data:
-                    logger.info(f"Available usernames in DB: {[u.get('username') for u in all_users.data]}")
-                    # Try case-insensitive match
-                    for u in all_users.data:
-                        if u.get('username', '').lower() == username_clean.lower():
-                            logger.info(f"Found case-insensitive match: '{u.get('username')}' matches '{username_clean}'")
-                            # Retry with exact username from DB
-                            response = supabase.table("Users").select("*").eq("username", u.get('username')).execute()
-                            if response.data:
-                                logger.info(f"Successfully retrieved user with exact username from DB")
-                                break
-            except Exception as fallback_error:
-                logger.error(f"Fallback search error: {fallback_error}")
+        logger.info(f"Attempting to find user: '{username}'")
+        user = _find_user_by_username(username)
         
-        if response.data:
-            user = response.data[0]
+        if user:
             db_pass = str(user.get('password', ''))
             
             # Debug logging
@@ -113,7 +149,7 @@ def check_login(username, password):
                     try:
                         logger.info(f"Auto-hashing legacy password for user: {username}")
                         # Call the existing update function which handles hashing
-                        update_user_password(username, password)
+                        update_user_password(user.get('username') or username, password)
                     except Exception as e:
                         logger.error(f"Failed to auto-hash password for {username}: {e}")
                     # --- END AUTO-HASHING ---
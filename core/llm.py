@@ -1,13 +1,17 @@
 # core/llm.py
 import time
 import streamlit as st
-import json
 import logging
-import re
 import os
 import random
+import threading
+from collections import deque
 from datetime import datetime, timedelta
 
+from core.prompts import render_prompt
+from core.llm_output import extract_json, validate_schema
+from core.llm_telemetry import record_llm_call, extract_usage
+
 # Thư viện đúng cho google-genai mới
 try:
     from google import genai
@@ -31,29 +35,57 @@ def check_session_timeout():
     st.session_state.last_activity = datetime.now()
 
 # --- 2. GEMINI CONFIGURATION ---
-def _get_gemini_client():
-    # Kiểm tra trong session state xem đã có client chưa
-    if "gemini_client" in st.session_state and st.session_state.gemini_client:
-        return st.session_state.gemini_client
+# Connection pool của client dùng chung (có thể chỉnh qua biến môi trường)
+GEMINI_POOL_MAX_CONNECTIONS = int(os.getenv("GEMINI_POOL_MAX_CONNECTIONS", "20"))
+GEMINI_POOL_MAX_KEEPALIVE = int(os.getenv("GEMINI_POOL_MAX_KEEPALIVE", "10"))
+GEMINI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+GEMINI_HTTP_TIMEOUT_MS = int(os.getenv("GEMINI_HTTP_TIMEOUT_MS", "60000"))
 
-    diag = {"api_key_source": None, "ok": False, "error": None}
-    
+def _resolve_gemini_api_key():
+    """Trả về (api_key, source) - source là 'secrets', 'env' hoặc None."""
     # 1. Thử lấy từ st.secrets
     try:
         google_creds = st.secrets.get("google_credentials", {})
         api_key = google_creds.get("google_api_key")
         if api_key:
-            diag['api_key_source'] = 'secrets'
+            return api_key, 'secrets'
     except Exception:
-        api_key = None
+        pass
 
     # 2. Thử lấy từ biến môi trường
-    if not api_key:
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if api_key:
-            diag['api_key_source'] = 'env'
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if api_key:
+        return api_key, 'env'
+    return None, None
+
+@st.cache_resource(show_spinner=False)
+def _get_shared_gemini_client(api_key):
+    """
+    genai.Client dùng chung cho toàn process (mọi session), cache theo api_key.
+    Client dùng một httpx connection pool keep-alive nên các session mới không phải
+    khởi tạo client + bắt tay TLS lại. httpx.Client thread-safe nên dùng chung được.
+    """
+    import httpx
+    client_args = {
+        'limits': httpx.Limits(
+            max_connections=GEMINI_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+    try:
+        http_options = types.HttpOptions(timeout=GEMINI_HTTP_TIMEOUT_MS, client_args=client_args)
+        return genai.Client(api_key=api_key, http_options=http_options)
+    except (TypeError, ValueError) as e:
+        # SDK cũ chưa hỗ trợ client_args -> dùng pool mặc định
+        logger.info(f"Gemini SDK does not support custom pool limits ({e}), using defaults")
+        return genai.Client(api_key=api_key)
 
-    st.session_state['gemini_diag'] = diag
+def _get_gemini_client(session=None):
+    """session: nơi lưu gemini_diag (mặc định st.session_state; dict khi chạy ngoài script)."""
+    api_key, source = _resolve_gemini_api_key()
+    diag = {"api_key_source": source, "ok": False, "error": None}
+    (st.session_state if session is None else session)['gemini_diag'] = diag
 
     if not api_key:
         diag['error'] = 'No API key found.'
@@ -61,11 +93,8 @@ def _get_gemini_client():
         return None
 
     try:
-        # Khởi tạo Client (Lưu ý: Chỉ khởi tạo Client, không gọi model ở đây)
-        client = genai.Client(api_key=api_key)
-        
-        # Lưu client vào session_state
-        st.session_state.gemini_client = client
+        # Client dùng chung toàn process (Lưu ý: Chỉ khởi tạo Client, không gọi model ở đây)
+        client = _get_shared_gemini_client(api_key)
         diag['ok'] = True
         return client
     except (genai.types.APIError, Exception) as e: # Catch specific APIError or general Exception
@@ -73,62 +102,236 @@ def _get_gemini_client():
         logging.error(f'Gemini configuration error: {e}')
         return None
 
+# --- 2b. MODEL HEALTH & CIRCUIT BREAKER ---
+# Thứ tự model: model chính trước, model dự phòng sau
+MODEL_CHAIN = ("gemini-2.5-flash", "gemini-2.0-flash")
+
+# Cấu hình circuit breaker (dùng chung cho toàn process, không theo session)
+BREAKER_WINDOW_SECONDS = 60       # Cửa sổ tính tỉ lệ lỗi
+BREAKER_MIN_CALLS = 4             # Số call tối thiểu trong cửa sổ trước khi xét mở breaker
+BREAKER_ERROR_RATE = 0.5          # Tỉ lệ lỗi để mở breaker
+BREAKER_OPEN_SECONDS = 30         # Thời gian breaker mở trước khi cho probe (half-open)
+BREAKER_PROBE_TIMEOUT_SECONDS = 30  # Probe chưa có kết quả sau bấy nhiêu giây -> cho probe mới
+
+# Cấu hình retry
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4.0
+REQUEST_DEADLINE_SECONDS = 20.0
+
+
+class ModelHealth:
+    """
+    Theo dõi sức khỏe của một model: tỉ lệ lỗi & latency trong cửa sổ trượt,
+    kèm circuit breaker 3 trạng thái (closed -> open -> half_open -> closed).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, model_name, window_seconds=BREAKER_WINDOW_SECONDS, min_calls=BREAKER_MIN_CALLS,
+                 error_rate_threshold=BREAKER_ERROR_RATE, open_seconds=BREAKER_OPEN_SECONDS,
+                 probe_timeout=BREAKER_PROBE_TIMEOUT_SECONDS):
+        self.model_name = model_name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._probe_started_at = None
+        self._calls = deque()  # (timestamp, ok, latency_seconds)
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def allow_request(self):
+        """
+        True nếu được phép gọi model (closed, hoặc là probe duy nhất khi half-open).
+        Probe không báo kết quả (vd: stream bị bỏ dở) quá probe_timeout thì coi như hết hạn.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight and now - self._probe_started_at < self.probe_timeout:
+                    return False
+                self._probe_in_flight = True
+                self._probe_started_at = now
+            return True
+
+    def record(self, ok, latency):
+        """Ghi nhận kết quả một call và cập nhật trạng thái breaker."""
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    # Probe thành công -> đóng breaker, bỏ lịch sử lỗi cũ
+                    self.state = self.CLOSED
+                    self.opened_at = None
+                    self._calls.clear()
+                    self._calls.append((now, ok, latency))
+                else:
+                    self.state = self.OPEN
+                    self.opened_at = now
+                return
+
+            if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                if failures / len(self._calls) >= self.error_rate_threshold:
+                    self.state = self.OPEN
+                    self.opened_at = now
+                    logger.warning(f"Circuit breaker OPEN for {self.model_name} "
+                                   f"({failures}/{len(self._calls)} failures in {self.window_seconds}s)")
+
+    def snapshot(self):
+        """Thống kê hiện tại (dùng cho admin/debug)."""
+        with self._lock:
+            self._prune(time.monotonic())
+            total = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            latencies = sorted(lat for _, _, lat in self._calls)
+            return {
+                'model': self.model_name,
+                'state': self.state,
+                'calls': total,
+                'error_rate': (failures / total) if total else 0.0,
+                'avg_latency': (sum(latencies) / total) if total else 0.0,
+                'p95_latency': latencies[min(total - 1, int(total * 0.95))] if total else 0.0,
+            }
+
+
+_model_health = {}
+_model_health_lock = threading.Lock()
+
+
+def get_model_health(model_name):
+    """Lấy (hoặc tạo) ModelHealth dùng chung toàn process cho model_name."""
+    with _model_health_lock:
+        health = _model_health.get(model_name)
+        if health is None:
+            health = ModelHealth(model_name)
+            _model_health[model_name] = health
+        return health
+
+
+def get_model_health_snapshot():
+    """Trạng thái breaker/latency của tất cả model đã gọi."""
+    with _model_health_lock:
+        models = list(_model_health.values())
+    return [h.snapshot() for h in models]
+
+
+def _backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff với full jitter: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _pick_model(models=MODEL_CHAIN):
+    """Model đầu tiên trong chain mà breaker cho phép gọi, hoặc None nếu tất cả đang mở."""
+    for model_name in models:
+        if get_model_health(model_name).allow_request():
+            return model_name
+    return None
+
+
+def _call_model_with_health(client, prompt, model_name, usage=None):
+    """Gọi _call_model_text và ghi nhận kết quả vào ModelHealth của model."""
+    started = time.monotonic()
+    ok, text = _call_model_text(client, prompt, model_name=model_name, usage=usage)
+    get_model_health(model_name).record(ok, time.monotonic() - started)
+    return ok, text
+
+
 # --- 3. CORE AI CALL ---
-def _call_model_text(client, prompt, model_name="gemini-2.5-flash"):
+def _build_generate_config():
+    # Cấu hình Safety Settings để tránh bị chặn nội dung (BLOCK_NONE)
+    safety_settings = [
+        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
+        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
+        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
+        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
+    ]
+    return types.GenerateContentConfig(safety_settings=safety_settings)
+
+def _call_model_text(client, prompt, model_name="gemini-2.5-flash", usage=None):
+    """Gọi Gemini; nếu truyền dict `usage`, token counts của response sẽ được điền vào đó."""
     if client is None:
         return False, 'Client is None'
     try:
-        # Cấu hình Safety Settings để tránh bị chặn nội dung (BLOCK_NONE)
-        safety_settings = [
-            types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-            types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-            types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-            types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-        ]
-        config = types.GenerateContentConfig(safety_settings=safety_settings)
-
         # CÚ PHÁP ĐÚNG CỦA SDK MỚI: gọi qua client.models
         response = client.models.generate_content(
             model=model_name,
             contents=prompt,
-            config=config
+            config=_build_generate_config()
         )
         text = response.text
+        if usage is not None:
+            usage.update(extract_usage(response))
         return True, text
     except (genai.types.APIError, Exception) as e: # Catch specific APIError or general Exception
         return False, str(e)
 
-def parse_json_response(raw_text):
-    if not raw_text:
-        return None
-    text = raw_text.strip()
-    # Regex để tìm JSON trong markdown code block
-    match = re.search(r"```(?:json)?\s*(\[.*?\]|\{.*?\})\s*```", text, re.DOTALL)
-    if match:
-        text = match.group(1)
-    else:
-        # Regex tìm JSON trần
-        match = re.search(r"(\[.*\]|\{.*\})", text, re.DOTALL)
-        if match:
-            text = match.group(0)
-    try:
-        return json.loads(text)
-    except Exception:
-        return None
+def _stream_model_text(client, prompt, model_name="gemini-2.5-flash", usage=None):
+    """
+    Phiên bản streaming của _call_model_text: yield từng đoạn text ngay khi Gemini trả về.
+    Raise exception nếu call lỗi (caller tự quyết định retry/fallback).
+    Token counts (có trong chunk cuối) được điền vào dict `usage` nếu truyền vào.
+    """
+    if client is None:
+        raise RuntimeError('Client is None')
+    stream = client.models.generate_content_stream(
+        model=model_name,
+        contents=prompt,
+        config=_build_generate_config()
+    )
+    for chunk in stream:
+        if usage is not None:
+            chunk_usage = extract_usage(chunk)
+            if chunk_usage.get('total_tokens'):
+                usage.update(chunk_usage)
+        text = getattr(chunk, 'text', None)
+        if text:
+            yield text
 
-def generate_response_with_fallback(prompt, fallback_responses=None, max_retries=3, feature_type='general'):
+def parse_json_response(raw_text, schema=None):
     """
-    Generate AI response with caching support.
+    Tách JSON từ output của AI (xem core.llm_output.extract_json).
     
     Args:
-        prompt: Prompt text
-        fallback_responses: List of fallback responses if AI fails
-        max_retries: Maximum retry attempts
-        feature_type: Feature type for caching (listening, speaking, reading, writing, general)
+        raw_text: Text trả về từ Gemini
+        schema: Tên loại bài tập trong EXERCISE_SCHEMAS (vd: "dictation") hoặc dict schema;
+                nếu có, trả về None khi dữ liệu sai cấu trúc
     """
-    # --- AI Cache: Check cache first ---
+    data = extract_json(raw_text)
+    if data is None or schema is None:
+        return data
+    return validate_schema(data, schema)
+
+def _resolve_feature_type(prompt, feature_type):
+    """Prompt render từ template (core.prompts) mặc định dùng feature_type của template."""
+    template = getattr(prompt, 'template', None)
+    if feature_type == 'general' and template is not None:
+        return template.feature_type
+    return feature_type
+
+def _get_cached_text(prompt, feature_type='general'):
+    """Text đã cache trong AICache cho prompt/feature_type, hoặc None."""
     try:
-        from services.ai_cache_service import get_cached_response, cache_response
+        from services.ai_cache_service import get_cached_response
         cached = get_cached_response(prompt, feature_type)
         if cached and cached.get('response'):
             response_data = cached['response']
@@ -140,19 +343,17 @@ def generate_response_with_fallback(prompt, fallback_responses=None, max_retries
             
             if cached_text and cached_text.strip():
                 logger.debug(f"Cache hit for feature_type={feature_type}, hit_count={cached.get('hit_count', 1)}")
-                # Don't track usage for cached responses (already counted before)
                 return cached_text
     except Exception as e:
         logger.debug(f"Cache check error (non-critical): {e}")
-    
-    client = _get_gemini_client()
-    if not client:
-        return random.choice(fallback_responses or ["Lỗi kết nối AI (Không tìm thấy Client)."])
+    return None
 
+def _before_ai_call(prompt, session):
+    """Log security monitor + lưu prompt debug trước khi gọi Gemini."""
     # --- Security Monitor: Log AI call ---
     try:
-        if st.session_state.get('logged_in'):
-            user_id = st.session_state.user_info.get('id')
+        if session.get('logged_in'):
+            user_id = session['user_info'].get('id')
             if user_id:
                 from core.security_monitor import SecurityMonitor
                 SecurityMonitor.log_user_action(user_id, 'ai_call', success=True, metadata={'prompt_length': len(prompt)})
@@ -160,57 +361,256 @@ def generate_response_with_fallback(prompt, fallback_responses=None, max_retries
         logger.debug(f"Security monitor log error (non-critical): {e}")
 
     # --- DEBUG: Lưu prompt để kiểm tra ---
-    st.session_state['last_gemini_prompt'] = prompt
+    session['last_gemini_prompt'] = prompt
 
     # Reset lỗi cũ trước khi gọi mới
-    if 'last_gemini_error' in st.session_state:
-        del st.session_state['last_gemini_error']
+    if 'last_gemini_error' in session:
+        del session['last_gemini_error']
 
-    for _ in range(max_retries):
-        ok, text = _call_model_text(client, prompt)
+def _after_ai_success(prompt, text, feature_type, session, use_cache=True):
+    """Lưu cache + track Premium usage sau khi Gemini trả về thành công."""
+    # Nếu thành công, xóa lỗi cũ (nếu có do retry) để tránh gây hiểu lầm
+    if 'last_gemini_error' in session: del session['last_gemini_error']
+    
+    # --- AI Cache: Save to cache ---
+    if use_cache:
+        try:
+            from services.ai_cache_service import cache_response
+            cache_response(prompt, text, feature_type)
+        except Exception as e:
+            logger.debug(f"Cache save error (non-critical): {e}")
+    
+    # Log Premium usage (after successful call)
+    try:
+        if session.get('logged_in'):
+            user_id = session['user_info'].get('id')
+            user_plan = session['user_info'].get('plan', 'free')
+            if user_id and user_plan == 'premium':
+                from services.premium_usage_service import track_premium_ai_usage
+                track_premium_ai_usage(user_id, feature_type, success=True, metadata={'prompt_length': len(prompt)})
+    except Exception as e:
+        logger.debug(f"Premium usage tracking error (non-critical): {e}")
+
+def _after_ai_failure(error, session):
+    """Lưu lỗi debug + log failed AI call."""
+    session['last_gemini_error'] = error  # <--- Lưu lỗi cụ thể để debug
+    # Log failed AI call
+    try:
+        if session.get('logged_in'):
+            user_id = session['user_info'].get('id')
+            if user_id:
+                from core.security_monitor import SecurityMonitor
+                SecurityMonitor.log_user_action(user_id, 'ai_call', success=False, metadata={'error': str(error)})
+    except:
+        pass
+
+def _new_call_stats():
+    """Thống kê của một request (điền dần trong quá trình gọi, ghi vào telemetry khi kết thúc)."""
+    return {'model': None, 'attempts': 0, 'cache_hit': False, 'fallback': False, 'success': False,
+            'prompt_tokens': 0, 'response_tokens': 0, 'total_tokens': 0}
+
+def _add_usage(stats, usage):
+    for key in ('prompt_tokens', 'response_tokens', 'total_tokens'):
+        stats[key] += usage.get(key, 0) or 0
+
+def _record_call_telemetry(prompt, text, feature_type, stats, started, streamed=False, session=None):
+    """Ghi request vào core.llm_telemetry (không bao giờ raise)."""
+    try:
+        record_llm_call(
+            feature_type=feature_type,
+            page=(st.session_state if session is None else session).get('active_page'),
+            model=stats['model'],
+            latency_ms=(time.monotonic() - started) * 1000,
+            prompt_chars=len(prompt or ''),
+            response_chars=len(text or ''),
+            prompt_tokens=stats['prompt_tokens'],
+            response_tokens=stats['response_tokens'],
+            total_tokens=stats['total_tokens'],
+            cache_hit=stats['cache_hit'],
+            attempts=stats['attempts'],
+            fallback=stats['fallback'],
+            success=stats['success'],
+            streamed=streamed,
+        )
+    except Exception as e:
+        logger.debug(f"LLM telemetry error (non-critical): {e}")
+
+def generate_response_with_fallback(prompt, fallback_responses=None, max_retries=3, feature_type='general',
+                                    deadline_seconds=REQUEST_DEADLINE_SECONDS, use_cache=True, use_session=True):
+    """
+    Generate AI response with caching support.
+    
+    Args:
+        prompt: Prompt text
+        fallback_responses: List of fallback responses if AI fails
+        max_retries: Maximum retry attempts
+        feature_type: Feature type for caching (listening, speaking, reading, writing, general)
+        deadline_seconds: Tổng thời gian tối đa cho request (bao gồm retry/backoff)
+        use_cache: False để bỏ qua AICache (đọc & ghi), vd. khi cần nội dung mới mỗi lần gọi
+        use_session: False khi gọi từ background thread (không có script context): không đọc/ghi
+                     st.session_state, không log security/premium usage cho user nào
+    
+    Retry dùng exponential backoff + jitter; model nào đang có circuit breaker mở
+    sẽ bị bỏ qua, nếu tất cả đều mở thì trả fallback ngay.
+    Mỗi request được ghi vào core.llm_telemetry (latency, token, cache, retry, fallback).
+    """
+    feature_type = _resolve_feature_type(prompt, feature_type)
+    session = st.session_state if use_session else {}
+    stats = _new_call_stats()
+    started = time.monotonic()
+    text = None
+    try:
+        text = _generate_response(prompt, fallback_responses, max_retries, feature_type, deadline_seconds, stats,
+                                  session, use_cache=use_cache)
+        return text
+    finally:
+        _record_call_telemetry(prompt, text, feature_type, stats, started, session=session)
+
+def _generate_response(prompt, fallback_responses, max_retries, feature_type, deadline_seconds, stats,
+                       session, use_cache=True):
+    # --- AI Cache: Check cache first ---
+    cached_text = _get_cached_text(prompt, feature_type) if use_cache else None
+    if cached_text:
+        # Don't track usage for cached responses (already counted before)
+        stats['cache_hit'] = stats['success'] = True
+        return cached_text
+    
+    client = _get_gemini_client(session)
+    if not client:
+        stats['fallback'] = True
+        return random.choice(fallback_responses or ["Lỗi kết nối AI (Không tìm thấy Client)."])
+
+    _before_ai_call(prompt, session)
+
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_retries):
+        model_name = _pick_model()
+        if model_name is None:
+            # Tất cả breaker đang mở -> fail fast sang fallback, không chờ
+            logger.warning("All Gemini circuit breakers open, using fallback response")
+            session['last_gemini_error'] = "AI tạm thời không khả dụng (circuit breaker đang mở)."
+            break
+
+        usage = {}
+        stats['attempts'] += 1
+        stats['model'] = model_name
+        ok, text = _call_model_with_health(client, prompt, model_name, usage=usage)
+        _add_usage(stats, usage)
         if ok and text and text.strip(): # Check if text is not empty or just whitespace
-            # Nếu thành công, xóa lỗi cũ (nếu có do retry) để tránh gây hiểu lầm
-            if 'last_gemini_error' in st.session_state: del st.session_state['last_gemini_error']
-            
-            # --- AI Cache: Save to cache ---
-            try:
-                from services.ai_cache_service import cache_response
-                cache_response(prompt, text, feature_type)
-            except Exception as e:
-                logger.debug(f"Cache save error (non-critical): {e}")
-            
-            # Log Premium usage (after successful call)
-            try:
-                if st.session_state.get('logged_in'):
-                    user_id = st.session_state.user_info.get('id')
-                    user_plan = st.session_state.user_info.get('plan', 'free')
-                    if user_id and user_plan == 'premium':
-                        from services.premium_usage_service import track_premium_ai_usage
-                        track_premium_ai_usage(user_id, feature_type, success=True, metadata={'prompt_length': len(prompt)})
-            except Exception as e:
-                logger.debug(f"Premium usage tracking error (non-critical): {e}")
-            
+            stats['success'] = True
+            _after_ai_success(prompt, text, feature_type, session, use_cache=use_cache)
             return text
         elif not ok:
             logger.warning(f"Gemini call failed: {text}")
-            st.session_state['last_gemini_error'] = text  # <--- Lưu lỗi cụ thể để debug
-            # Log failed AI call
-            try:
-                if st.session_state.get('logged_in'):
-                    user_id = st.session_state.user_info.get('id')
-                    if user_id:
-                        from core.security_monitor import SecurityMonitor
-                        SecurityMonitor.log_user_action(user_id, 'ai_call', success=False, metadata={'error': str(text)})
-            except:
-                pass
+            _after_ai_failure(text, session)
         else: # ok is True, but text is empty/whitespace
             logger.warning(f"Gemini call returned empty text for prompt: {prompt[:100]}...")
-            st.session_state['last_gemini_error'] = "AI trả về nội dung rỗng (Có thể do Safety Filter chặn)."
-        time.sleep(1)
+            session['last_gemini_error'] = "AI trả về nội dung rỗng (Có thể do Safety Filter chặn)."
+
+        if attempt == max_retries - 1:
+            break
+        delay = _backoff_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            logger.warning(f"Gemini request deadline ({deadline_seconds}s) reached, stop retrying")
+            break
+        time.sleep(delay)
     logger.error(f"All Gemini retries failed for prompt: {prompt[:100]}...") # Fallback after all retries
 
+    stats['fallback'] = True
     return random.choice(fallback_responses or ["Hệ thống AI đang bận."])
 
+def generate_response_stream(prompt, fallback_responses=None, max_retries=3, feature_type='general',
+                             deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """
+    Streaming variant của generate_response_with_fallback: yield từng đoạn text
+    để page render dần (vd: `st.write_stream(generate_response_stream(prompt))`).
+    
+    - Cache hit: yield toàn bộ text đã cache một lần.
+    - Retry (backoff + circuit breaker) chỉ áp dụng khi lỗi xảy ra trước chunk đầu tiên;
+      nếu stream bị ngắt giữa chừng thì dừng lại, không cache kết quả dở dang.
+    - Khi stream kết thúc đầy đủ, toàn bộ text được lưu vào AICache.
+    """
+    feature_type = _resolve_feature_type(prompt, feature_type)
+    stats = _new_call_stats()
+    started = time.monotonic()
+    chunks = []
+    try:
+        for chunk in _generate_stream(prompt, fallback_responses, max_retries, feature_type, deadline_seconds, stats):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        _record_call_telemetry(prompt, "".join(chunks), feature_type, stats, started, streamed=True)
+
+def _generate_stream(prompt, fallback_responses, max_retries, feature_type, deadline_seconds, stats):
+    cached_text = _get_cached_text(prompt, feature_type)
+    if cached_text:
+        stats['cache_hit'] = stats['success'] = True
+        yield cached_text
+        return
+
+    client = _get_gemini_client()
+    if not client:
+        stats['fallback'] = True
+        yield random.choice(fallback_responses or ["Lỗi kết nối AI (Không tìm thấy Client)."])
+        return
+
+    _before_ai_call(prompt, st.session_state)
+
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_retries):
+        model_name = _pick_model()
+        if model_name is None:
+            logger.warning("All Gemini circuit breakers open, using fallback response")
+            st.session_state['last_gemini_error'] = "AI tạm thời không khả dụng (circuit breaker đang mở)."
+            break
+
+        health = get_model_health(model_name)
+        started = time.monotonic()
+        chunks = []
+        usage = {}
+        stats['attempts'] += 1
+        stats['model'] = model_name
+        try:
+            for chunk in _stream_model_text(client, prompt, model_name=model_name, usage=usage):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # Caller bỏ stream (rerun/stop) sau khi đã nhận chunk -> model vẫn trả lời được;
+            # phải ghi nhận để probe half-open không bị treo
+            health.record(True, time.monotonic() - started)
+            _add_usage(stats, usage)
+            raise
+        except Exception as e:
+            health.record(False, time.monotonic() - started)
+            _add_usage(stats, usage)
+            logger.warning(f"Gemini stream failed: {e}")
+            _after_ai_failure(str(e), st.session_state)
+            if chunks:
+                # Đã render một phần -> không retry để tránh lặp nội dung
+                return
+        else:
+            health.record(True, time.monotonic() - started)
+            _add_usage(stats, usage)
+            text = "".join(chunks)
+            if text.strip():
+                stats['success'] = True
+                _after_ai_success(prompt, text, feature_type, st.session_state)
+                return
+            logger.warning(f"Gemini stream returned empty text for prompt: {prompt[:100]}...")
+            st.session_state['last_gemini_error'] = "AI trả về nội dung rỗng (Có thể do Safety Filter chặn)."
+
+        if attempt == max_retries - 1:
+            break
+        delay = _backoff_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            logger.warning(f"Gemini request deadline ({deadline_seconds}s) reached, stop retrying")
+            break
+        time.sleep(delay)
+    logger.error(f"All Gemini stream retries failed for prompt: {prompt[:100]}...")
+
+    stats['fallback'] = True
+    yield random.choice(fallback_responses or ["Hệ thống AI đang bận."])
+
 # --- 4. CÁC HÀM CHỨC NĂNG CỤ THỂ ---
 def generate_grammar_test_questions(level, topic, num_questions=10, allow_local_fallback=False):
     """
@@ -229,17 +629,11 @@ def generate_grammar_test_questions(level, topic, num_questions=10, allow_local_
     # Try to get unseen questions from cache (up to num_questions)
     if user_id:
         try:
-            from services.exercise_cache_service import get_unseen_exercise, save_exercise, mark_exercise_seen
-            for _ in range(num_questions):
-                cached_exercise = get_unseen_exercise(user_id, "grammar_question", level, topic)
-                if cached_exercise:
-                    exercise_data = cached_exercise.get('exercise_data', {})
-                    if exercise_data:  # Ensure it's a valid question
-                        cached_questions.append(exercise_data)
-                        exercise_ids.append(cached_exercise.get('id'))
-                        mark_exercise_seen(user_id, cached_exercise.get('id'))
-                else:
-                    break  # No more cached questions
+            from services.exercise_cache_service import get_unseen_exercises
+            # 1 history fetch + 1 candidate query + 1 batched upsert cho cả bộ câu hỏi
+            for cached_exercise in get_unseen_exercises(user_id, "grammar_question", level, topic, n=num_questions):
+                cached_questions.append(cached_exercise['exercise_data'])
+                exercise_ids.append(cached_exercise['id'])
         except Exception as e:
             logger.warning(f"Error getting cached grammar questions: {e}")
     
@@ -256,22 +650,30 @@ def generate_grammar_test_questions(level, topic, num_questions=10, allow_local_
                 return cached_questions[:num_questions]
             return None
 
-        prompt = f"""
-        Create {remaining} multiple-choice grammar questions for level {level} on "{topic}".
-        Format: JSON list. Keys: "question", "options" (list of 4), "answer", "explanation" (in Vietnamese).
-        Strictly JSON.
-        """
+        prompt = render_prompt("grammar_questions", count=remaining, level=level, topic=topic)
 
+        stats = _new_call_stats()
+        started = time.monotonic()
+        text = None
         try:
-            ok, text = _call_model_text(client, prompt)
+            model_name = _pick_model()
+            if model_name is None:
+                ok, text = False, 'All Gemini circuit breakers open'
+            else:
+                usage = {}
+                stats['attempts'], stats['model'] = 1, model_name
+                ok, text = _call_model_with_health(client, prompt, model_name, usage=usage)
+                _add_usage(stats, usage)
+                stats['success'] = ok
             if ok:
-                parsed_json = parse_json_response(text)
+                parsed_json = parse_json_response(text, schema="grammar_question")
                 if parsed_json and isinstance(parsed_json, list):
                     new_questions = parsed_json
                     # Save new questions to cache
                     if user_id:
                         try:
-                            from services.exercise_cache_service import save_exercise, mark_exercise_seen
+                            from services.exercise_cache_service import save_exercise, mark_exercises_seen
+                            new_ids = []
                             for question in new_questions:
                                 exercise_id = save_exercise(
                                     exercise_type="grammar_question",
@@ -281,13 +683,16 @@ def generate_grammar_test_questions(level, topic, num_questions=10, allow_local_
                                     user_id=user_id
                                 )
                                 if exercise_id:
-                                    mark_exercise_seen(user_id, exercise_id)
+                                    new_ids.append(exercise_id)
+                            mark_exercises_seen(user_id, new_ids)
                         except Exception as e:
                             logger.warning(f"Error saving grammar questions to cache: {e}")
                 else:
                     logger.error(f"Failed to parse JSON from Gemini response for test questions. Raw text: {text[:500]}...")
         except Exception as e:
             logger.error(f"Error generating grammar test questions: {e}")
+        finally:
+            _record_call_telemetry(prompt, text if stats['success'] else None, 'grammar', stats, started)
     
     # Combine cached and new questions
     all_questions = cached_questions + new_questions
@@ -299,12 +704,11 @@ def generate_grammar_test_questions(level, topic, num_questions=10, allow_local_
     return None
 
 def get_writing_feedback(topic, user_text, level):
-    # Prompt ngắn gọn, súc tích
-    prompt = f"Grade this writing (Level {level}) on '{topic}':\n'{user_text}'\nOutput in Vietnamese: Score, Errors, Fixes."
+    prompt = render_prompt("writing_feedback", topic=topic, user_text=user_text, level=level)
     return generate_response_with_fallback(prompt, ["Không thể chấm bài lúc này."], feature_type='writing')
 
 def generate_vocab_mnemonics(word, meaning):
-    prompt = f"Mẹo nhớ từ '{word}' ({meaning}). Trả về JSON: {{'mnemonic': '...', 'story': '...'}}"
+    prompt = render_prompt("vocab_mnemonics", word=word, meaning=meaning)
     res = generate_response_with_fallback(prompt)
     return parse_json_response(res)
 
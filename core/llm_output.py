@@ -0,0 +1,267 @@
+"""
+LLM Output Parsing
+Tách JSON từ output của Gemini (markdown, text thừa, lỗi cú pháp nhỏ) và
+validate theo schema của từng loại bài tập.
+
+- extract_json: quét bracket/string-aware, trả về giá trị JSON hợp lệ đầu tiên (ngoài cùng)
+- repair_json: sửa lỗi thường gặp (trailing comma, smart quotes, dict kiểu Python)
+- validate_schema: kiểm tra cấu trúc theo EXERCISE_SCHEMAS
+- extract_partial_fields: đọc các field chuỗi từ JSON đang stream dở (hiển thị dần)
+"""
+import ast
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_OPENERS = {'{': '}', '[': ']'}
+_SMART_QUOTES = str.maketrans({
+    '“': '"', '”': '"', '„': '"', '‟': '"',
+    '‘': "'", '’': "'", '‚': "'", '‛': "'",
+})
+
+
+def _match_end(text, start):
+    """
+    Vị trí đóng ngoặc tương ứng với text[start] ('{' hoặc '['), bỏ qua ngoặc nằm
+    trong chuỗi JSON. Trả về -1 nếu không tìm thấy hoặc ngoặc lệch.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _OPENERS:
+            stack.append(_OPENERS[ch])
+        elif ch in ('}', ']'):
+            if not stack or stack.pop() != ch:
+                return -1
+            if not stack:
+                return i
+    return -1
+
+
+def _strip_trailing_commas(text):
+    """Bỏ dấu phẩy ngay trước '}' hoặc ']' (ngoài chuỗi)."""
+    out = []
+    in_string = False
+    escaped = False
+    n = len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == ',':
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            if j < n and text[j] in '}]':
+                continue
+        out.append(ch)
+    return ''.join(out)
+
+
+def repair_json(candidate):
+    """
+    Thử parse candidate, lần lượt áp dụng các bước sửa lỗi phổ biến.
+    Trả về (True, value) nếu parse được, (False, None) nếu không.
+    """
+    attempts = (
+        lambda t: t,
+        _strip_trailing_commas,
+        lambda t: _strip_trailing_commas(t.translate(_SMART_QUOTES)),
+    )
+    for fix in attempts:
+        try:
+            return True, json.loads(fix(candidate))
+        except (ValueError, TypeError):
+            continue
+
+    # Dict/list kiểu Python ({'key': 'value'}, True/None)
+    try:
+        value = ast.literal_eval(candidate.translate(_SMART_QUOTES))
+        if isinstance(value, (dict, list)):
+            return True, value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    return False, None
+
+
+def extract_json(raw_text):
+    """
+    Tìm giá trị JSON (object/array) hợp lệ đầu tiên trong raw_text.
+    Chịu được markdown code block, text trước/sau JSON, object lồng nhau.
+    """
+    if not raw_text:
+        return None
+    text = raw_text.strip()
+
+    # Fast path: toàn bộ text là JSON
+    ok, value = repair_json(text)
+    if ok and isinstance(value, (dict, list)):
+        return value
+
+    # Chỉ xét các giá trị ở cấp ngoài cùng: candidate lỗi thì bỏ qua cả khối (end + 1),
+    # không đi vào object/array con, để không trả về 1 mảnh bên trong như thể là cả câu trả lời
+    i = 0
+    n = len(text)
+    while i < n:
+        if text[i] not in _OPENERS:
+            i += 1
+            continue
+        end = _match_end(text, i)
+        if end == -1:
+            # Smart quotes có thể làm lệch việc nhận diện chuỗi -> thử lại sau khi chuẩn hóa
+            normalized = text[i:].translate(_SMART_QUOTES)
+            end_norm = _match_end(normalized, 0)
+            if end_norm == -1:
+                # Bị cắt giữa chừng: mọi opener phía sau đều nằm bên trong khối này
+                return None
+            end = i + end_norm
+            ok, value = repair_json(normalized[:end_norm + 1])
+        else:
+            ok, value = repair_json(text[i:end + 1])
+        if ok:
+            return value
+        i = end + 1
+    return None
+
+
+def _partial_string(text, start):
+    """Giá trị chuỗi JSON bắt đầu sau dấu '"' tại start-1; có thể chưa đóng (đang stream)."""
+    escaped = False
+    for i in range(start, len(text)):
+        if escaped:
+            escaped = False
+        elif text[i] == '\\':
+            escaped = True
+        elif text[i] == '"':
+            return text[start:i]
+    # Bỏ escape bị cắt dở ở cuối (vd: \ hoặc \u00)
+    return re.sub(r'\\(u[0-9a-fA-F]{0,3})?$', '', text[start:])
+
+
+def extract_partial_fields(partial_text, fields):
+    """
+    Lấy giá trị các field chuỗi từ text JSON chưa hoàn chỉnh (đang stream).
+
+    Args:
+        partial_text: Phần output đã nhận được
+        fields: Tên các field chuỗi cần lấy (nên là field cấp ngoài, tên không trùng field lồng)
+
+    Returns:
+        dict {field: giá trị đã nhận tới thời điểm này}, chỉ gồm field đã bắt đầu xuất hiện
+    """
+    values = {}
+    if not partial_text:
+        return values
+    for field in fields:
+        match = re.search(r'"%s"\s*:\s*"' % re.escape(field), partial_text)
+        if not match:
+            continue
+        raw = _partial_string(partial_text, match.end())
+        try:
+            values[field] = json.loads(f'"{raw}"')
+        except ValueError:
+            values[field] = raw
+    return values
+
+
+# --- SCHEMAS ---
+# Schema tối giản (không cần thư viện ngoài):
+#   {"type": "object", "required": {key: type hoặc tuple types}}
+#   {"type": "array", "items": <schema>, "min_items": n}
+# Với array, phần tử sai schema bị loại bỏ; chỉ fail nếu còn ít hơn min_items.
+
+_QUESTION_SCHEMA = {
+    "type": "object",
+    "required": {"question": str, "options": list, "answer": str},
+}
+
+EXERCISE_SCHEMAS = {
+    "dictation": {
+        "type": "object",
+        "required": {"text": str, "translation": str},
+    },
+    "comprehension": {
+        "type": "object",
+        "required": {"text": str, "question": str, "options": list, "answer": str},
+    },
+    "reading_question": {
+        "type": "object",
+        "required": {"title": str, "english_content": str, "vietnamese_content": str, "quiz": list},
+    },
+    "grammar_question": {
+        "type": "array",
+        "items": _QUESTION_SCHEMA,
+        "min_items": 1,
+    },
+    "podcast_script": {
+        "type": "array",
+        "items": {"type": "object", "required": {"speaker": str, "text": str}},
+        "min_items": 1,
+    },
+    "translation_passage": {
+        "type": "object",
+        "required": {"english_text": str, "vietnamese_translation": str},
+    },
+    "translation_grading": {
+        "type": "object",
+        "required": {"score": (str, int, float), "overall_comment": str},
+    },
+    "essay_grading": {
+        "type": "object",
+        "required": {"score": (str, int, float), "comment": str},
+    },
+}
+
+
+def validate_schema(data, schema):
+    """
+    Validate data theo schema. Trả về data (array có thể đã lọc phần tử lỗi)
+    hoặc None nếu không hợp lệ.
+    """
+    if isinstance(schema, str):
+        schema = EXERCISE_SCHEMAS[schema]
+
+    if schema.get("type") == "array":
+        if not isinstance(data, list):
+            return None
+        item_schema = schema.get("items")
+        items = data
+        if item_schema:
+            items = [item for item in data if validate_schema(item, item_schema) is not None]
+            if len(items) < len(data):
+                logger.info(f"Dropped {len(data) - len(items)} invalid items from LLM array output")
+        if len(items) < schema.get("min_items", 0):
+            return None
+        return items
+
+    if not isinstance(data, dict):
+        return None
+    for key, expected_type in schema.get("required", {}).items():
+        value = data.get(key)
+        if value is None or not isinstance(value, expected_type):
+            return None
+        if isinstance(value, str) and not value.strip():
+            return None
+    return data
@@ -0,0 +1,156 @@
+"""
+LLM Telemetry
+Ghi nhận latency, token, chi phí, cache hit/miss, retry và fallback của từng
+request Gemini (theo feature_type và page), tổng hợp percentiles trên cửa sổ
+trượt các request gần nhất. Dữ liệu giữ trong memory của process (dùng chung
+mọi session) để admin xem trên dashboard và export CSV.
+"""
+import io
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Giá USD / 1M tokens (input, output) - dùng để ước tính chi phí
+MODEL_PRICING_PER_1M = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+MAX_EVENTS = 2000  # Số request gần nhất giữ lại cho percentiles
+
+
+def estimate_cost_usd(model_name, prompt_tokens, response_tokens):
+    """Chi phí ước tính (USD) theo bảng giá model; 0 nếu không rõ model/token."""
+    price_in, price_out = MODEL_PRICING_PER_1M.get(model_name, (0.0, 0.0))
+    return ((prompt_tokens or 0) * price_in + (response_tokens or 0) * price_out) / 1_000_000
+
+
+def extract_usage(response):
+    """Token counts từ usage_metadata của response (hoặc chunk cuối khi stream)."""
+    meta = getattr(response, 'usage_metadata', None)
+    if meta is None:
+        return {}
+    return {
+        'prompt_tokens': getattr(meta, 'prompt_token_count', None) or 0,
+        'response_tokens': getattr(meta, 'candidates_token_count', None) or 0,
+        'total_tokens': getattr(meta, 'total_token_count', None) or 0,
+    }
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class LLMTelemetry:
+    """Bộ đệm vòng các LLM request event + tổng hợp theo (feature_type, page)."""
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def record(self, feature_type='general', page=None, model=None, latency_ms=0.0,
+               prompt_chars=0, response_chars=0, prompt_tokens=0, response_tokens=0,
+               total_tokens=0, cache_hit=False, attempts=0, fallback=False, success=True,
+               streamed=False):
+        event = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'feature_type': feature_type,
+            'page': page or 'unknown',
+            'model': model or '',
+            'latency_ms': round(latency_ms, 1),
+            'prompt_chars': prompt_chars,
+            'response_chars': response_chars,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'total_tokens': total_tokens or (prompt_tokens + response_tokens),
+            'cost_usd': estimate_cost_usd(model, prompt_tokens, response_tokens),
+            'cache_hit': cache_hit,
+            'attempts': attempts,
+            'fallback': fallback,
+            'success': success,
+            'streamed': streamed,
+        }
+        with self._lock:
+            self._events.append(event)
+        return event
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def summary(self):
+        """
+        Tổng hợp theo (feature_type, page): số request, cache hit rate, latency
+        p50/p95/p99 (chỉ tính request gọi Gemini), token, chi phí, retry, fallback.
+        Sắp xếp theo tổng latency giảm dần (feature tốn thời gian nhất lên đầu).
+        """
+        groups = {}
+        for e in self.events():
+            groups.setdefault((e['feature_type'], e['page']), []).append(e)
+
+        rows = []
+        for (feature_type, page), events in groups.items():
+            live = [e for e in events if not e['cache_hit']]
+            latencies = sorted(e['latency_ms'] for e in live)
+            rows.append({
+                'feature_type': feature_type,
+                'page': page,
+                'requests': len(events),
+                'cache_hit_rate': round(sum(1 for e in events if e['cache_hit']) / len(events), 3),
+                'p50_ms': _percentile(latencies, 50),
+                'p95_ms': _percentile(latencies, 95),
+                'p99_ms': _percentile(latencies, 99),
+                'total_latency_s': round(sum(latencies) / 1000, 2),
+                'prompt_tokens': sum(e['prompt_tokens'] for e in events),
+                'response_tokens': sum(e['response_tokens'] for e in events),
+                'cost_usd': round(sum(e['cost_usd'] for e in events), 6),
+                'retries': sum(max(0, e['attempts'] - 1) for e in live),
+                'fallbacks': sum(1 for e in events if e['fallback']),
+                'errors': sum(1 for e in events if not e['success']),
+            })
+        rows.sort(key=lambda r: r['total_latency_s'], reverse=True)
+        return rows
+
+
+_telemetry = LLMTelemetry()
+
+
+def get_llm_telemetry():
+    """Instance telemetry dùng chung toàn process."""
+    return _telemetry
+
+
+def record_llm_call(**kwargs):
+    """Ghi nhận một LLM request (xem LLMTelemetry.record)."""
+    return _telemetry.record(**kwargs)
+
+
+def get_llm_telemetry_summary():
+    return _telemetry.summary()
+
+
+def export_llm_telemetry_csv(raw_events=False):
+    """
+    Export telemetry ra CSV (UTF-8 BOM cho Excel).
+
+    Args:
+        raw_events: True -> từng request; False -> bảng tổng hợp theo feature/page
+
+    Returns:
+        bytes: CSV file content
+    """
+    rows = _telemetry.events() if raw_events else _telemetry.summary()
+    if not rows:
+        return b""
+    csv_buffer = io.StringIO()
+    pd.DataFrame(rows).to_csv(csv_buffer, index=False)
+    return csv_buffer.getvalue().encode('utf-8-sig')
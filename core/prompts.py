@@ -0,0 +1,222 @@
+"""
+Prompt Template Registry
+Mỗi prompt được định danh bởi (template_id, version, params đã chuẩn hóa) thay vì
+chuỗi f-string thô, để:
+- Cùng template + params ở các page khác nhau dùng chung một AICache entry
+- Khác biệt về indent/khoảng trắng không làm miss cache
+- Có thể invalidate riêng một version của template (services.ai_cache_service.invalidate_template)
+
+Usage:
+    from core.prompts import render_prompt
+    prompt = render_prompt("reading_lesson", topic=topic, level=level)
+    res = generate_response_with_fallback(prompt, ["ERROR"])
+"""
+import json
+import re
+import textwrap
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_whitespace(text):
+    """Gộp mọi khoảng trắng liên tiếp (space, tab, newline) thành một space."""
+    return _WHITESPACE_RE.sub(" ", str(text)).strip()
+
+
+def normalize_params(params, case_insensitive=()):
+    """
+    Chuẩn hóa params để tạo cache key ổn định:
+    - str: bỏ khoảng trắng thừa (và lower-case nếu thuộc case_insensitive)
+    - dict/list: chuẩn hóa đệ quy
+    """
+    def _norm(key, value):
+        if isinstance(value, str):
+            value = normalize_whitespace(value)
+            return value.lower() if key in case_insensitive else value
+        if isinstance(value, dict):
+            return {k: _norm(k, v) for k, v in sorted(value.items())}
+        if isinstance(value, (list, tuple)):
+            return [_norm(key, v) for v in value]
+        return value
+
+    return {k: _norm(k, v) for k, v in sorted(params.items())}
+
+
+class PromptTemplate:
+    """Một prompt template có version; text dùng cú pháp str.format ({{ }} cho ngoặc JSON)."""
+
+    def __init__(self, template_id, version, text, feature_type='general', case_insensitive=()):
+        self.template_id = template_id
+        self.version = version
+        self.text = textwrap.dedent(text).strip()
+        self.feature_type = feature_type
+        self.case_insensitive = tuple(case_insensitive)
+
+    @property
+    def tag(self):
+        """Định danh template + version (vd: 'reading_lesson@v1')."""
+        return f"{self.template_id}@v{self.version}"
+
+    def render(self, **params):
+        normalized = normalize_params(params, self.case_insensitive)
+        return RenderedPrompt(self.text.format(**params), self, normalized)
+
+
+class RenderedPrompt(str):
+    """
+    Prompt đã render (vẫn là str nên truyền thẳng vào generate_response_with_fallback),
+    kèm thông tin template để ai_cache_service tạo cache key theo template.
+    """
+
+    def __new__(cls, text, template, params):
+        obj = super().__new__(cls, text)
+        obj.template = template
+        obj.params = params
+        return obj
+
+    @property
+    def template_tag(self):
+        return self.template.tag
+
+    def canonical_key(self):
+        """Chuỗi ổn định đại diện cho prompt: template@version + params (JSON sort_keys)."""
+        return f"{self.template.tag}:{json.dumps(self.params, sort_keys=True, ensure_ascii=False)}"
+
+
+_registry = {}
+
+
+def register_template(template_id, version, text, feature_type='general', case_insensitive=()):
+    """Đăng ký (hoặc thay thế) template; trả về PromptTemplate."""
+    template = PromptTemplate(template_id, version, text, feature_type, case_insensitive)
+    _registry[template_id] = template
+    return template
+
+
+def get_template(template_id):
+    """Lấy template đã đăng ký, raise KeyError nếu không có."""
+    return _registry[template_id]
+
+
+def list_templates():
+    """Danh sách template đã đăng ký (dùng cho admin)."""
+    return list(_registry.values())
+
+
+def render_prompt(template_id, **params):
+    """Render template đã đăng ký với params."""
+    return get_template(template_id).render(**params)
+
+
+# --- REGISTERED TEMPLATES ---
+# Tăng version khi đổi nội dung prompt: cache của version cũ sẽ không còn được dùng.
+
+register_template("writing_feedback", 1, """
+    Grade this writing (Level {level}) on '{topic}':
+    '{user_text}'
+    Output in Vietnamese: Score, Errors, Fixes.
+""", feature_type='writing', case_insensitive=('level',))
+
+register_template("vocab_mnemonics", 1, """
+    Mẹo nhớ từ '{word}' ({meaning}). Trả về JSON: {{'mnemonic': '...', 'story': '...'}}
+""", case_insensitive=('word',))
+
+register_template("translation_topic", 1, """
+    Translate this topic to English: '{topic}'. Return only the translated English topic.
+""", case_insensitive=('topic',))
+
+register_template("translation_passage", 1, """
+    Write a detailed English passage (about 200-250 words) about '{topic}' for CEFR Level {level}.
+    Return strictly JSON format: {{"english_text": "...", "vietnamese_translation": "..."}}
+""", case_insensitive=('topic', 'level'))
+
+register_template("translation_grading", 1, """
+    As an expert translator and examiner, evaluate a user's Vietnamese translation of an English text.
+
+    Original English Text:
+    '''{english_text}'''
+
+    Official Vietnamese Translation (for reference):
+    '''{reference_translation}'''
+
+    User's Vietnamese Translation:
+    '''{user_translation}'''
+
+    Task: Provide feedback in Vietnamese. Return strictly JSON format:
+    {{
+        "score": "X/10",
+        "overall_comment": "A general comment on the translation's accuracy, naturalness, and style.",
+        "strengths": "What the user did well (e.g., good word choice, correct structure).",
+        "areas_for_improvement": [
+            {{
+                "original_phrase": "The English phrase the user struggled with",
+                "user_translation": "The user's incorrect translation of that phrase",
+                "suggested_translation": "A better, more natural Vietnamese translation",
+                "explanation": "Why the suggestion is better (e.g., idiom, context, nuance)."
+            }}
+        ]
+    }}
+""")
+
+register_template("reading_lesson", 1, """
+    Act as an English teacher. Create a comprehensive reading lesson about '{topic}' (CEFR Level {level}).
+    Length: 200-250 words.
+
+    Return strictly JSON format:
+    {{
+        "title": "Title in English",
+        "english_content": "Full English text...",
+        "vietnamese_content": "Full Vietnamese translation...",
+        "summary": "A brief summary of the text (1-2 sentences) in English.",
+        "vocabulary": [
+            {{"word": "word1", "type": "noun/verb...", "meaning": "Vietnamese meaning", "context": "Example sentence from text"}}
+        ],
+        "grammar": [
+            {{"structure": "Name of structure", "explanation": "Brief explanation in Vietnamese", "example": "Example from text"}}
+        ],
+        "quiz": [
+            {{"question": "Question 1?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}},
+            {{"question": "Question 2?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}},
+            {{"question": "Question 3?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}}
+        ]
+    }}
+""", feature_type='reading', case_insensitive=('topic', 'level'))
+
+register_template("essay_grading", 1, """
+    Act as an English teacher. Grade this writing (Level {level}) on topic '{topic}'.
+    Content: '''{user_text}'''
+    Return JSON: {{
+        "score": "X/10",
+        "comment": "General feedback in Vietnamese",
+        "corrected": "Corrected version of the text",
+        "mistakes": [
+            {{"error": "wrong part", "fix": "correction", "explain": "why in Vietnamese"}}
+        ]
+    }}
+""", feature_type='writing', case_insensitive=('level',))
+
+register_template("grammar_questions", 1, """
+    Create {count} multiple-choice grammar questions for level {level} on "{topic}".
+    Format: JSON list. Keys: "question", "options" (list of 4), "answer", "explanation" (in Vietnamese).
+    Strictly JSON.
+""", feature_type='grammar', case_insensitive=('level', 'topic'))
+
+register_template("dictation_sentence", 1, """
+    Generate 1 English sentence for dictation practice.
+    Level: {level} (CEFR).
+    Topic: {topic}.
+    Length: Moderate (10-20 words).
+    Return strictly JSON format: {{"text": "English sentence", "translation": "Vietnamese meaning"}}
+""", feature_type='listening', case_insensitive=('level', 'topic'))
+
+register_template("listening_comprehension", 1, """
+    Create a short English listening passage (50-80 words) for Level {level} about {topic}.
+    Then create 1 multiple-choice question based on it.
+    Return strictly JSON format: {{
+        "text": "passage text",
+        "question": "question text",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "answer": "Correct Option Text",
+        "explanation": "Explanation in Vietnamese"
+    }}
+""", feature_type='listening', case_insensitive=('level', 'topic'))
@@ -1,17 +1,99 @@
 """
 Rate Limiter Module
-Wrapper cho rate limiting functions từ database
+Rate limiting (token bucket local, đồng bộ định kỳ với database) và wrapper cho các RPC
+login limit / audit log
 """
 import streamlit as st
 from core.database import supabase
 import logging
+import threading
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 import time
 
 logger = logging.getLogger(__name__)
 
+RATE_LIMIT_SYNC_SECONDS = 15  # Mỗi (user, endpoint) sync số request lên DB tối đa 1 lần / khoảng này
+SYNC_RPC_RETRY_SECONDS = 300  # RPC sync_rate_limit lỗi -> dùng check_rate_limit, thử lại RPC sau khoảng này
+_BUCKET_PRUNE_INTERVAL_SECONDS = 60
+
+_sync_rpc_retry_at = 0.0  # monotonic; trước thời điểm này không gọi sync_rate_limit
+_last_bucket_prune = 0.0
+
+
+class _TokenBucket:
+    """Token bucket cho 1 (user, endpoint): tối đa max_requests token, hồi đầy sau 1 window."""
+    
+    def __init__(self, max_requests, window_seconds, now):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.tokens = float(max_requests)
+        self.updated_at = now
+        self.last_used_at = now
+        self.pending = 0          # Request đã cho phép nhưng chưa báo lên DB
+        self.synced_at = None     # None = chưa sync lần nào trong process này
+    
+    def refill(self, now):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(float(self.max_requests), self.tokens + elapsed * self.max_requests / self.window_seconds)
+        self.updated_at = now
+    
+    def try_acquire(self, now):
+        self.last_used_at = now
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def seconds_until_token(self):
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.window_seconds / self.max_requests
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _sync_rpc_usable(now):
+    """False khi sync_rate_limit vừa lỗi (đang trong SYNC_RPC_RETRY_SECONDS)"""
+    return now >= _sync_rpc_retry_at
+
+
+def _prune_buckets(now):
+    """Bỏ bucket đã đầy lại và không dùng cả 1 window (không còn gì để báo lên DB). Gọi khi đang giữ _buckets_lock."""
+    global _last_bucket_prune
+    if now - _last_bucket_prune < _BUCKET_PRUNE_INTERVAL_SECONDS:
+        return
+    _last_bucket_prune = now
+    for key, bucket in list(_buckets.items()):
+        if bucket.pending == 0 and now - bucket.last_used_at >= bucket.window_seconds:
+            del _buckets[key]
+
+
+def _get_ip_address():
+    """IP của session hiện tại (nếu Streamlit có), mặc định '0.0.0.0'"""
+    try:
+        # Streamlit context có thể có IP
+        if hasattr(st, 'session_state') and hasattr(st.session_state, 'ip_address'):
+            return st.session_state.ip_address
+    except:
+        pass
+    return '0.0.0.0'
+
+
 class RateLimiter:
-    """Rate limiter sử dụng Supabase RPC functions"""
+    """
+    Rate limiter token bucket trong bộ nhớ, đồng bộ định kỳ với Supabase RPC.
+    
+    Quyết định allow/deny không cần database; mỗi (user, endpoint) gửi số request đã dùng
+    lên DB mỗi RATE_LIMIT_SYNC_SECONDS và lấy lại 'remaining' của DB (gồm cả request từ
+    process khác) để thu hẹp bucket local.
+    
+    DB chưa có RPC sync_rate_limit thì mỗi request được phép báo ngay bằng check_rate_limit
+    (ghi nhận 1 request / lần gọi) để số đếm trên DB vẫn đúng giữa các process.
+    """
     
     @staticmethod
     def check_limit(user_id, endpoint, max_requests=60, window_minutes=1):
@@ -36,37 +118,93 @@ class RateLimiter:
             return {'allowed': True, 'remaining': max_requests, 'message': 'Rate limiter disabled'}
         
         try:
-            # Get IP address từ Streamlit (nếu có)
-            ip_address = '0.0.0.0'  # Default
-            try:
-                # Streamlit context có thể có IP
-                if hasattr(st, 'session_state') and hasattr(st.session_state, 'ip_address'):
-                    ip_address = st.session_state.ip_address
-            except:
-                pass
+            now = time.monotonic()
+            key = (int(user_id), endpoint)
+            with _buckets_lock:
+                _prune_buckets(now)
+                bucket = _buckets.get(key)
+                if bucket is None or bucket.max_requests != max_requests or bucket.window_seconds != window_minutes * 60:
+                    bucket = _buckets[key] = _TokenBucket(max_requests, window_minutes * 60, now)
+                allowed = bucket.try_acquire(now)
+                if allowed:
+                    bucket.pending += 1
+                sync_due = bucket.synced_at is None or now - bucket.synced_at >= RATE_LIMIT_SYNC_SECONDS
+                if not _sync_rpc_usable(now):
+                    sync_due = bucket.pending > 0
+                if sync_due:
+                    pending = bucket.pending
+                    bucket.pending = 0
+                    bucket.synced_at = now
             
-            result = supabase.rpc('check_rate_limit', {
-                'p_user_id': int(user_id),
-                'p_ip_address': ip_address,
-                'p_endpoint': endpoint,
-                'p_max_requests': max_requests,
-                'p_window_minutes': window_minutes
-            }).execute()
+            if sync_due:
+                db_state = RateLimiter._sync_with_database(user_id, endpoint, pending, max_requests, window_minutes)
+                with _buckets_lock:
+                    if db_state is None:
+                        bucket.pending += pending  # Báo lại ở lần sync sau
+                    else:
+                        db_remaining = db_state.get('remaining')
+                        if db_remaining is not None:
+                            bucket.tokens = min(bucket.tokens, float(db_remaining))
+                        if db_state.get('allowed') is False:
+                            bucket.tokens = min(bucket.tokens, 0.0)
+                            allowed = False
             
-            if result.data and len(result.data) > 0:
-                data = result.data[0]
+            with _buckets_lock:
+                remaining = max(0, int(bucket.tokens))
+                wait_seconds = bucket.seconds_until_token()
+            reset_at = (datetime.now(timezone.utc) + timedelta(seconds=wait_seconds)).isoformat()
+            if not allowed:
                 return {
-                    'allowed': data.get('allowed', True),
-                    'remaining': data.get('remaining', max_requests),
-                    'reset_at': data.get('reset_at'),
-                    'message': data.get('message', '')
+                    'allowed': False,
+                    'remaining': 0,
+                    'reset_at': reset_at,
+                    'message': f"Quá nhiều requests. Vui lòng thử lại sau {max(1, int(wait_seconds + 0.999))} giây."
                 }
+            return {'allowed': True, 'remaining': remaining, 'reset_at': reset_at, 'message': ''}
         except Exception as e:
             logger.error(f"Rate limit check error: {e}")
             # Fail open - cho phép request nếu có lỗi
             return {'allowed': True, 'remaining': max_requests, 'message': 'Error checking rate limit'}
+    
+    @staticmethod
+    def _sync_with_database(user_id, endpoint, request_count, max_requests, window_minutes):
+        """
+        Báo request_count request lên DB và lấy trạng thái chung (mọi process).
+        Ưu tiên RPC sync_rate_limit (ghi nhận nhiều request 1 lần); RPC lỗi thì gọi
+        check_rate_limit 1 lần cho mỗi request (tối đa max_requests) và thử lại RPC sau
+        SYNC_RPC_RETRY_SECONDS.
         
-        return {'allowed': True, 'remaining': max_requests}
+        Returns:
+            dict {'allowed', 'remaining', ...} từ DB, hoặc None nếu lỗi (giữ quyết định local)
+        """
+        global _sync_rpc_retry_at
+        params = {
+            'p_user_id': int(user_id),
+            'p_ip_address': _get_ip_address(),
+            'p_endpoint': endpoint,
+            'p_max_requests': max_requests,
+            'p_window_minutes': window_minutes
+        }
+        try:
+            if _sync_rpc_usable(time.monotonic()):
+                try:
+                    result = supabase.rpc('sync_rate_limit', {**params, 'p_request_count': request_count}).execute()
+                    return result.data[0] if result.data else {}
+                except Exception as rpc_error:
+                    _sync_rpc_retry_at = time.monotonic() + SYNC_RPC_RETRY_SECONDS
+                    logger.info(f"sync_rate_limit RPC unavailable, using check_rate_limit for {SYNC_RPC_RETRY_SECONDS}s: {rpc_error}")
+            
+            # check_rate_limit ghi nhận 1 request mỗi lần gọi
+            state = {}
+            for _ in range(min(request_count, max_requests)):
+                result = supabase.rpc('check_rate_limit', params).execute()
+                state = result.data[0] if result.data else {}
+                if state.get('allowed') is False:
+                    break
+            return state
+        except Exception as e:
+            logger.error(f"Rate limit sync error: {e}")
+            return None
     
     @staticmethod
     def require_limit(endpoint, max_requests=60, window_minutes=1):
@@ -107,8 +245,30 @@ class RateLimiter:
         return decorator
 
 
+_login_failures = {}        # username (lower) -> [monotonic ts của các lần sai]
+_login_blocked_until = {}   # username (lower) -> (monotonic ts hết khoá, kết quả check đã cache)
+_login_lock = threading.Lock()
+_LOGIN_CACHE_MAX_KEYS = 10000
+_LOGIN_FAILURE_TTL_SECONDS = 3600
+
+
 class LoginLimiter:
-    """Login attempt limiter để prevent brute force"""
+    """
+    Login attempt limiter để prevent brute force.
+    
+    Kết quả "bị khoá" được cache trong process tới hết thời gian khoá, và các lần sai gần đây
+    được đếm local, nên các lần thử sai lặp lại được trả lời mà không cần gọi database.
+    """
+    
+    @staticmethod
+    def _blocked_result(blocked_until_ts):
+        wait_minutes = max(1, int((blocked_until_ts - time.monotonic()) / 60 + 0.999))
+        return {
+            'allowed': False,
+            'attempts_remaining': 0,
+            'blocked_until': (datetime.now(timezone.utc) + timedelta(seconds=blocked_until_ts - time.monotonic())).isoformat(),
+            'message': f"Quá nhiều lần đăng nhập sai. Vui lòng thử lại sau {wait_minutes} phút."
+        }
     
     @staticmethod
     def check_attempts(username, max_attempts=5, lockout_minutes=15):
@@ -126,6 +286,24 @@ class LoginLimiter:
         if not supabase:
             return {'allowed': True, 'attempts_remaining': max_attempts}
         
+        key = (username or '').strip().lower()
+        now = time.monotonic()
+        lockout_seconds = lockout_minutes * 60
+        with _login_lock:
+            cached = _login_blocked_until.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+            _login_blocked_until.pop(key, None)
+            failures = [ts for ts in _login_failures.get(key, []) if now - ts < lockout_seconds]
+            if failures:
+                _login_failures[key] = failures
+            else:
+                _login_failures.pop(key, None)
+            if len(failures) >= max_attempts:
+                result = LoginLimiter._blocked_result(failures[-1] + lockout_seconds)
+                _login_blocked_until[key] = (failures[-1] + lockout_seconds, result)
+                return result
+        
         try:
             ip_address = '0.0.0.0'
             
@@ -137,7 +315,12 @@ class LoginLimiter:
             }).execute()
             
             if result.data and len(result.data) > 0:
-                return result.data[0]
+                data = result.data[0]
+                if data.get('allowed') is False:
+                    # Bị khoá (có thể do process khác) -> cache tới hết thời gian khoá
+                    with _login_lock:
+                        _login_blocked_until[key] = (now + lockout_seconds, data)
+                return data
         except Exception as e:
             logger.error(f"Login check error: {e}")
         
@@ -146,6 +329,21 @@ class LoginLimiter:
     @staticmethod
     def log_attempt(username, success, user_agent=None):
         """Log login attempt"""
+        key = (username or '').strip().lower()
+        with _login_lock:
+            if success:
+                _login_failures.pop(key, None)
+                _login_blocked_until.pop(key, None)
+            else:
+                now = time.monotonic()
+                _login_failures.setdefault(key, []).append(now)
+                if len(_login_failures) > _LOGIN_CACHE_MAX_KEYS:
+                    # Dò nhiều username khác nhau -> bỏ các entry đã cũ để không tăng bộ nhớ mãi
+                    for k in [k for k, ts in _login_failures.items() if not ts or now - ts[-1] > _LOGIN_FAILURE_TTL_SECONDS]:
+                        del _login_failures[k]
+                    for k in [k for k, (until, _) in _login_blocked_until.items() if until <= now]:
+                        del _login_blocked_until[k]
+        
         if not supabase:
             return
         
@@ -7,11 +7,64 @@ from core.database import supabase
 from datetime import datetime, timedelta, timezone
 import logging
 from typing import Dict, List, Optional, Tuple
+import threading
 import time
 from core.timezone_utils import get_vn_now_utc
+from services.activity_log_writer import enqueue_activity_log, count_pending_activity_logs
 
 logger = logging.getLogger(__name__)
 
+
+class SlidingWindowCounter:
+    """
+    Đếm số sự kiện trong window_seconds gần nhất bằng ring buffer các bucket thời gian.
+    Window được chia thành tối đa BUCKETS bucket (60s -> bucket 1s, 600s -> bucket 10s)
+    để bộ nhớ mỗi counter không phụ thuộc độ dài window.
+    """
+    BUCKETS = 60
+    
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = max(1, window_seconds // self.BUCKETS)
+        self.size = -(-window_seconds // self.bucket_seconds)
+        self.counts = [0] * self.size
+        self.buckets = [-1] * self.size  # Bucket (theo thời gian) mà mỗi slot đang giữ
+        self.last_event = 0.0
+    
+    def add(self, now: float, n: int = 1) -> None:
+        bucket = int(now // self.bucket_seconds)
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+        self.counts[slot] += n
+        self.last_event = max(self.last_event, now)
+    
+    def count(self, now: float) -> int:
+        current = int(now // self.bucket_seconds)
+        return sum(c for c, b in zip(self.counts, self.buckets) if b >= 0 and current - b < self.size)
+
+
+# Counter theo (user_id, tên counter), dùng chung cho mọi session trong process
+_counters: Dict[Tuple[int, str], SlidingWindowCounter] = {}
+_rehydrated: set = set()        # Key đã được nạp lại từ DB trong process này
+_last_db_check: Dict[Tuple[int, str], float] = {}
+_counters_lock = threading.Lock()
+_PRUNE_INTERVAL_SECONDS = 300
+_last_prune = 0.0
+
+
+def _prune_counters(now: float) -> None:
+    """Bỏ counter đã hết window (user không còn hoạt động). Gọi khi đang giữ _counters_lock."""
+    global _last_prune
+    if now - _last_prune < _PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    for key, counter in list(_counters.items()):
+        if now - counter.last_event > counter.window_seconds:
+            del _counters[key]
+            _last_db_check.pop(key, None)
+
 class SecurityMonitor:
     """Monitor và chặn các hành vi phá hoại"""
     
@@ -27,6 +80,11 @@ class SecurityMonitor:
     # Số lần flag trước khi auto-disable
     AUTO_DISABLE_THRESHOLD = 3  # Sau 3 lần flag trong 24h sẽ auto-disable
     
+    # Counter trong bộ nhớ: chỉ query ActivityLog khi số đếm local > 80% threshold,
+    # và không quá 1 lần mỗi DB_RECHECK_SECONDS cho mỗi (user, counter)
+    NEAR_THRESHOLD_RATIO = 0.8
+    DB_RECHECK_SECONDS = 5
+    
     @staticmethod
     def log_user_action(user_id: int, action_type: str, success: bool = True, metadata: Dict = None):
         """
@@ -42,75 +100,116 @@ class SecurityMonitor:
             return
         
         try:
-            # Log vào ActivityLog
-            supabase.table("ActivityLog").insert({
+            # Log vào ActivityLog (ghi nền theo lô, không chờ database)
+            enqueue_activity_log({
                 "user_id": user_id,
                 "action_type": action_type,
                 "value": 1 if success else 0,
                 "metadata": metadata or {}
-            }).execute()
+            })
             
             # Kiểm tra patterns nghi ngờ
             SecurityMonitor._check_suspicious_patterns(user_id, action_type, success)
         except Exception as e:
             logger.error(f"Error logging user action: {e}")
     
+    @staticmethod
+    def _db_count(user_id: int, window_seconds: int, now: datetime,
+                  action_type: Optional[str] = None, failed_only: bool = False) -> Optional[int]:
+        """Đếm chính xác trong ActivityLog (chỉ dùng khi rehydrate hoặc gần ngưỡng)"""
+        try:
+            query = supabase.table("ActivityLog")\
+                .select("id", count="exact")\
+                .eq("user_id", user_id)
+            if failed_only:
+                query = query.eq("value", 0)
+            if action_type:
+                query = query.eq("action_type", action_type)
+            result = query.gte("created_at", (now - timedelta(seconds=window_seconds)).isoformat()).execute()
+            return result.count or 0
+        except Exception as e:
+            logger.debug(f"Could not count ActivityLog for user {user_id}: {e}")
+            return None
+    
+    @staticmethod
+    def _record_and_count(user_id: int, pattern_type: str, counter_name: str, now_ts: float,
+                          action_type: Optional[str] = None, failed_only: bool = False) -> Optional[int]:
+        """
+        Cộng action hiện tại vào counter trong bộ nhớ và trả về số đếm để so với threshold.
+        
+        DB chỉ được query khi counter mới tạo trong process này (rehydrate sau restart) hoặc khi
+        số đếm local vượt NEAR_THRESHOLD_RATIO * threshold; khi đó kết quả DB là số quyết định.
+        
+        Returns:
+            Số đếm trong window, hoặc None nếu chưa gần ngưỡng / vừa check DB (không cần cảnh báo)
+        """
+        pattern = SecurityMonitor.SUSPICIOUS_PATTERNS[pattern_type]
+        key = (user_id, counter_name)
+        now = datetime.fromtimestamp(now_ts, tz=timezone.utc)
+        
+        with _counters_lock:
+            _prune_counters(now_ts)
+            counter = _counters.get(key)
+            if counter is None:
+                counter = _counters[key] = SlidingWindowCounter(pattern['window_seconds'])
+            counter.add(now_ts)
+            needs_rehydrate = key not in _rehydrated
+            _rehydrated.add(key)
+            local_count = counter.count(now_ts)
+            near_threshold = local_count > pattern['threshold'] * SecurityMonitor.NEAR_THRESHOLD_RATIO
+            recently_checked = now_ts - _last_db_check.get(key, 0.0) < SecurityMonitor.DB_RECHECK_SECONDS
+            if not needs_rehydrate and (not near_threshold or recently_checked):
+                return None
+            _last_db_check[key] = now_ts
+        
+        db_count = SecurityMonitor._db_count(user_id, pattern['window_seconds'], now, action_type, failed_only)
+        if db_count is None:
+            return None
+        # Row còn trong hàng đợi ActivityLog writer (gồm action hiện tại) chưa có trong DB
+        total = db_count + count_pending_activity_logs(user_id, action_type, failed_only)
+        if needs_rehydrate and total > 1:
+            # Action hiện tại đã được đếm local; phần còn lại dồn vào bucket hiện tại
+            with _counters_lock:
+                counter.add(now_ts, total - 1)
+        return total
+    
     @staticmethod
     def _check_suspicious_patterns(user_id: int, action_type: str, success: bool):
-        """Kiểm tra các patterns nghi ngờ"""
+        """Kiểm tra các patterns nghi ngờ (sliding-window counters trong bộ nhớ, DB khi gần ngưỡng)"""
         try:
-            # Use VN timezone for timestamp calculations (convert to UTC for database)
-            now_utc_str = get_vn_now_utc()
-            from datetime import datetime, timezone
-            now = datetime.fromisoformat(now_utc_str.replace('Z', '+00:00'))
+            now_ts = time.time()
             
             # 1. Check rapid actions
-            window = timedelta(seconds=60)
-            recent_actions = supabase.table("ActivityLog")\
-                .select("id", count="exact")\
-                .eq("user_id", user_id)\
-                .gte("created_at", (now - window).isoformat())\
-                .execute()
-            
-            if recent_actions.count and recent_actions.count > SecurityMonitor.SUSPICIOUS_PATTERNS['rapid_actions']['threshold']:
+            actions_count = SecurityMonitor._record_and_count(user_id, 'rapid_actions', 'actions', now_ts)
+            if actions_count and actions_count > SecurityMonitor.SUSPICIOUS_PATTERNS['rapid_actions']['threshold']:
                 SecurityMonitor._handle_suspicious_activity(
                     user_id, 
                     'rapid_actions',
-                    f"User thực hiện {recent_actions.count} actions trong 60s"
+                    f"User thực hiện {actions_count} actions trong 60s"
                 )
             
             # 2. Check failed requests
             if not success:
-                window = timedelta(seconds=300)
-                failed_count = supabase.table("ActivityLog")\
-                    .select("id", count="exact")\
-                    .eq("user_id", user_id)\
-                    .eq("value", 0)\
-                    .gte("created_at", (now - window).isoformat())\
-                    .execute()
-                
-                if failed_count.count and failed_count.count > SecurityMonitor.SUSPICIOUS_PATTERNS['failed_requests']['threshold']:
+                failed_count = SecurityMonitor._record_and_count(
+                    user_id, 'failed_requests', 'failed', now_ts, failed_only=True
+                )
+                if failed_count and failed_count > SecurityMonitor.SUSPICIOUS_PATTERNS['failed_requests']['threshold']:
                     SecurityMonitor._handle_suspicious_activity(
                         user_id,
                         'failed_requests',
-                        f"User có {failed_count.count} failed requests trong 5 phút"
+                        f"User có {failed_count} failed requests trong 5 phút"
                     )
             
             # 3. Check excessive AI calls
             if action_type in ['ai_call', 'ai_generation']:
-                window = timedelta(seconds=600)
-                ai_calls = supabase.table("ActivityLog")\
-                    .select("id", count="exact")\
-                    .eq("user_id", user_id)\
-                    .eq("action_type", action_type)\
-                    .gte("created_at", (now - window).isoformat())\
-                    .execute()
-                
-                if ai_calls.count and ai_calls.count > SecurityMonitor.SUSPICIOUS_PATTERNS['excessive_ai_calls']['threshold']:
+                ai_calls = SecurityMonitor._record_and_count(
+                    user_id, 'excessive_ai_calls', f"action:{action_type}", now_ts, action_type=action_type
+                )
+                if ai_calls and ai_calls > SecurityMonitor.SUSPICIOUS_PATTERNS['excessive_ai_calls']['threshold']:
                     SecurityMonitor._handle_suspicious_activity(
                         user_id,
                         'excessive_ai_calls',
-                        f"User có {ai_calls.count} AI calls trong 10 phút",
+                        f"User có {ai_calls} AI calls trong 10 phút",
                         block=True,
                         auto_disable=True  # Tự động disable cho excessive AI calls
                     )
@@ -3,113 +3,160 @@ import asyncio
 import streamlit as st
 import re
 import io
+import hashlib
+import logging
+import threading
+import concurrent.futures
 
-async def text_to_speech(text, voice="en-US-AriaNeural", max_retries=3, use_cache=True):
+logger = logging.getLogger(__name__)
+
+MAX_CHUNK_LENGTH = 4000  # Edge TTS giới hạn ~5000 ký tự mỗi request, để 4000 cho an toàn
+CHUNK_CONCURRENCY = 4    # Số chunk tổng hợp song song cho text dài (tránh bị Edge TTS rate limit)
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+def _split_text_chunks(text, max_length=MAX_CHUNK_LENGTH):
+    """Chia text thành các đoạn <= max_length tại dấu câu."""
+    sentences = re.split(r'([.!?]\s+)', text)
+    chunks = []
+    current_chunk = ""
+    
+    for i in range(0, len(sentences), 2):
+        sentence = sentences[i] + (sentences[i+1] if i+1 < len(sentences) else "")
+        if len(current_chunk) + len(sentence) <= max_length:
+            current_chunk += sentence
+        else:
+            if current_chunk:
+                chunks.append(current_chunk)
+            current_chunk = sentence
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+def _split_sentences(text):
+    """Tách text thành các câu (câu quá MAX_CHUNK_LENGTH được chia tiếp)."""
+    sentences = [s for s in _SENTENCE_END_RE.split(text) if s.strip()]
+    return [chunk for sentence in sentences
+            for chunk in (_split_text_chunks(sentence) if len(sentence) > MAX_CHUNK_LENGTH else [sentence])]
+
+async def _try_communicate(text_chunk, voice_name, max_retries=3, retry_count=0):
+    """Gọi Edge TTS cho 1 đoạn text, retry với backoff khi lỗi tạm thời hoặc audio rỗng."""
+    try:
+        communicate = edge_tts.Communicate(text_chunk, voice_name)
+        audio_data = b""
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_data += chunk["data"]
+        if audio_data and len(audio_data) > 0:
+            return audio_data
+        else:
+            # Empty audio - retry if possible
+            if retry_count < max_retries:
+                await asyncio.sleep(0.5 * (retry_count + 1))  # Exponential backoff
+                return await _try_communicate(text_chunk, voice_name, max_retries, retry_count + 1)
+            return None
+    except Exception as e:
+        error_msg = str(e)
+        # Retry on specific errors
+        if retry_count < max_retries and ("No audio" in error_msg or "timeout" in error_msg.lower() or "rate" in error_msg.lower()):
+            await asyncio.sleep(1.0 * (retry_count + 1))  # Exponential backoff
+            return await _try_communicate(text_chunk, voice_name, max_retries, retry_count + 1)
+        print(f"TTS Error: {e}")
+        return None
+
+async def _get_cached_audio_async(text, voice):
+    """Tra DB cache trong thread riêng để nhiều lookup chạy song song, không chặn event loop."""
+    try:
+        from services.tts_cache_service import get_cached_audio
+        cached_result = await asyncio.to_thread(get_cached_audio, text, voice)
+        if cached_result:
+            audio_bytes, file_url = cached_result
+            return audio_bytes or None
+    except Exception:
+        # If cache check fails, continue to generate new audio
+        pass
+    return None
+
+async def _cache_audio_async(text, voice, audio_bytes):
+    """Lưu cache trong thread riêng; lỗi cache không ảnh hưởng kết quả."""
+    try:
+        from services.tts_cache_service import cache_audio
+        # cache_audio tự encode bản compact và đọc độ dài thật của audio
+        await asyncio.to_thread(cache_audio, text, voice, audio_bytes)
+    except Exception:
+        # Cache save failure is non-critical, just log and continue
+        pass
+
+async def _synthesize_chunk(text_chunk, voice, semaphore, max_retries, use_cache):
+    """Audio của 1 chunk: cache riêng theo chunk để lỗi một phần không phải tạo lại cả bài."""
+    if use_cache:
+        cached = await _get_cached_audio_async(text_chunk, voice)
+        if cached:
+            return cached
+    async with semaphore:
+        audio = await _try_communicate(text_chunk, voice, max_retries)
+    if audio and use_cache:
+        await _cache_audio_async(text_chunk, voice, audio)
+    return audio
+
+async def text_to_speech(text, voice="en-US-AriaNeural", max_retries=3, use_cache=True, sentence_cache=False):
     """
     Chuyển đổi văn bản thành âm thanh sử dụng Edge TTS.
     Voice mặc định: en-US-AriaNeural (Giọng nữ Mỹ tự nhiên).
     Các giọng khác: en-GB-SoniaNeural (Anh), en-US-GuyNeural (Nam Mỹ).
     
-    Edge TTS có giới hạn ~5000 ký tự mỗi request. Nếu text quá dài, sẽ tự động chia nhỏ.
+    Edge TTS có giới hạn ~5000 ký tự mỗi request. Nếu text quá dài, sẽ tự động chia nhỏ
+    và tổng hợp song song tối đa CHUNK_CONCURRENCY chunk, ghép lại theo đúng thứ tự.
     
     Args:
         text: Text to convert to speech
         voice: Voice name (default: en-US-AriaNeural)
         max_retries: Maximum retry attempts
         use_cache: Whether to use DB cache (default: True)
+        sentence_cache: Tạo + cache từng câu rồi ghép lại (câu lặp lại giữa các bài dùng lại audio)
     """
-    if not text or not text.strip():
+    from services.tts_cache_service import normalize_tts_text
+    text = normalize_tts_text(text)
+    if not text:
         return None
     
     # Check cache first (if enabled)
     if use_cache:
-        try:
-            from services.tts_cache_service import get_cached_audio
-            cached_result = get_cached_audio(text, voice)
-            if cached_result:
-                audio_bytes, file_url = cached_result
-                if audio_bytes:
-                    return audio_bytes
-        except Exception as e:
-            # If cache check fails, continue to generate new audio
-            pass
-    
-    async def _try_communicate(text_chunk, voice_name, retry_count=0):
-        """Try to get audio with retry logic"""
-        import asyncio
-        try:
-            communicate = edge_tts.Communicate(text_chunk, voice_name)
-            audio_data = b""
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
-            if audio_data and len(audio_data) > 0:
-                return audio_data
-            else:
-                # Empty audio - retry if possible
-                if retry_count < max_retries:
-                    await asyncio.sleep(0.5 * (retry_count + 1))  # Exponential backoff
-                    return await _try_communicate(text_chunk, voice_name, retry_count + 1)
-                return None
-        except Exception as e:
-            error_msg = str(e)
-            # Retry on specific errors
-            if retry_count < max_retries and ("No audio" in error_msg or "timeout" in error_msg.lower() or "rate" in error_msg.lower()):
-                await asyncio.sleep(1.0 * (retry_count + 1))  # Exponential backoff
-                return await _try_communicate(text_chunk, voice_name, retry_count + 1)
-            print(f"TTS Error: {e}")
-            return None
+        cached = await _get_cached_audio_async(text, voice)
+        if cached:
+            return cached
     
     try:
-        # Edge TTS có giới hạn ~5000 ký tự, chia nhỏ nếu cần
-        max_length = 4000  # An toàn hơn để tránh lỗi
-        if len(text) > max_length:
-            # Chia text thành các đoạn nhỏ hơn tại dấu câu
-            import re
-            sentences = re.split(r'([.!?]\s+)', text)
-            chunks = []
-            current_chunk = ""
-            
-            for i in range(0, len(sentences), 2):
-                sentence = sentences[i] + (sentences[i+1] if i+1 < len(sentences) else "")
-                if len(current_chunk) + len(sentence) <= max_length:
-                    current_chunk += sentence
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = sentence
-            if current_chunk:
-                chunks.append(current_chunk)
-            
-            # Tạo audio cho từng chunk và ghép lại
-            audio_data = b""
-            for chunk_text in chunks:
-                chunk_audio = await _try_communicate(chunk_text, voice)
-                if chunk_audio:
-                    audio_data += chunk_audio
-                # Add small delay between chunks to avoid rate limiting
-                await asyncio.sleep(0.1)
-            final_audio = audio_data if audio_data else None
+        sentences = _split_sentences(text) if sentence_cache else []
+        if len(sentences) > 1 or len(text) > MAX_CHUNK_LENGTH:
+            chunks = sentences if len(sentences) > 1 else _split_text_chunks(text)
+            semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+            chunk_audios = await asyncio.gather(*[
+                _synthesize_chunk(chunk_text, voice, semaphore, max_retries, use_cache)
+                for chunk_text in chunks
+            ])
+            # gather giữ đúng thứ tự chunk
+            final_audio = b"".join(audio for audio in chunk_audios if audio) or None
+            complete = all(chunk_audios)
         else:
             # Text ngắn, xử lý bình thường với retry
-            final_audio = await _try_communicate(text, voice)
+            final_audio = await _try_communicate(text, voice, max_retries)
+            complete = True
         
         # Save to cache if audio was generated and caching is enabled
-        if final_audio and use_cache:
-            try:
-                from services.tts_cache_service import cache_audio
-                # Calculate audio length (approximate, assuming ~16KB/s for MP3)
-                audio_length_seconds = len(final_audio) // 16000 if len(final_audio) > 0 else None
-                cache_audio(text, voice, final_audio, audio_length_seconds)
-            except Exception as e:
-                # Cache save failure is non-critical, just log and continue
-                pass
+        # (không cache bản ghép thiếu chunk - lần sau chỉ phải tạo lại chunk lỗi)
+        if final_audio and use_cache and complete:
+            await _cache_audio_async(text, voice, final_audio)
         
         return final_audio
     except Exception as e:
         print(f"TTS Error: {e}")
         return None
 
+def _dialogue_cache_key(script, voice1, voice2):
+    """Cache key cho audio đã ghép của cả dialogue: hash toàn bộ script."""
+    script_hash = hashlib.sha256(script.encode('utf-8')).hexdigest()
+    return f"dialogue_{script_hash}_{voice1}_{voice2}"
+
 async def text_to_speech_dialogue(script, voice1="en-US-GuyNeural", voice2="en-US-AriaNeural", use_cache=True):
     """
     Tạo audio cho dialogue/conversation với 2 giọng khác nhau.
@@ -132,18 +179,12 @@ async def text_to_speech_dialogue(script, voice1="en-US-GuyNeural", voice2="en-U
     if not script or not script.strip():
         return None
     
-    # Check cache first
-    cache_key = f"dialogue_{script[:100]}_{voice1}_{voice2}"
+    # Check cache first (key = hash toàn bộ script + 2 giọng, tránh trùng khi 2 script cùng đoạn mở đầu)
+    cache_key = _dialogue_cache_key(script, voice1, voice2)
     if use_cache:
-        try:
-            from services.tts_cache_service import get_cached_audio
-            cached_result = get_cached_audio(cache_key, voice1)  # Use voice1 as cache key
-            if cached_result:
-                audio_bytes, file_url = cached_result
-                if audio_bytes:
-                    return audio_bytes
-        except Exception as e:
-            pass
+        cached = await _get_cached_audio_async(cache_key, voice1)  # Use voice1 as cache key
+        if cached:
+            return cached
     
     # Parse script to extract dialogue parts
     # Try multiple patterns to match different formats
@@ -261,62 +302,136 @@ async def text_to_speech_dialogue(script, voice1="en-US-GuyNeural", voice2="en-U
         if text:
             dialogue_parts.append((text, voice1))
     
-    # Generate audio for each part
-    audio_parts = []
-    for text, voice in dialogue_parts:
-        audio = await text_to_speech(text, voice, use_cache=False)  # Don't cache individual parts
-        if audio:
-            audio_parts.append(audio)
-            # Small pause between speakers (add silence - 0.3 seconds of silence)
-            # Edge TTS audio is MP3, we can't easily add silence without pydub
-            # So we'll just concatenate directly - the natural pause in speech should be enough
-            await asyncio.sleep(0.1)  # Small delay to avoid rate limiting
+    # Generate audio for each part: song song (giới hạn CHUNK_CONCURRENCY), mỗi câu cache riêng
+    # theo (text, voice) nên sửa 1 câu thì các câu còn lại vẫn lấy từ cache
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    
+    async def _line_audio(text, voice):
+        async with semaphore:
+            return await text_to_speech(text, voice, use_cache=use_cache)
+    
+    line_audios = await asyncio.gather(*[_line_audio(text, voice) for text, voice in dialogue_parts])
+    # Edge TTS audio is MP3, we can't easily add silence without pydub
+    # So we'll just concatenate directly - the natural pause in speech should be enough
+    audio_parts = [audio for audio in line_audios if audio]
     
     # Concatenate all audio parts
     if audio_parts:
         final_audio = b"".join(audio_parts)
         
-        # Cache the result
-        if use_cache and final_audio:
-            try:
-                from services.tts_cache_service import cache_audio
-                audio_length_seconds = len(final_audio) // 16000 if len(final_audio) > 0 else None
-                cache_audio(cache_key, voice1, final_audio, audio_length_seconds)
-            except Exception as e:
-                pass
+        # Cache the result (chỉ khi đủ mọi câu)
+        if use_cache and len(audio_parts) == len(line_audios):
+            await _cache_audio_async(cache_key, voice1, final_audio)
         
         return final_audio
     
     return None
 
-def get_tts_audio(text, voice="en-US-AriaNeural"):
+# --- BACKGROUND EVENT LOOP ---
+# Mọi việc edge-tts chạy trên 1 event loop sống lâu trong daemon thread riêng (dùng chung toàn
+# process) thay vì run_until_complete trên thread script của Streamlit: không lỗi khi đã có loop
+# đang chạy, nhiều clip tạo song song được, và page có thể render tiếp trong lúc chờ audio.
+
+TTS_TIMEOUT_SECONDS = 120           # Timeout mặc định của các wrapper đồng bộ
+DIALOGUE_TIMEOUT_SECONDS = 180
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_tts_loop():
+    """Event loop nền cho TTS (khởi tạo lần đầu gọi)."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tts-event-loop", daemon=True).start()
+        return _loop
+
+def submit_tts(coro):
+    """Chạy coroutine trên loop nền, trả về concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_tts_loop())
+
+def tts_audio_future(text, voice="en-US-AriaNeural", use_cache=True, sentence_cache=False):
+    """Bắt đầu tạo audio ngay, trả về Future (lấy kết quả bằng .result(timeout))."""
+    return submit_tts(text_to_speech(text, voice, use_cache=use_cache, sentence_cache=sentence_cache))
+
+def tts_dialogue_future(script, voice1="en-US-GuyNeural", voice2="en-US-AriaNeural", use_cache=True):
+    """Như tts_audio_future cho dialogue 2 giọng."""
+    return submit_tts(text_to_speech_dialogue(script, voice1, voice2, use_cache=use_cache))
+
+def _log_prefetch_error(future):
+    if not future.cancelled() and future.exception():
+        logger.debug(f"TTS prefetch failed (non-critical): {future.exception()}")
+
+def prefetch_tts_audio(text, voice="en-US-AriaNeural", sentence_cache=False):
+    """
+    Fire-and-forget: tạo trước audio (và lưu cache) cho text sắp cần,
+    để lần get_tts_audio sau lấy ngay từ cache.
+    """
+    future = tts_audio_future(text, voice, use_cache=True, sentence_cache=sentence_cache)
+    future.add_done_callback(_log_prefetch_error)
+    return future
+
+async def _segment_audio(text, voice, fallback_voice, semaphore, use_cache):
+    """Audio 1 đoạn: giọng chính -> giọng dự phòng -> thử lại giọng chính sau khi chờ."""
+    async with semaphore:
+        audio = await text_to_speech(text, voice, use_cache=use_cache)
+        if not audio and fallback_voice:
+            await asyncio.sleep(0.5)
+            audio = await text_to_speech(text, fallback_voice, use_cache=use_cache)
+            if audio:
+                logger.info(f"Used fallback voice ({fallback_voice}) for segment '{text[:30]}...'")
+        if not audio:
+            await asyncio.sleep(1.5)
+            audio = await text_to_speech(text, voice, use_cache=use_cache)
+    return audio
+
+def tts_segment_futures(segments, concurrency=CHUNK_CONCURRENCY, use_cache=False):
+    """
+    Bắt đầu tạo audio cho nhiều đoạn cùng lúc (tối đa concurrency đoạn song song).
+    
+    Args:
+        segments: List (text, voice, fallback_voice)
+        concurrency: Số đoạn tạo song song
+        use_cache: Dùng DB cache cho từng đoạn
+    
+    Returns:
+        List Future theo đúng thứ tự segments - chờ lần lượt để phát đoạn đầu ngay khi xong
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return [
+        submit_tts(_segment_audio(text, voice, fallback_voice, semaphore, use_cache))
+        for text, voice, fallback_voice in segments
+    ]
+
+def wait_for_audio(future, timeout=TTS_TIMEOUT_SECONDS):
+    """Chờ Future của TTS tối đa timeout giây; trả về None (và huỷ task) nếu quá hạn hoặc lỗi."""
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        logger.warning(f"TTS timed out after {timeout}s")
+        return None
+    except Exception as e:
+        logger.error(f"TTS Error: {e}")
+        return None
+
+def get_tts_audio(text, voice="en-US-AriaNeural", timeout=TTS_TIMEOUT_SECONDS, sentence_cache=False):
     """
     Hàm wrapper đồng bộ để gọi TTS an toàn trong Streamlit.
-    Tự động xử lý Event Loop và sử dụng DB cache (TTSAudioCache).
+    Chạy trên event loop nền (get_tts_loop), chờ tối đa timeout giây và sử dụng DB cache (TTSAudioCache).
     Cache is handled by text_to_speech() internally.
     """
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    return loop.run_until_complete(text_to_speech(text, voice, use_cache=True))
+    return wait_for_audio(tts_audio_future(text, voice, use_cache=True, sentence_cache=sentence_cache), timeout)
 
-def get_tts_audio_no_cache(text, voice="en-US-AriaNeural"):
+def get_tts_audio_no_cache(text, voice="en-US-AriaNeural", timeout=TTS_TIMEOUT_SECONDS):
     """
     Hàm tạo TTS audio KHÔNG dùng cache - dùng cho podcast để đảm bảo audio đầy đủ.
     Note: This function does NOT use DB cache or Streamlit cache.
     """
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    return loop.run_until_complete(text_to_speech(text, voice, use_cache=False))
+    return wait_for_audio(tts_audio_future(text, voice, use_cache=False), timeout)
 
-def get_tts_dialogue_audio(script, voice1="en-US-GuyNeural", voice2="en-US-AriaNeural"):
+def get_tts_dialogue_audio(script, voice1="en-US-GuyNeural", voice2="en-US-AriaNeural", timeout=DIALOGUE_TIMEOUT_SECONDS):
     """
     Hàm wrapper đồng bộ để tạo dialogue audio với 2 giọng.
     
@@ -324,14 +439,41 @@ def get_tts_dialogue_audio(script, voice1="en-US-GuyNeural", voice2="en-US-AriaN
         script: Dialogue script text (có thể có format "Speaker 1: ... Speaker 2: ..." hoặc tự nhiên)
         voice1: Voice cho speaker đầu tiên (default: en-US-GuyNeural - Nam Mỹ)
         voice2: Voice cho speaker thứ hai (default: en-US-AriaNeural - Nữ Mỹ)
+        timeout: Số giây tối đa chờ audio
     
     Returns:
-        bytes: Audio data (MP3 format)
+        bytes: Audio data (MP3 format) hoặc None nếu lỗi/quá hạn
     """
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    return wait_for_audio(tts_dialogue_future(script, voice1, voice2, use_cache=True), timeout)
+
+def get_tts_audio_source(text, voice="en-US-AriaNeural", timeout=TTS_TIMEOUT_SECONDS, sentence_cache=False):
+    """
+    Nguồn audio để truyền thẳng vào st.audio: URL trong Storage nếu audio đã được cache
+    (browser tải trực tiếp, bytes không đi qua app server), ngược lại tạo audio và trả về bytes.
     
-    return loop.run_until_complete(text_to_speech_dialogue(script, voice1, voice2, use_cache=True))
+    Returns:
+        str (URL) hoặc bytes hoặc None
+    """
+    if not text or not text.strip():
+        return None
+    try:
+        from services.tts_cache_service import get_cached_audio_url
+        audio_url = get_cached_audio_url(text, voice)
+        if audio_url:
+            return audio_url
+    except Exception as e:
+        logger.debug(f"Audio URL lookup failed, falling back to bytes: {e}")
+    return get_tts_audio(text, voice, timeout, sentence_cache=sentence_cache)
+
+def get_tts_dialogue_source(script, voice1="en-US-GuyNeural", voice2="en-US-AriaNeural", timeout=DIALOGUE_TIMEOUT_SECONDS):
+    """Như get_tts_audio_source cho dialogue 2 giọng."""
+    if not script or not script.strip():
+        return None
+    try:
+        from services.tts_cache_service import get_cached_audio_url
+        audio_url = get_cached_audio_url(_dialogue_cache_key(script, voice1, voice2), voice1)
+        if audio_url:
+            return audio_url
+    except Exception as e:
+        logger.debug(f"Dialogue audio URL lookup failed, falling back to bytes: {e}")
+    return get_tts_dialogue_audio(script, voice1, voice2, timeout)
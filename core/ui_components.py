@@ -9,7 +9,8 @@ Date: 2025-12-30
 """
 
 import streamlit as st
-from typing import Callable, Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Iterable
+from core.llm_output import extract_partial_fields
 
 
 # ============================================================================
@@ -334,6 +335,45 @@ def render_loading_with_progress(
     return all_data
 
 
+def render_ai_stream(
+    stream: Iterable[str],
+    label: str = "AI đang viết...",
+    done_label: str = "✅ AI đã hoàn thành",
+    prose_fields: Optional[List[str]] = None
+) -> str:
+    """
+    Render an AI text stream progressively inside a status box.
+    
+    Args:
+        stream: Iterable of text chunks (e.g. core.llm.generate_response_stream)
+        label: Status label while streaming
+        done_label: Status label after the stream ends
+        prose_fields: For JSON output, only these string fields are shown while streaming
+            (the raw JSON is never displayed; render the parsed result afterwards)
+        
+    Returns:
+        Full streamed text
+        
+    Example:
+        res = render_ai_stream(generate_response_stream(prompt, ["ERROR"]), prose_fields=["comment"])
+        data = parse_json_response(res)
+    """
+    chunks = []
+    with st.status(label, expanded=True) as status:
+        placeholder = st.empty()
+        for chunk in stream:
+            chunks.append(chunk)
+            text = "".join(chunks)
+            if prose_fields is not None:
+                values = extract_partial_fields(text, prose_fields)
+                text = "\n\n".join(values[f] for f in prose_fields if values.get(f))
+            if text:
+                placeholder.markdown(text)
+        status.update(label=done_label, state="complete", expanded=False)
+    
+    return "".join(chunks)
+
+
 # ============================================================================
 # EMPTY STATES
 # ============================================================================
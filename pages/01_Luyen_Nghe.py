@@ -1,9 +1,10 @@
 import streamlit as st
-import time
+import streamlit.components.v1 as components
 import string
 from core.theme_applier import apply_page_theme
-from core.tts import get_tts_audio, get_tts_audio_no_cache
+from core.tts import get_tts_audio_source, tts_segment_futures, wait_for_audio
 from core.llm import generate_response_with_fallback, parse_json_response
+from core.prompts import render_prompt
 from core.premium import can_use_ai_feature, log_ai_usage, show_premium_upsell
 from core.debug_tools import render_debug_panel
 from services.skill_tracking_service import track_skill_progress
@@ -12,6 +13,35 @@ from services.topic_service import get_vietnamese_topic_options, get_english_top
 
 if not st.session_state.get("logged_in"): st.switch_page("home.py")
 
+# Phát nối tiếp các st.audio trong cùng container: đoạn trước hết thì phát đoạn sau; đoạn sau
+# chưa tạo xong thì phát ngay khi nó được thêm vào trang
+SEGMENT_CHAIN_HTML = """
+<script>
+(function() {
+    var frame = window.frameElement;
+    var block = frame && frame.closest('[data-testid="stVerticalBlock"]');
+    if (!block) return;
+    var waiting = false;
+    function audios() { return Array.prototype.slice.call(block.querySelectorAll('audio')); }
+    block.addEventListener('ended', function(e) {
+        var list = audios();
+        var i = list.indexOf(e.target);
+        if (i < 0) return;
+        if (list[i + 1]) { list[i + 1].play().catch(function() {}); } else { waiting = true; }
+    }, true);
+    new MutationObserver(function() {
+        if (!waiting) return;
+        var list = audios();
+        var last = list[list.length - 1];
+        if (last && !last.ended && last.currentTime === 0) {
+            waiting = false;
+            last.play().catch(function() {});
+        }
+    }).observe(block, {childList: true, subtree: true});
+})();
+</script>
+"""
+
 apply_page_theme()  # Apply theme + sidebar + auth
 st.title("🎧 Phòng Luyện Nghe (Listening)")
 
@@ -67,16 +97,10 @@ if selected == "✍️ Chép chính tả":
             # If no cache, generate new exercise
             if not cached_exercise:
                 with st.spinner(f"AI đang nghĩ câu tiếng Anh ({level})..."):
-                    prompt = f"""
-                    Generate 1 English sentence for dictation practice.
-                    Level: {level} (CEFR).
-                    Topic: {topic}.
-                    Length: Moderate (10-20 words).
-                    Return strictly JSON format: {{"text": "English sentence", "translation": "Vietnamese meaning"}}
-                    """
+                    prompt = render_prompt("dictation_sentence", level=level, topic=topic)
                     
                     res = generate_response_with_fallback(prompt, ["ERROR"])
-                    data = parse_json_response(res)
+                    data = parse_json_response(res, schema="dictation")
                     
                     if data and "text" in data:
                         log_ai_usage("listening") # Log usage on success
@@ -126,7 +150,7 @@ if selected == "✍️ Chép chính tả":
         # Chỉ tạo audio 1 lần và cache lại
         if st.session_state.dictation_audio is None:
             with st.spinner("Đang tạo âm thanh..."):
-                st.session_state.dictation_audio = get_tts_audio(target_text)
+                st.session_state.dictation_audio = get_tts_audio_source(target_text)
         
         if st.session_state.dictation_audio:
             st.audio(st.session_state.dictation_audio, format='audio/mp3')
@@ -200,19 +224,9 @@ elif selected == "🧠 Nghe hiểu":
             # If no cache, generate new exercise
             if not cached_exercise:
                 with st.spinner("AI đang soạn bài nghe..."):
-                    prompt = f"""
-                    Create a short English listening passage (50-80 words) for Level {level} about {topic}.
-                    Then create 1 multiple-choice question based on it.
-                    Return strictly JSON format: {{
-                        "text": "passage text",
-                        "question": "question text",
-                        "options": ["Option A", "Option B", "Option C", "Option D"],
-                        "answer": "Correct Option Text",
-                        "explanation": "Explanation in Vietnamese"
-                    }}
-                    """
+                    prompt = render_prompt("listening_comprehension", level=level, topic=topic)
                     res = generate_response_with_fallback(prompt, ["ERROR"])
-                    data = parse_json_response(res)
+                    data = parse_json_response(res, schema="comprehension")
                     
                     if data and "text" in data:
                         log_ai_usage("listening")
@@ -258,7 +272,7 @@ elif selected == "🧠 Nghe hiểu":
         if st.session_state.comp_audio is None:
             with st.spinner("Đang tạo âm thanh..."):
                 # Sử dụng en-US-JennyNeural - giọng nữ Mỹ tự nhiên hơn cho comprehension
-                st.session_state.comp_audio = get_tts_audio(data['text'], voice="en-US-JennyNeural")
+                st.session_state.comp_audio = get_tts_audio_source(data['text'], voice="en-US-JennyNeural", sentence_cache=True)
         
         if st.session_state.comp_audio:
             st.audio(st.session_state.comp_audio, format='audio/mp3')
@@ -379,7 +393,7 @@ elif selected == "📻 Podcast":
                     """
                     
                     res = generate_response_with_fallback(prompt, ["ERROR"])
-                    script_data = parse_json_response(res)
+                    script_data = parse_json_response(res, schema="podcast_script")
                     
                     # Save to cache if generation was successful
                     if script_data and isinstance(script_data, list) and user_id:
@@ -402,11 +416,7 @@ elif selected == "📻 Podcast":
                     audio_chunks = []  # Store chunks in list instead of concatenating immediately
                     display_script = ""
                     word_count = 0
-                    processed_count = 0  # Track successfully processed audio chunks
-                    
-                    # Progress bar for audio generation
-                    progress_bar = st.progress(0)
-                    total_turns = len([t for t in script_data if t.get("text", "").strip()])  # Count only non-empty turns
+                    segments = []  # (text, voice, fallback_voice) theo thứ tự kịch bản
                     
                     for idx, turn in enumerate(script_data):
                         speaker = turn.get("speaker", "Host")
@@ -437,50 +447,33 @@ elif selected == "📻 Podcast":
                             # Female voices (confirmed available):
                             # - en-US-JennyNeural: Very natural, warm, conversational (RECOMMENDED)
                             # - en-US-AriaNeural: Reliable fallback
-                            voice = "en-US-JennyNeural"  # More natural female voice
+                            segments.append((text, "en-US-JennyNeural", "en-US-AriaNeural"))
                         else:
                             # Male voices (confirmed available):
                             # - en-US-BrianNeural: Clear and professional (RECOMMENDED)
                             # - en-US-ChristopherNeural: Natural, friendly alternative
                             # - en-US-GuyNeural: Reliable fallback
-                            voice = "en-US-BrianNeural"  # More natural male voice
-                        
-                        # Generate audio for this chunk - use no-cache version for podcast to ensure completeness
-                        try:
-                            # Add small delay to avoid rate limiting
-                            if processed_count > 0:
-                                time.sleep(0.2)  # 200ms delay between requests
-                            
-                            chunk = get_tts_audio_no_cache(text, voice)
-                            if chunk is not None and len(chunk) > 0:
-                                # Store chunk in list instead of concatenating immediately
-                                audio_chunks.append(chunk)
-                                processed_count += 1
-                            else:
-                                # If primary voice fails, try fallback voice
-                                fallback_voice = "en-US-AriaNeural" if "Host" in speaker or "Alice" in speaker else "en-US-GuyNeural"
-                                time.sleep(0.5)
-                                chunk_retry = get_tts_audio_no_cache(text, fallback_voice)
-                                if chunk_retry is not None and len(chunk_retry) > 0:
-                                    audio_chunks.append(chunk_retry)
-                                    processed_count += 1
-                                    print(f"Used fallback voice ({fallback_voice}) for turn {idx + 1}")
-                                else:
-                                    # Final retry with original voice and longer delay
-                                    time.sleep(1.5)
-                                    chunk_final = get_tts_audio_no_cache(text, voice)
-                                    if chunk_final is not None and len(chunk_final) > 0:
-                                        audio_chunks.append(chunk_final)
-                                        processed_count += 1
-                                    else:
-                                        # Log warning if chunk is None or empty (but continue processing)
-                                        print(f"Warning: Empty audio for turn {idx + 1} (tried {voice} and {fallback_voice}): '{text[:50]}...'")
-                        except Exception as e:
-                            print(f"Error generating audio for turn {idx + 1}: {str(e)[:100]}")
-                        
-                        # Update progress based on processed count
-                        if total_turns > 0:
-                            progress_bar.progress(processed_count / total_turns)
+                            segments.append((text, "en-US-BrianNeural", "en-US-GuyNeural"))
+                    
+                    # Tạo audio các đoạn song song trên loop nền, phát từng đoạn ngay khi xong theo
+                    # đúng thứ tự (SEGMENT_CHAIN_HTML nối các player) - không phải chờ cả podcast.
+                    # Mỗi lượt lời cache riêng theo (text, voice)
+                    futures = tts_segment_futures(segments, use_cache=True)
+                    progress_bar = st.progress(0)
+                    st.caption("🎧 Nghe ngay các đoạn đã sẵn sàng, phần còn lại đang được tạo...")
+                    segment_container = st.container()
+                    with segment_container:
+                        components.html(SEGMENT_CHAIN_HTML, height=0)
+                    
+                    for idx, future in enumerate(futures):
+                        chunk = wait_for_audio(future)
+                        if chunk:
+                            audio_chunks.append(chunk)
+                            with segment_container:
+                                st.audio(chunk, format='audio/mp3', autoplay=(len(audio_chunks) == 1))
+                        else:
+                            print(f"Warning: Empty audio for turn {idx + 1}: '{segments[idx][0][:50]}...'")
+                        progress_bar.progress((idx + 1) / len(futures))
                     
                     # Concatenate all audio chunks at the end to ensure proper ordering
                     if audio_chunks:
@@ -495,7 +488,7 @@ elif selected == "📻 Podcast":
                     st.session_state.podcast_audio = full_audio
                     st.session_state.podcast_word_count = word_count
                     st.session_state.podcast_generated_topic = selected_vietnamese_topic  # Store Vietnamese name for display
-                    st.rerun()
+                    # Không rerun: giữ các đoạn đang phát, bản đầy đủ hiển thị ngay bên dưới
                 else:
                     st.error("Lỗi khi tạo kịch bản podcast. Vui lòng thử lại với chủ đề khác.")
     else:
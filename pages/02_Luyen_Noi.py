@@ -9,8 +9,8 @@ from core.theme_applier import apply_page_theme
 
 logger = logging.getLogger(__name__)
 from core.data import load_vocab_data
-from core.tts import get_tts_audio
-from core.llm import generate_response_with_fallback, parse_json_response
+from core.tts import get_tts_audio_source
+from core.llm import generate_response_with_fallback, generate_response_stream, parse_json_response
 from core.stt import recognize_audio
 from services.chat_service import get_chat_sessions, get_chat_messages, create_chat_session, add_chat_message
 from core.debug_tools import render_debug_panel
@@ -29,11 +29,15 @@ st.caption("Luyện phát âm từ vựng và câu giao tiếp với phản hồ
 # --- HELPER: AUDIO AUTOPLAY ---
 def play_audio_autoplay(text):
     try:
-        audio_bytes = get_tts_audio(text)
-        if audio_bytes:
-            b64 = base64.b64encode(audio_bytes).decode()
+        audio_source = get_tts_audio_source(text)
+        if audio_source:
+            # URL trong Storage -> browser tải trực tiếp; bytes (chưa có cache) -> data URI
+            if isinstance(audio_source, str):
+                src = audio_source
+            else:
+                src = f"data:audio/mp3;base64,{base64.b64encode(audio_source).decode()}"
             unique_id = int(time.time() * 1000)
-            md = f"""<div id="audio_{unique_id}"><audio autoplay="true"><source src="data:audio/mp3;base64,{b64}" type="audio/mp3"></audio></div>"""
+            md = f"""<div id="audio_{unique_id}"><audio autoplay="true"><source src="{src}" type="audio/mp3"></audio></div>"""
             st.markdown(md, unsafe_allow_html=True)
     except: pass
 
@@ -440,7 +444,15 @@ elif selected_tab == "🤖 Luyện Nói AI":
                     Task: Reply naturally (short). Then provide feedback on user's last grammar/vocab in Vietnamese wrapped in [Feedback] tag.
                     Format: [Reply] ... [Feedback] ...
                     """
-                    res = generate_response_with_fallback(prompt)
+                    # Stream câu trả lời: hiển thị phần [Reply] ngay khi AI đang viết
+                    with st.chat_message("ai"):
+                        reply_placeholder = st.empty()
+                        chunks = []
+                        for chunk in generate_response_stream(prompt):
+                            chunks.append(chunk)
+                            partial = "".join(chunks).split("[Feedback]")[0].replace("[Reply]", "").strip()
+                            reply_placeholder.write(partial)
+                    res = "".join(chunks)
                     
                     reply = res
                     feedback = ""
@@ -3,8 +3,10 @@ import time
 from core.theme_applier import apply_page_theme
 
 apply_page_theme()  # Apply theme + sidebar + auth (includes render_sidebar)
-from core.llm import generate_response_with_fallback, parse_json_response
-from core.tts import get_tts_audio
+from core.llm import generate_response_stream, parse_json_response
+from core.ui_components import render_ai_stream
+from core.prompts import render_prompt
+from core.tts import get_tts_audio_source, prefetch_tts_audio
 from core.premium import can_use_ai_feature, log_ai_usage, show_premium_upsell
 from core.debug_tools import render_debug_panel
 from core.data import supabase
@@ -72,32 +74,13 @@ with tab_gen:
             # If no cache, generate new exercise
             if not cached_exercise:
                 with st.spinner(f"AI đang viết bài đọc về {topic} ({level})..."):
-                    prompt = f"""
-                    Act as an English teacher. Create a comprehensive reading lesson about '{topic}' (CEFR Level {level}).
-                    Length: 200-250 words.
+                    prompt = render_prompt("reading_lesson", topic=topic, level=level)
                     
-                    Return strictly JSON format:
-                    {{
-                        "title": "Title in English",
-                        "english_content": "Full English text...",
-                        "vietnamese_content": "Full Vietnamese translation...",
-                        "summary": "A brief summary of the text (1-2 sentences) in English.",
-                        "vocabulary": [
-                            {{"word": "word1", "type": "noun/verb...", "meaning": "Vietnamese meaning", "context": "Example sentence from text"}}
-                        ],
-                        "grammar": [
-                            {{"structure": "Name of structure", "explanation": "Brief explanation in Vietnamese", "example": "Example from text"}}
-                        ],
-                        "quiz": [
-                            {{"question": "Question 1?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}},
-                            {{"question": "Question 2?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}},
-                            {{"question": "Question 3?", "options": ["A", "B", "C", "D"], "answer": "Correct Option", "explanation": "Why?"}}
-                        ]
-                    }}
-                    """
-                    
-                    res = generate_response_with_fallback(prompt, ["ERROR"])
-                    data = parse_json_response(res)
+                    res = render_ai_stream(
+                        generate_response_stream(prompt, ["ERROR"]),
+                        label="AI đang viết bài đọc...", prose_fields=["title", "english_content"]
+                    )
+                    data = parse_json_response(res, schema="reading_question")
                     
                     if data and "english_content" in data:
                         log_ai_usage("reading")
@@ -119,6 +102,8 @@ with tab_gen:
                 st.session_state.reading_exercise_id = exercise_id  # Store exercise_id for completion tracking
                 st.session_state.reading_quiz_answers = {}  # Track correct answers for this reading
                 st.session_state.reading_audio = None
+                # Tạo trước audio trên loop nền trong lúc user đọc bài -> bấm nghe là có ngay từ cache
+                prefetch_tts_audio(data['english_content'], sentence_cache=True)
                 st.rerun()
             else:
                 st.error("Lỗi khi tạo nội dung. Vui lòng thử lại.")
@@ -157,7 +142,7 @@ with tab_gen:
         # Audio Player
         if st.button("🔊 Nghe bài đọc (TTS)", help="Nghe giọng đọc AI để luyện kỹ năng nghe và shadowing."):
             with st.spinner("Đang tạo âm thanh..."):
-                st.session_state.reading_audio = get_tts_audio(data['english_content'])
+                st.session_state.reading_audio = get_tts_audio_source(data['english_content'], sentence_cache=True)
         
         if st.session_state.get('reading_audio'):
             st.audio(st.session_state.reading_audio, format='audio/mp3')
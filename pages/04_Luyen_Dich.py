@@ -7,7 +7,9 @@ import textwrap
 from core.theme_applier import apply_page_theme
 
 apply_page_theme()  # Apply theme + sidebar + auth (includes render_sidebar)
-from core.llm import generate_response_with_fallback, parse_json_response
+from core.llm import generate_response_with_fallback, generate_response_stream, parse_json_response
+from core.ui_components import render_ai_stream
+from core.prompts import render_prompt
 from core.premium import can_use_ai_feature, log_ai_usage, show_premium_upsell
 from core.debug_tools import render_debug_panel
 from services.vocab_service import add_word_to_srs_and_prioritize, load_progress
@@ -32,16 +34,13 @@ if can_use_ai_feature("translation"):
     if c3.button("✨ Tạo bài dịch mới", type="primary", width='stretch'):
         with st.spinner(f"AI đang phân tích chủ đề và viết bài..."):
             # NEW: Translate topic to English first
-            translation_prompt = f"Translate this topic to English: '{topic}'. Return only the translated English topic."
+            translation_prompt = render_prompt("translation_topic", topic=topic)
             english_topic = generate_response_with_fallback(translation_prompt, [topic])
 
             st.info(f"Đang tạo bài về chủ đề: '{english_topic}'...")
-            prompt = f"""
-            Write a detailed English passage (about 200-250 words) about '{english_topic}' for CEFR Level {level}.
-            Return strictly JSON format: {{"english_text": "...", "vietnamese_translation": "..."}}
-            """
+            prompt = render_prompt("translation_passage", topic=english_topic, level=level)
             res = generate_response_with_fallback(prompt, ["ERROR"])
-            data = parse_json_response(res)
+            data = parse_json_response(res, schema="translation_passage")
             if data and "english_text" in data:
                 log_ai_usage("translation")
                 st.session_state.trans_data = data
@@ -179,35 +178,17 @@ if st.session_state.get('trans_data'):
 
     if st.button("Chấm điểm bài dịch", disabled=(not user_translation)):
         with st.spinner("AI đang chấm điểm và phân tích bài dịch của bạn..."):
-            grading_prompt = f"""
-            As an expert translator and examiner, evaluate a user's Vietnamese translation of an English text.
-            
-            Original English Text:
-            '''{english_text}'''
-            
-            Official Vietnamese Translation (for reference):
-            '''{data['vietnamese_translation']}'''
-            
-            User's Vietnamese Translation:
-            '''{user_translation}'''
-            
-            Task: Provide feedback in Vietnamese. Return strictly JSON format:
-            {{
-                "score": "X/10",
-                "overall_comment": "A general comment on the translation's accuracy, naturalness, and style.",
-                "strengths": "What the user did well (e.g., good word choice, correct structure).",
-                "areas_for_improvement": [
-                    {{
-                        "original_phrase": "The English phrase the user struggled with",
-                        "user_translation": "The user's incorrect translation of that phrase",
-                        "suggested_translation": "A better, more natural Vietnamese translation",
-                        "explanation": "Why the suggestion is better (e.g., idiom, context, nuance)."
-                    }}
-                ]
-            }}
-            """
-            res = generate_response_with_fallback(grading_prompt, ["ERROR"])
-            feedback_data = parse_json_response(res)
+            grading_prompt = render_prompt(
+                "translation_grading",
+                english_text=english_text,
+                reference_translation=data['vietnamese_translation'],
+                user_translation=user_translation
+            )
+            res = render_ai_stream(
+                generate_response_stream(grading_prompt, ["ERROR"]),
+                label="AI đang viết nhận xét...", prose_fields=["score", "overall_comment", "strengths"]
+            )
+            feedback_data = parse_json_response(res, schema="translation_grading")
             if feedback_data and "score" in feedback_data:
                 st.session_state.trans_feedback = feedback_data
             else:
@@ -3,7 +3,9 @@ import string
 from core.theme_applier import apply_page_theme
 
 apply_page_theme()  # Apply theme + sidebar + auth (includes render_sidebar)
-from core.llm import generate_response_with_fallback, parse_json_response
+from core.llm import generate_response_with_fallback, generate_response_stream, parse_json_response
+from core.ui_components import render_ai_stream
+from core.prompts import render_prompt
 from core.premium import can_use_ai_feature, log_ai_usage, show_premium_upsell
 from services.skill_tracking_service import track_skill_progress
 from services.exercise_cache_service import get_unseen_exercise, save_exercise, mark_exercise_seen, mark_exercise_completed
@@ -164,20 +166,12 @@ elif selected == "📄 Viết đoạn văn":
                 st.warning("Bài viết quá ngắn.")
             else:
                 with st.spinner("AI đang chấm bài..."):
-                    prompt = f"""
-                    Act as an English teacher. Grade this writing (Level {level}) on topic '{st.session_state.we_topic}'.
-                    Content: '''{user_text}'''
-                    Return JSON: {{
-                        "score": "X/10",
-                        "comment": "General feedback in Vietnamese",
-                        "corrected": "Corrected version of the text",
-                        "mistakes": [
-                            {{"error": "wrong part", "fix": "correction", "explain": "why in Vietnamese"}}
-                        ]
-                    }}
-                    """
-                    res = generate_response_with_fallback(prompt)
-                    data = parse_json_response(res)
+                    prompt = render_prompt("essay_grading", level=level, topic=st.session_state.we_topic, user_text=user_text)
+                    res = render_ai_stream(
+                        generate_response_stream(prompt),
+                        label="AI đang chấm bài...", prose_fields=["score", "comment", "corrected"]
+                    )
+                    data = parse_json_response(res, schema="essay_grading")
                     log_ai_usage("writing")
                     st.session_state.w_essay_feedback = data
                     # Track skill progress for essay writing
@@ -536,10 +536,11 @@ def render_health_check():
     """Renders the system health check tab."""
     
     # Tabs cho các loại health check
-    tab_basic, tab_features, tab_benchmark = st.tabs([
+    tab_basic, tab_features, tab_benchmark, tab_ai_telemetry = st.tabs([
         "🩺 Kiểm tra Cơ bản",
         "🔍 Kiểm tra Chi tiết (Features)",
-        "🚀 Benchmark"
+        "🚀 Benchmark",
+        "📈 AI Telemetry"
     ])
     
     with tab_basic:
@@ -672,6 +673,50 @@ def render_health_check():
                     for log in logs:
                         st.text(log)
 
+    with tab_ai_telemetry:
+        render_ai_telemetry()
+
+def render_ai_telemetry():
+    """Renders LLM latency / token / cost telemetry (in-memory, process-wide)."""
+    from core.llm import get_model_health_snapshot
+    from core.llm_telemetry import get_llm_telemetry_summary, export_llm_telemetry_csv
+
+    st.subheader("📈 AI Telemetry")
+    st.caption("Latency, token và chi phí của các request Gemini gần nhất (theo feature & page). Dữ liệu lưu trong bộ nhớ server, reset khi restart.")
+
+    summary = get_llm_telemetry_summary()
+    if not summary:
+        st.info("Chưa có request AI nào được ghi nhận kể từ lần khởi động server.")
+    else:
+        df = pd.DataFrame(summary)
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Requests", int(df['requests'].sum()))
+        m2.metric("Cache hit rate", f"{(df['cache_hit_rate'] * df['requests']).sum() / df['requests'].sum():.0%}")
+        m3.metric("Tokens", f"{int(df['prompt_tokens'].sum() + df['response_tokens'].sum()):,}")
+        m4.metric("Chi phí ước tính", f"${df['cost_usd'].sum():.4f}")
+
+        st.dataframe(df, hide_index=True, width='stretch')
+        st.bar_chart(df.groupby('feature_type')['total_latency_s'].sum())
+
+        c1, c2 = st.columns(2)
+        c1.download_button("📥 Tải CSV (tổng hợp)", export_llm_telemetry_csv(),
+                           file_name="llm_telemetry_summary.csv", mime="text/csv")
+        c2.download_button("📥 Tải CSV (từng request)", export_llm_telemetry_csv(raw_events=True),
+                           file_name="llm_telemetry_events.csv", mime="text/csv")
+
+    health = get_model_health_snapshot()
+    if health:
+        st.markdown("##### 🔌 Circuit Breaker")
+        st.dataframe(pd.DataFrame(health), hide_index=True, width='stretch')
+
+    from services.exercise_pool_service import get_exercise_replenisher
+    pool_status = get_exercise_replenisher().status()
+    st.markdown("##### 🧺 Exercise Pool Replenisher")
+    st.caption(f"Worker: {'đang chạy' if pool_status['running'] else 'chưa chạy'} · "
+               f"Hàng đợi: {pool_status['queued']} · Đã tạo: {pool_status['generated']} bài")
+    if pool_status['pools']:
+        st.dataframe(pd.DataFrame(pool_status['pools']), hide_index=True, width='stretch')
+
 def render_email_settings():
     """Render Email Settings management UI."""
     st.subheader("📧 Cài Đặt Email Thông Báo")
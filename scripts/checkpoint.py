@@ -0,0 +1,56 @@
+"""
+Checkpoint file dùng chung cho các script chạy dài (generate_vocabulary_details, prewarm_tts_cache).
+Không import core.* để script nào dùng cũng không kéo theo streamlit / Gemini.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Hashable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Resumable progress file: keys already processed and failed attempt counts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: set = set()
+        self.failed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.done = set(data.get("done", []))
+                self.failed = data.get("failed", {})
+                logger.info(f"Loaded checkpoint: {len(self.done)} done, {len(self.failed)} failed")
+            except Exception as e:
+                logger.warning(f"Could not read checkpoint {path}: {e}")
+
+    def mark_done(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self.done.add(key)
+                self.failed.pop(str(key), None)
+
+    def discard_done(self, keys: Iterable[Hashable]) -> None:
+        """Bỏ trạng thái done (vd: kết quả đã bị xóa ở nơi lưu) để lần chạy này làm lại."""
+        with self._lock:
+            self.done.difference_update(keys)
+
+    def mark_failed(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self.failed[str(key)] = self.failed.get(str(key), 0) + 1
+
+    def save(self) -> None:
+        """Atomic write (tmp file + rename) so an interrupted run never corrupts the checkpoint."""
+        with self._lock:
+            data = {"done": sorted(self.done), "failed": self.failed, "updated_at": datetime.now().isoformat()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,59 @@
+"""
+Script to garbage-collect the TTS audio cache (TTSAudioCache rows + tts-audio Storage objects)
+so the bucket stays under a byte budget.
+
+Entries are evicted least-used first, then least recently used, then largest first,
+in batches, until the total size fits the budget.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+from services.tts_cache_service import run_cache_gc, TTS_CACHE_MAX_STORAGE_BYTES, CACHE_GC_BATCH_SIZE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _mb(size_bytes):
+    return size_bytes / (1024 * 1024)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Evict TTS cache entries until the tts-audio bucket fits a storage budget",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Report what would be deleted with the configured budget (TTS_CACHE_MAX_STORAGE_MB)
+  python scripts/gc_tts_cache.py --dry-run
+
+  # Shrink the cache to 500 MB
+  python scripts/gc_tts_cache.py --budget-mb 500
+        """
+    )
+    parser.add_argument("--budget-mb", type=float, default=None,
+                       help=f"Storage budget in MB (default: {_mb(TTS_CACHE_MAX_STORAGE_BYTES):.0f})")
+    parser.add_argument("--batch-size", type=int, default=CACHE_GC_BATCH_SIZE,
+                       help=f"Entries deleted per batch (default: {CACHE_GC_BATCH_SIZE})")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+
+    args = parser.parse_args()
+    budget = int(args.budget_mb * 1024 * 1024) if args.budget_mb is not None else None
+
+    report = run_cache_gc(budget_bytes=budget, dry_run=args.dry_run, batch_size=args.batch_size)
+    if not report:
+        logger.error("Supabase is not configured")
+        sys.exit(1)
+
+    prefix = "[DRY RUN] " if report["dry_run"] else ""
+    logger.info(f"{'='*60}")
+    logger.info(f"{prefix}Cache size: {_mb(report['total_size_bytes']):.2f} MB (budget {_mb(report['budget_bytes']):.2f} MB)")
+    logger.info(f"{prefix}To evict: {report['evict_entries']} entries, {_mb(report['evict_bytes']):.2f} MB")
+    if not report["dry_run"]:
+        logger.info(f"Deleted: {report['deleted_entries']} entries, {_mb(report['deleted_bytes']):.2f} MB")
+    logger.info(f"{'='*60}")
@@ -8,15 +8,21 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import logging
 import json
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 
 from core.database import supabase
 from core.llm import generate_response_with_fallback, parse_json_response
+from scripts.checkpoint import Checkpoint
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vocab_details_checkpoint.json")
+MAX_BATCH_ROUNDS = 3  # Số vòng re-queue tối đa cho các từ bị lỗi trong batch mode
+MAX_FAILED_ATTEMPTS = 2 * MAX_BATCH_ROUNDS  # Từ đã lỗi ngần này lần (qua các lần chạy) thì bỏ qua
+
 
 def generate_vocab_details(word: str, meaning: str, level: str, example: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """Generate vocabulary details using AI.
@@ -67,34 +73,124 @@ Rules:
             logger.warning(f"Failed to parse JSON for {word}")
             return None
         
-        # Validate structure
-        result = {
-            "collocations": data.get("collocations", []),
-            "phrasal_verbs": data.get("phrasal_verbs", ""),
-            "word_forms": data.get("word_forms", {}),
-            "synonyms": data.get("synonyms", []),
-            "usage_notes": data.get("usage_notes", "")
-        }
-        
-        # Clean empty values
-        if not result["phrasal_verbs"]:
-            result["phrasal_verbs"] = None
-        if not result["word_forms"] or all(not v for v in result["word_forms"].values()):
-            result["word_forms"] = None
-        if not result["synonyms"]:
-            result["synonyms"] = None
-        if not result["usage_notes"]:
-            result["usage_notes"] = None
-        if not result["collocations"]:
-            result["collocations"] = None
-        
-        return result
+        return clean_vocab_details(data)
         
     except Exception as e:
         logger.error(f"Error generating details for {word}: {e}")
         return None
 
 
+def clean_vocab_details(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize one AI result into the Vocabulary detail fields (empty values -> None)."""
+    # Validate structure
+    result = {
+        "collocations": data.get("collocations", []),
+        "phrasal_verbs": data.get("phrasal_verbs", ""),
+        "word_forms": data.get("word_forms", {}),
+        "synonyms": data.get("synonyms", []),
+        "usage_notes": data.get("usage_notes", "")
+    }
+    
+    # Clean empty values
+    if not result["phrasal_verbs"]:
+        result["phrasal_verbs"] = None
+    if not isinstance(result["word_forms"], dict) or all(not v for v in result["word_forms"].values()):
+        result["word_forms"] = None
+    if not result["synonyms"]:
+        result["synonyms"] = None
+    if not result["usage_notes"]:
+        result["usage_notes"] = None
+    if not result["collocations"]:
+        result["collocations"] = None
+    
+    return result
+
+
+def validate_vocab_details(data: Any) -> Optional[Dict[str, Any]]:
+    """Validate a single element of a batch response; None if unusable."""
+    if not isinstance(data, dict):
+        return None
+    if not isinstance(data.get("collocations", []), list) or not isinstance(data.get("synonyms", []), list):
+        return None
+    if data.get("word_forms") is not None and not isinstance(data.get("word_forms"), dict):
+        return None
+    
+    result = clean_vocab_details(data)
+    if all(v is None for v in result.values()):
+        return None
+    return result
+
+
+def generate_vocab_details_batch(words: List[Dict[str, Any]]) -> Tuple[Dict[int, Dict[str, Any]], List[Dict[str, Any]]]:
+    """Generate details for several words in one AI request.
+    
+    Each element of the returned JSON array is validated on its own, so one bad
+    element only fails that word.
+    
+    Args:
+        words: Vocabulary rows (id, word, meaning, level, example)
+    
+    Returns:
+        (details by vocab id, rows that failed and should be re-queued)
+    """
+    word_lines = []
+    for w in words:
+        example_text = f" | Example: {w['example']}" if w.get("example") else ""
+        word_lines.append(f"- id={w['id']} | word: {w['word']} | level: {w['level']} | meaning: {w.get('meaning', '')}{example_text}")
+    
+    prompt = f"""Generate detailed vocabulary information for each of the following English words:
+
+{chr(10).join(word_lines)}
+
+Return a JSON array with exactly one object per word, in the same order:
+[
+  {{
+    "id": <the id given above>,
+    "word": "the word",
+    "collocations": ["common phrase 1", "common phrase 2", ...],  // Max 5 common collocations
+    "phrasal_verbs": "phrasal verb form if applicable, or empty string",
+    "word_forms": {{"noun": "...", "verb": "...", "adjective": "...", "adverb": "..."}},
+    "synonyms": ["synonym1", "synonym2", ...],  // Max 5 synonyms (only for level B1 and above, empty for A1-A2)
+    "usage_notes": "Brief usage note in Vietnamese (max 100 words, MUST be in Vietnamese)"
+  }}
+]
+
+Rules:
+- For A1-A2 levels: synonyms can be empty or very simple
+- For B1-C2: include relevant synonyms
+- Collocations should be practical and commonly used
+- Word forms: only include if they exist and are commonly used
+- Usage notes: MUST be in Vietnamese, keep brief and practical (100 words max)
+- Return valid JSON only, no markdown code blocks"""
+
+    results: Dict[int, Dict[str, Any]] = {}
+    try:
+        response = generate_response_with_fallback(prompt, ["ERROR"])
+        data = parse_json_response(response) if response and response != "ERROR" else None
+        if not isinstance(data, list):
+            logger.warning(f"Batch of {len(words)} words returned no JSON array")
+            return results, list(words)
+        
+        by_id = {w["id"]: w for w in words}
+        by_word = {w["word"].strip().lower(): w for w in words}
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            row = by_id.get(item.get("id"))
+            if row is None and isinstance(item.get("word"), str):
+                row = by_word.get(item["word"].strip().lower())
+            if row is None or row["id"] in results:
+                continue
+            details = validate_vocab_details(item)
+            if details:
+                results[row["id"]] = details
+    except Exception as e:
+        logger.error(f"Error generating batch details: {e}")
+    
+    failed = [w for w in words if w["id"] not in results]
+    return results, failed
+
+
 def update_vocab_details(vocab_id: int, details: Dict[str, Any]) -> bool:
     """Update vocabulary record with generated details."""
     try:
@@ -122,8 +218,94 @@ def update_vocab_details(vocab_id: int, details: Dict[str, Any]) -> bool:
         return False
 
 
+def has_vocab_details(word_data: Dict[str, Any]) -> bool:
+    """True if the Vocabulary row already has any generated detail field."""
+    return bool(
+        (word_data.get("collocations") and len(word_data.get("collocations", [])) > 0) or
+        (word_data.get("phrasal_verbs") and word_data.get("phrasal_verbs", "").strip()) or
+        (word_data.get("word_forms") and word_data.get("word_forms")) or
+        (word_data.get("synonyms") and len(word_data.get("synonyms", [])) > 0) or
+        (word_data.get("usage_notes") and word_data.get("usage_notes", "").strip())
+    )
+
+
+def process_vocabulary_batched(words: List[Dict[str, Any]], only_missing: bool = True, batch_size: int = 10,
+                               workers: int = 4, checkpoint_path: Optional[str] = None) -> None:
+    """Batched mode: N words per AI request on a bounded thread pool.
+    
+    Words that fail validation are re-queued (up to MAX_BATCH_ROUNDS rounds) in new
+    batches; progress is checkpointed after every batch so the run can be resumed.
+    Words that already failed MAX_FAILED_ATTEMPTS times in earlier runs are skipped
+    (delete them from the checkpoint's "failed" map to retry).
+    """
+    checkpoint = Checkpoint(checkpoint_path or DEFAULT_CHECKPOINT_FILE)
+    
+    pending = []
+    skipped = 0
+    skipped_failed = 0
+    for word_data in words:
+        if word_data["id"] in checkpoint.done or (only_missing and has_vocab_details(word_data)):
+            skipped += 1
+            continue
+        if checkpoint.failed.get(str(word_data["id"]), 0) >= MAX_FAILED_ATTEMPTS:
+            skipped_failed += 1
+            continue
+        pending.append(word_data)
+    
+    total = len(pending)
+    logger.info(f"Batched mode: {total} words to process (batch_size={batch_size}, workers={workers}, "
+                f"skipped={skipped}, skipped after {MAX_FAILED_ATTEMPTS} failures={skipped_failed})")
+    
+    updated = 0
+    requests_sent = 0
+    
+    def _run_batch(batch):
+        details_by_id, failed = generate_vocab_details_batch(batch)
+        ok_ids = [vocab_id for vocab_id, details in details_by_id.items() if update_vocab_details(vocab_id, details)]
+        failed += [w for w in batch if w["id"] in details_by_id and w["id"] not in ok_ids]
+        return ok_ids, failed
+    
+    for round_idx in range(MAX_BATCH_ROUNDS):
+        if not pending:
+            break
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        logger.info(f"Round {round_idx + 1}: {len(pending)} words in {len(batches)} batches")
+        next_pending = []
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(_run_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                requests_sent += 1
+                try:
+                    ok_ids, failed = future.result()
+                except Exception as e:
+                    logger.error(f"Batch failed: {e}")
+                    ok_ids, failed = [], batch
+                
+                updated += len(ok_ids)
+                checkpoint.mark_done(ok_ids)
+                checkpoint.mark_failed([w["id"] for w in failed])
+                checkpoint.save()
+                next_pending.extend(failed)
+                logger.info(f"  -> {len(ok_ids)}/{len(batch)} updated ({updated}/{total} total)")
+        
+        pending = next_pending
+    
+    logger.info(f"\n{'='*60}")
+    logger.info("Summary (batched):")
+    logger.info(f"  Words to process: {total}")
+    logger.info(f"  Updated: {updated}")
+    logger.info(f"  Skipped (already has details / checkpoint): {skipped}")
+    logger.info(f"  Skipped (failed {MAX_FAILED_ATTEMPTS}+ times before): {skipped_failed}")
+    logger.info(f"  Failed after {MAX_BATCH_ROUNDS} rounds: {len(pending)}")
+    logger.info(f"  AI requests: {requests_sent}")
+    logger.info(f"{'='*60}")
+
+
 def process_vocabulary(level: Optional[str] = None, limit: Optional[int] = None, start_from: int = 0, 
-                      only_missing: bool = True) -> None:
+                      only_missing: bool = True, batch_size: int = 1, workers: int = 4,
+                      checkpoint_path: Optional[str] = None) -> None:
     """Process vocabulary words and generate details.
     
     Args:
@@ -131,6 +313,9 @@ def process_vocabulary(level: Optional[str] = None, limit: Optional[int] = None,
         limit: Maximum number of words to process (None = all)
         start_from: Start from this index (for resumable processing)
         only_missing: Only process words that don't have details yet
+        batch_size: Words per AI request; > 1 enables batched mode (concurrent, checkpointed)
+        workers: Max concurrent AI requests in batched mode
+        checkpoint_path: Checkpoint file for batched mode (default: scripts/vocab_details_checkpoint.json)
     """
     try:
         # Build query - MUST include detail fields to check if already exists
@@ -153,6 +338,11 @@ def process_vocabulary(level: Optional[str] = None, limit: Optional[int] = None,
         total = len(words)
         logger.info(f"Processing {total} vocabulary words (start_from={start_from})")
         
+        if batch_size > 1:
+            process_vocabulary_batched(words, only_missing=only_missing, batch_size=batch_size,
+                                       workers=workers, checkpoint_path=checkpoint_path)
+            return
+        
         processed = 0
         updated = 0
         skipped = 0
@@ -165,14 +355,7 @@ def process_vocabulary(level: Optional[str] = None, limit: Optional[int] = None,
             
             # Check if already has details (if only_missing is True)
             if only_missing:
-                has_details = (
-                    (word_data.get("collocations") and len(word_data.get("collocations", [])) > 0) or
-                    (word_data.get("phrasal_verbs") and word_data.get("phrasal_verbs", "").strip()) or
-                    (word_data.get("word_forms") and word_data.get("word_forms")) or
-                    (word_data.get("synonyms") and len(word_data.get("synonyms", [])) > 0) or
-                    (word_data.get("usage_notes") and word_data.get("usage_notes", "").strip())
-                )
-                if has_details:
+                if has_vocab_details(word_data):
                     skipped += 1
                     logger.debug(f"[{idx+1}/{total}] SKIP {word} (level {level_val}) - already has details")
                     continue
@@ -203,7 +386,7 @@ def process_vocabulary(level: Optional[str] = None, limit: Optional[int] = None,
                 logger.warning(f"  -> Failed to update database")
         
         logger.info(f"\n{'='*60}")
-        logger.info(f"Summary:")
+        logger.info("Summary:")
         logger.info(f"  Total words: {total}")
         logger.info(f"  Processed: {processed}")
         logger.info(f"  Updated: {updated}")
@@ -237,6 +420,9 @@ Examples:
   
   # Process all levels starting from index 100
   python scripts/generate_vocabulary_details.py --start 100
+  
+  # Batched mode: 10 words per request, 4 concurrent requests, resumable checkpoint
+  python scripts/generate_vocabulary_details.py --batch-size 10 --workers 4
         """
     )
     parser.add_argument("--level", type=str, choices=["A1", "A2", "B1", "B2", "C1", "C2"], 
@@ -246,6 +432,13 @@ Examples:
     parser.add_argument("--all", action="store_true", 
                        help="Process all words including those with details (default: skip words with details)")
     
+    parser.add_argument("--batch-size", type=int, default=1,
+                       help="Words per AI request; > 1 enables batched mode (default: 1)")
+    parser.add_argument("--workers", type=int, default=4,
+                       help="Concurrent AI requests in batched mode (default: 4)")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                       help=f"Checkpoint file for batched mode (default: {DEFAULT_CHECKPOINT_FILE})")
+    
     args = parser.parse_args()
     
     if args.level:
@@ -257,5 +450,8 @@ Examples:
         level=args.level,
         limit=args.limit,
         start_from=args.start,
-        only_missing=not args.all
+        only_missing=not args.all,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint
     )
@@ -0,0 +1,281 @@
+"""
+Script to pre-warm the TTS audio cache (TTSAudioCache + Supabase Storage) so pages
+almost always get cache hits instead of live edge-tts synthesis.
+
+Sources:
+- Vocabulary: word + example sentence
+- AIExercises: cached dictation sentences
+
+Each text is synthesized for every configured voice. Hashes already in TTSAudioCache
+are skipped (hashes done in the checkpoint are re-checked, cache GC may have removed them); the rest run with bounded concurrency, a
+request-rate cap and a cool-down when edge-tts starts failing (rate limiting).
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.database import supabase
+from core.tts import text_to_speech
+from services.tts_cache_service import generate_text_hash, cache_audio
+from scripts.checkpoint import Checkpoint
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_prewarm_checkpoint.json")
+DEFAULT_VOICES = ["en-US-AriaNeural"]  # Giọng mặc định của get_tts_audio (từ vựng, dictation)
+SOURCES = ("words", "examples", "dictation")
+PAGE_SIZE = 1000          # Supabase trả tối đa 1000 dòng mỗi request
+HASH_LOOKUP_CHUNK = 200   # Số text_hash mỗi query kiểm tra TTSAudioCache
+MAX_FAILED_ATTEMPTS = 3   # Bỏ qua item đã lỗi ngần này lần ở các lần chạy trước
+FAILURE_COOLDOWN_SECONDS = 30
+FAILURE_STREAK_LIMIT = 5  # Số lỗi liên tiếp trước khi tạm dừng (nhiều khả năng bị rate limit)
+SAVE_EVERY = 20           # Lưu checkpoint sau mỗi N item
+
+
+def _fetch_all(query_builder) -> List[Dict]:
+    """Đọc hết các trang của một query (range theo PAGE_SIZE)."""
+    rows = []
+    start = 0
+    while True:
+        result = query_builder().range(start, start + PAGE_SIZE - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def collect_texts(sources=SOURCES, level: Optional[str] = None) -> List[str]:
+    """Các text cần audio (đã bỏ trùng, giữ thứ tự)."""
+    texts = []
+
+    if "words" in sources or "examples" in sources:
+        def vocab_query():
+            query = supabase.table("Vocabulary").select("word, example").order("id")
+            return query.eq("level", level) if level else query
+        for row in _fetch_all(vocab_query):
+            if "words" in sources and row.get("word"):
+                texts.append(row["word"])
+            example = row.get("example")
+            if "examples" in sources and example and example != "N/A":
+                texts.append(example)
+
+    if "dictation" in sources:
+        def dictation_query():
+            query = supabase.table("AIExercises").select("exercise_data").eq("exercise_type", "dictation").order("id")
+            return query.eq("level", level) if level else query
+        for row in _fetch_all(dictation_query):
+            text = (row.get("exercise_data") or {}).get("text")
+            if text:
+                texts.append(text)
+
+    seen = set()
+    unique = []
+    for text in texts:
+        text = text.strip()
+        if text and text not in seen:
+            seen.add(text)
+            unique.append(text)
+    return unique
+
+
+def find_cached_hashes(hashes: List[str], assume_cached: Optional[set] = None) -> set:
+    """
+    text_hash đã có trong TTSAudioCache (query theo từng lô).
+
+    Args:
+        hashes: Các text_hash cần kiểm tra
+        assume_cached: Lô query lỗi thì các hash thuộc tập này vẫn được coi là đã cache
+            (vd: done trong checkpoint) thay vì tạo lại
+    """
+    cached = set()
+    for i in range(0, len(hashes), HASH_LOOKUP_CHUNK):
+        chunk = hashes[i:i + HASH_LOOKUP_CHUNK]
+        try:
+            result = supabase.table("TTSAudioCache").select("text_hash").in_("text_hash", chunk).execute()
+            cached.update(row["text_hash"] for row in (result.data or []))
+        except Exception as e:
+            logger.warning(f"Could not check cached hashes (will re-check on synth): {e}")
+            if assume_cached:
+                cached.update(h for h in chunk if h in assume_cached)
+    return cached
+
+
+class RateLimiter:
+    """Giới hạn số request bắt đầu mỗi giây + tạm dừng khi lỗi liên tiếp."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._failure_streak = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        await asyncio.sleep(max(0.0, slot - now))
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            self._failure_streak = 0
+            return
+        self._failure_streak += 1
+        if self._failure_streak >= FAILURE_STREAK_LIMIT:
+            logger.warning(f"{self._failure_streak} failures in a row, cooling down {FAILURE_COOLDOWN_SECONDS}s")
+            self._paused_until = time.monotonic() + FAILURE_COOLDOWN_SECONDS
+            self._failure_streak = 0
+
+
+async def _prewarm_item(text: str, voice: str, semaphore: asyncio.Semaphore, limiter: RateLimiter) -> bool:
+    async with semaphore:
+        await limiter.acquire()
+        # use_cache=False: đã biết item chưa có trong cache, không cần tải thử từ Storage
+        audio = await text_to_speech(text, voice, use_cache=False)
+        ok = bool(audio)
+        if ok:
+            ok = await asyncio.to_thread(cache_audio, text, voice, audio) is not None
+        limiter.record(ok)
+        return ok
+
+
+async def prewarm(items: List[Tuple[str, str, str]], checkpoint: Checkpoint, workers: int,
+                  requests_per_second: float) -> Tuple[int, int]:
+    """Tạo + cache audio cho items (text, voice, text_hash). Trả về (ok, failed)."""
+    semaphore = asyncio.Semaphore(max(1, workers))
+    limiter = RateLimiter(requests_per_second)
+    ok_count = 0
+    failed_count = 0
+
+    async def _run(item):
+        text, voice, text_hash = item
+        try:
+            return item, await _prewarm_item(text, voice, semaphore, limiter)
+        except Exception as e:
+            logger.error(f"Pre-warm failed for '{text[:40]}' ({voice}): {e}")
+            return item, False
+
+    tasks = [asyncio.create_task(_run(item)) for item in items]
+    for done_idx, task in enumerate(asyncio.as_completed(tasks), start=1):
+        (text, voice, text_hash), ok = await task
+        if ok:
+            ok_count += 1
+            checkpoint.mark_done([text_hash])
+        else:
+            failed_count += 1
+            checkpoint.mark_failed([text_hash])
+        if done_idx % SAVE_EVERY == 0 or done_idx == len(tasks):
+            checkpoint.save()
+            logger.info(f"[{done_idx}/{len(tasks)}] cached {ok_count}, failed {failed_count}")
+    return ok_count, failed_count
+
+
+def prewarm_tts_cache(voices: Optional[List[str]] = None, sources=SOURCES, level: Optional[str] = None,
+                      limit: Optional[int] = None, workers: int = 4, requests_per_second: float = 4.0,
+                      checkpoint_path: Optional[str] = None, dry_run: bool = False) -> None:
+    """
+    Pre-warm TTS cache.
+
+    Args:
+        voices: Các giọng cần tạo (default: DEFAULT_VOICES)
+        sources: Nguồn text ('words', 'examples', 'dictation')
+        level: Chỉ lấy level này (None = tất cả)
+        limit: Số item tối đa cần tạo trong lần chạy này
+        workers: Số request edge-tts song song
+        requests_per_second: Số request tối đa bắt đầu mỗi giây
+        checkpoint_path: File checkpoint (default: scripts/tts_prewarm_checkpoint.json)
+        dry_run: Chỉ đếm số item còn thiếu, không tạo audio
+    """
+    if not supabase:
+        logger.error("Supabase is not configured")
+        return
+
+    voices = voices or DEFAULT_VOICES
+    checkpoint = Checkpoint(checkpoint_path or DEFAULT_CHECKPOINT_FILE)
+
+    texts = collect_texts(sources, level)
+    items = [(text, voice, generate_text_hash(text, voice)) for text in texts for voice in voices]
+    logger.info(f"Collected {len(texts)} texts x {len(voices)} voices = {len(items)} items")
+
+    # TTSAudioCache là nguồn chính: hash done trong checkpoint vẫn được kiểm tra lại vì
+    # GC (scripts/gc_tts_cache.py) có thể đã xóa clip; checkpoint chỉ dùng để bỏ item lỗi mãi
+    pending = [i for i in items if checkpoint.failed.get(i[2], 0) < MAX_FAILED_ATTEMPTS]
+    skipped_checkpoint = len(items) - len(pending)
+    cached = find_cached_hashes([i[2] for i in pending], assume_cached=checkpoint.done)
+    evicted = [i[2] for i in pending if i[2] in checkpoint.done and i[2] not in cached]
+    checkpoint.discard_done(evicted)
+    checkpoint.mark_done(sorted(cached))
+    pending = [i for i in pending if i[2] not in cached]
+    if limit:
+        pending = pending[:limit]
+
+    logger.info(f"Already cached: {len(cached)}, removed from cache since last run: {len(evicted)}, "
+                f"skipped after {MAX_FAILED_ATTEMPTS} failures: {skipped_checkpoint}, to synthesize: {len(pending)}")
+    if dry_run or not pending:
+        checkpoint.save()
+        return
+
+    started = time.time()
+    ok_count, failed_count = asyncio.run(prewarm(pending, checkpoint, workers, requests_per_second))
+
+    logger.info(f"\n{'='*60}")
+    logger.info("Summary:")
+    logger.info(f"  Items: {len(items)}")
+    logger.info(f"  Already cached: {len(cached)}")
+    logger.info(f"  Skipped (failed too often): {skipped_checkpoint}")
+    logger.info(f"  Cached now: {ok_count}")
+    logger.info(f"  Failed: {failed_count}")
+    logger.info(f"  Time: {time.time() - started:.1f}s")
+    logger.info(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Pre-warm TTS audio cache for vocabulary words, examples and dictation sentences",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # All sources, default voice
+  python scripts/prewarm_tts_cache.py
+
+  # Only A1 words, two voices, count what is missing
+  python scripts/prewarm_tts_cache.py --level A1 --sources words --voices en-US-AriaNeural en-US-GuyNeural --dry-run
+
+  # Slower run to stay under edge-tts rate limits
+  python scripts/prewarm_tts_cache.py --workers 2 --rps 1
+        """
+    )
+    parser.add_argument("--voices", nargs="+", default=DEFAULT_VOICES, help=f"Voices (default: {DEFAULT_VOICES})")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=list(SOURCES),
+                       help="Text sources (default: all)")
+    parser.add_argument("--level", type=str, choices=["A1", "A2", "B1", "B2", "C1", "C2"],
+                       help="Process only this level (default: all levels)")
+    parser.add_argument("--limit", type=int, help="Maximum number of items to synthesize (default: all)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent edge-tts requests (default: 4)")
+    parser.add_argument("--rps", type=float, default=4.0, help="Max requests started per second (default: 4)")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                       help=f"Checkpoint file (default: {DEFAULT_CHECKPOINT_FILE})")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many items are missing")
+
+    args = parser.parse_args()
+
+    prewarm_tts_cache(
+        voices=args.voices,
+        sources=args.sources,
+        level=args.level,
+        limit=args.limit,
+        workers=args.workers,
+        requests_per_second=args.rps,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run
+    )
@@ -0,0 +1,204 @@
+"""
+Activity Log Writer
+Ghi ActivityLog nền theo lô để việc log không chặn rerun của user.
+
+- enqueue_activity_log: đưa row vào hàng đợi (bounded) rồi trả về ngay
+- Daemon thread insert theo lô mỗi FLUSH_INTERVAL_SECONDS hoặc khi đủ BATCH_SIZE rows
+- Lỗi insert được retry với backoff; lô vẫn lỗi thì thử từng row để 1 row hỏng không làm mất cả lô
+- Hàng đợi đầy -> insert đồng bộ ngay trong request (không bỏ row)
+- atexit flush các row còn trong hàng đợi khi process tắt
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core.database import supabase
+from core.timezone_utils import get_vn_now_utc
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_LOG_ASYNC = os.getenv("ACTIVITY_LOG_ASYNC", "1") == "1"
+QUEUE_MAX_SIZE = 5000
+BATCH_SIZE = 100                 # Số row tối đa mỗi lần insert
+FLUSH_INTERVAL_SECONDS = 0.5     # Row chờ tối đa bấy nhiêu giây trước khi được ghi
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5      # 0.5s, 1s, 2s
+SHUTDOWN_FLUSH_TIMEOUT = 10
+
+
+def _insert_rows(rows: List[Dict[str, Any]]) -> None:
+    """Insert 1 lô; các row cùng tập cột được gửi chung 1 request (PostgREST yêu cầu cùng key)."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        supabase.table("ActivityLog").insert(group).execute()
+
+
+class ActivityLogWriter:
+    """Hàng đợi ActivityLog + daemon thread ghi theo lô."""
+
+    def __init__(self, max_size: int = QUEUE_MAX_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._batch: List[Dict[str, Any]] = []   # Lô worker đang gom/ghi (chưa có trong DB)
+        self.written_count = 0
+        self.failed_count = 0
+        self.sync_fallback_count = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """
+        Đưa row vào hàng đợi.
+
+        Returns:
+            True nếu row đã được xếp hàng hoặc ghi (đồng bộ khi hàng đợi đầy), False nếu ghi lỗi
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.sync_fallback_count += 1
+            return self._write([row])
+
+    def count_pending(self, user_id: int, action_type: Optional[str] = None, failed_only: bool = False) -> int:
+        """Số row của user (lọc theo action_type / value=0) đã xếp hàng nhưng chưa có trong DB."""
+        with self._queue.mutex:
+            rows = [item for item in self._queue.queue if isinstance(item, dict)]
+        rows += list(self._batch)
+        return sum(
+            1 for row in rows
+            if row.get("user_id") == user_id
+            and (action_type is None or row.get("action_type") == action_type)
+            and (not failed_only or row.get("value") == 0)
+        )
+
+    def flush(self, timeout: float = SHUTDOWN_FLUSH_TIMEOUT) -> bool:
+        """Chờ tới khi mọi row đã xếp hàng trước lời gọi này được ghi. True nếu xong trong timeout."""
+        if not self._thread or not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self) -> None:
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if self._batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, threading.Event):
+                # Marker của flush(): ghi phần đang gom rồi báo xong
+                self._write(self._batch)
+                self._batch = []
+                item.set()
+                continue
+            if item is not None:
+                if not self._batch:
+                    deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+                self._batch.append(item)
+            if self._batch and (item is None or len(self._batch) >= BATCH_SIZE or time.monotonic() >= deadline):
+                self._write(self._batch)
+                self._batch = []
+
+    def _write(self, rows: List[Dict[str, Any]]) -> bool:
+        if not rows:
+            return True
+        for attempt in range(MAX_RETRIES):
+            try:
+                _insert_rows(rows)
+                self.written_count += len(rows)
+                return True
+            except Exception as e:
+                if attempt < MAX_RETRIES - 1:
+                    wait = RETRY_BACKOFF_SECONDS * (2 ** attempt)
+                    logger.debug(f"ActivityLog batch insert failed ({e}), retrying in {wait}s")
+                    time.sleep(wait)
+                else:
+                    logger.warning(f"ActivityLog batch insert failed after {MAX_RETRIES} attempts: {e}")
+
+        if len(rows) == 1:
+            self.failed_count += 1
+            return False
+        # Có thể chỉ 1 row lỗi (vd: user_id không tồn tại) -> ghi từng row
+        ok = True
+        for row in rows:
+            try:
+                _insert_rows([row])
+                self.written_count += 1
+            except Exception as e:
+                self.failed_count += 1
+                ok = False
+                logger.error(f"Dropping ActivityLog row {row.get('action_type')} for user {row.get('user_id')}: {e}")
+        return ok
+
+
+_writer: Optional[ActivityLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_activity_log_writer() -> ActivityLogWriter:
+    """ActivityLogWriter dùng chung cho process (flush khi process tắt)."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ActivityLogWriter()
+                atexit.register(_writer.flush)
+    return _writer
+
+
+def enqueue_activity_log(row: Dict[str, Any]) -> bool:
+    """
+    Ghi 1 row ActivityLog mà không chờ database.
+    created_at được gán lúc gọi để thời điểm log không bị lệch theo độ trễ của lô.
+
+    Args:
+        row: Dict các cột ActivityLog (user_id, action_type, value, metadata, ...)
+
+    Returns:
+        True nếu đã xếp hàng/ghi, False nếu không có database hoặc ghi đồng bộ lỗi
+    """
+    if not supabase:
+        return False
+    row = {**row, "created_at": row.get("created_at") or get_vn_now_utc()}
+    if not ACTIVITY_LOG_ASYNC:
+        try:
+            _insert_rows([row])
+            return True
+        except Exception as e:
+            logger.error(f"ActivityLog insert error: {e}")
+            return False
+    return get_activity_log_writer().enqueue(row)
+
+
+def count_pending_activity_logs(user_id: int, action_type: Optional[str] = None, failed_only: bool = False) -> int:
+    """Số row ActivityLog của user còn nằm trong hàng đợi (DB count chưa thấy các row này)."""
+    if _writer is None:
+        return 0
+    return _writer.count_pending(user_id, action_type, failed_only)
+
+
+def flush_activity_log(timeout: float = SHUTDOWN_FLUSH_TIMEOUT) -> bool:
+    """Chờ các row đang xếp hàng được ghi xong (dùng cho benchmark/test và lúc tắt)."""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
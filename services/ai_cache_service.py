@@ -6,6 +6,7 @@ import json
 from typing import Optional, Dict, Any
 from core.database import supabase
 from core.timezone_utils import get_vn_now_utc
+from core.prompts import normalize_whitespace
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,16 +15,34 @@ def generate_cache_key(prompt: str, feature_type: str = 'general') -> str:
     """
     Tạo cache key từ prompt và feature_type
     
+    - Prompt render từ template (core.prompts.RenderedPrompt): key = template@version + params
+      đã chuẩn hóa, không phụ thuộc feature_type hay page gọi
+    - Prompt thô: key = feature_type + prompt đã gộp khoảng trắng (indent khác nhau vẫn hit)
+    
     Args:
         prompt: Prompt text
         feature_type: Loại feature (listening, speaking, reading, writing, etc.)
     
     Returns:
-        str: MD5 hash của prompt + feature_type
+        str: MD5 hash của prompt đã chuẩn hóa
     """
-    combined = f"{feature_type}:{prompt}".encode('utf-8')
+    canonical_key = getattr(prompt, 'canonical_key', None)
+    if canonical_key:
+        combined = f"tpl:{canonical_key()}".encode('utf-8')
+    else:
+        combined = f"{feature_type}:{normalize_whitespace(prompt)}".encode('utf-8')
     return hashlib.md5(combined).hexdigest()
 
+def generate_prompt_hash(prompt: str) -> str:
+    """
+    Giá trị cột prompt_hash: 'tpl:<template_id>@v<version>' cho prompt có template
+    (để invalidate theo template), MD5 của prompt cho prompt thô.
+    """
+    template_tag = getattr(prompt, 'template_tag', None)
+    if template_tag:
+        return f"tpl:{template_tag}"
+    return hashlib.md5(prompt.encode('utf-8')).hexdigest()
+
 def get_cached_response(prompt: str, feature_type: str = 'general') -> Optional[Dict[str, Any]]:
     """
     Lấy cached response từ database
@@ -86,7 +105,7 @@ def cache_response(prompt: str, response: Any, feature_type: str = 'general') ->
     
     try:
         cache_key = generate_cache_key(prompt, feature_type)
-        prompt_hash = hashlib.md5(prompt.encode('utf-8')).hexdigest()
+        prompt_hash = generate_prompt_hash(prompt)
         
         # Convert response to JSON-compatible format
         try:
@@ -161,3 +180,25 @@ def clear_old_cache(days_old: int = 30) -> int:
     except Exception as e:
         logger.error(f"Failed to clear old cache: {e}")
         return 0
+
+def invalidate_template(template_id: str, version: Optional[int] = None) -> int:
+    """
+    Xóa cache của một prompt template (một version cụ thể hoặc tất cả version)
+    
+    Returns:
+        int: Số lượng entries đã xóa
+    """
+    if not supabase:
+        return 0
+    
+    try:
+        query = supabase.table("AICache").delete()
+        if version is not None:
+            query = query.eq("prompt_hash", f"tpl:{template_id}@v{version}")
+        else:
+            query = query.like("prompt_hash", f"tpl:{template_id}@v%")
+        result = query.execute()
+        return len(result.data) if result.data else 0
+    except Exception as e:
+        logger.error(f"Failed to invalidate template cache {template_id}: {e}")
+        return 0
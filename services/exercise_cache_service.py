@@ -7,9 +7,11 @@ import json
 import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta, timezone
+import streamlit as st
 from core.database import supabase
 from core.timezone_utils import get_vn_now_utc, VN_TIMEZONE
 import random
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +42,13 @@ VALID_TOPICS = [
     "Weather", "Animals", "Plants", "Exploration", "Random"
 ]
 
+# Bài chưa hoàn thành chỉ được gặp lại sau khoảng này (tránh học vẹt)
+SEEN_COOLDOWN_HOURS = 24
+
+PAGE_SIZE = 1000           # PostgREST max-rows mặc định: query lớn hơn phải phân trang bằng range
+SAMPLE_PROBE_WINDOW = 50   # Số id đọc ở mỗi offset ngẫu nhiên (fallback khi không có RPC)
+SAMPLE_MAX_PROBES = 3      # Số offset ngẫu nhiên thử trước khi quét toàn bộ id
+
 # Mapping từ English (database) sang Vietnamese (display)
 TOPIC_DISPLAY_MAPPING = {
     # Daily Life
@@ -126,6 +135,103 @@ def get_topic_display_name(english_topic):
     """Lấy Vietnamese display name từ English topic."""
     return TOPIC_DISPLAY_MAPPING.get(english_topic, english_topic)
 
+def _note_demand(user_id, exercise_type, level, topic, pool_miss=False):
+    """Báo nhu cầu cho background replenisher (services.exercise_pool_service)."""
+    from services.exercise_pool_service import note_exercise_demand
+    note_exercise_demand(user_id, exercise_type, level, topic if topic in VALID_TOPICS else None, pool_miss=pool_miss)
+
+def _cooldown_cutoff() -> str:
+    """Mốc thời gian (UTC ISO) - bài chưa hoàn thành seen sau mốc này vẫn bị loại."""
+    return (datetime.now(VN_TIMEZONE) - timedelta(hours=SEEN_COOLDOWN_HOURS)).astimezone(timezone.utc).isoformat()
+
+class SeenExerciseFilter:
+    """
+    Bộ lọc bài đã thấy của 1 user, giữ trong session để không tải lại UserExerciseHistory
+    mỗi lần lấy bài:
+    - completed: set id bài đã hoàn thành (luôn loại)
+    - seen: {id: seen_at} bài chưa hoàn thành (loại nếu seen_at trong SEEN_COOLDOWN_HOURS)
+    Khi tải, bài chưa hoàn thành đã quá cooldown không được đưa vào seen (bộ lọc chỉ giữ
+    phần lịch sử còn có tác dụng).
+    """
+
+    def __init__(self, history: Optional[List[Dict[str, Any]]] = None):
+        self.completed: set = set()
+        self.seen: Dict[int, str] = {}
+        cutoff = _cooldown_cutoff()
+        for record in history or []:
+            exercise_id = record.get('exercise_id')
+            if record.get('completed', False):
+                self.completed.add(exercise_id)
+            elif record.get('seen_at') and record['seen_at'] >= cutoff:
+                self.seen[exercise_id] = record['seen_at']
+
+    def mark_seen(self, exercise_id: int, seen_at: str) -> None:
+        # Giống upsert trong DB: đánh dấu seen đặt lại completed=False
+        self.completed.discard(exercise_id)
+        self.seen[exercise_id] = seen_at
+
+    def mark_completed(self, exercise_id: int) -> None:
+        self.seen.pop(exercise_id, None)
+        self.completed.add(exercise_id)
+
+    def is_excluded(self, exercise_id: int, cutoff: Optional[str] = None) -> bool:
+        if exercise_id in self.completed:
+            return True
+        seen_at = self.seen.get(exercise_id)
+        return bool(seen_at) and seen_at >= (cutoff or _cooldown_cutoff())
+
+def _fetch_all_pages(build_query) -> List[Dict[str, Any]]:
+    """Đọc hết các trang của query (build_query() phải có order ổn định)."""
+    rows = []
+    start = 0
+    while True:
+        page = build_query().range(start, start + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+def _seen_filter_key(user_id: int) -> str:
+    return f"seen_exercises_{user_id}"
+
+def get_seen_filter(user_id: int) -> SeenExerciseFilter:
+    """
+    Bộ lọc bài đã thấy của user: tải UserExerciseHistory 1 lần mỗi session,
+    sau đó được cập nhật tại chỗ bởi mark_exercise_seen/mark_exercise_completed.
+    """
+    key = _seen_filter_key(user_id)
+    try:
+        cached = st.session_state.get(key)
+        if isinstance(cached, SeenExerciseFilter):
+            return cached
+    except Exception:
+        cached = None
+    
+    history = _fetch_all_pages(
+        lambda: supabase.table("UserExerciseHistory").select("exercise_id, completed, seen_at")
+        .eq("user_id", user_id).order("exercise_id")
+    )
+    seen_filter = SeenExerciseFilter(history)
+    try:
+        st.session_state[key] = seen_filter
+    except Exception as e:
+        logger.debug(f"Cannot store seen filter in session (non-critical): {e}")
+    return seen_filter
+
+def _update_seen_filter(user_id: int, exercise_ids: List[int], completed: bool = False, seen_at: Optional[str] = None) -> None:
+    """Cập nhật bộ lọc trong session (nếu đã tải) sau khi ghi UserExerciseHistory."""
+    try:
+        seen_filter = st.session_state.get(_seen_filter_key(user_id))
+    except Exception:
+        return
+    if not isinstance(seen_filter, SeenExerciseFilter):
+        return
+    for exercise_id in exercise_ids:
+        if completed:
+            seen_filter.mark_completed(exercise_id)
+        else:
+            seen_filter.mark_seen(exercise_id, seen_at or get_vn_now_utc())
+
 def get_unseen_exercise(
     user_id: int,
     exercise_type: str,
@@ -149,82 +255,195 @@ def get_unseen_exercise(
     Returns:
         Dict với keys: 'id', 'exercise_data', 'metadata' hoặc None
     """
-    if not supabase or not user_id or not exercise_type or not level:
-        return None
+    exercises = get_unseen_exercises(user_id, exercise_type, level, topic, n=1, mark_seen=False)
+    return exercises[0] if exercises else None
+
+def get_unseen_exercises(
+    user_id: int,
+    exercise_type: str,
+    level: str,
+    topic: Optional[str] = None,
+    n: int = 1,
+    mark_seen: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Lấy tối đa n bài tập khác nhau chưa thấy (cùng logic loại trừ như get_unseen_exercise)
+    với 1 lần tải history + 1 query ứng viên, thay vì gọi get_unseen_exercise n lần.
+    
+    Args:
+        user_id: User ID
+        exercise_type: Loại bài tập
+        level: Trình độ
+        topic: Topic name (must be from VALID_TOPICS) hoặc None
+        n: Số bài tập cần lấy
+        mark_seen: True -> đánh dấu đã thấy bằng 1 batched upsert (mark_exercises_seen)
+    
+    Returns:
+        List các dict {'id', 'exercise_data', 'metadata'} (có thể ít hơn n, rỗng nếu hết bài)
+    """
+    if not supabase or not user_id or not exercise_type or not level or n <= 0:
+        return []
+    
+    # Topic filter: exact match or NULL (invalid topic -> NULL)
+    topic_filter = topic if topic and topic in VALID_TOPICS else None
     
     try:
-        # Build query: Get exercises matching type, level, topic
-        query = supabase.table("AIExercises").select(
-            "id, exercise_data, metadata, usage_count"
-        ).eq("exercise_type", exercise_type).eq("level", level)
+        # 1. RPC: anti-join + random pick trên server, chỉ trả về n dòng
+        picked = _sample_unseen_via_rpc(user_id, exercise_type, level, topic_filter, n)
+        if picked is None:
+            # 2. Fallback: id-index (chỉ tải cột id), chọn ngẫu nhiên rồi lấy nội dung n bài đã chọn
+            picked = _sample_unseen_via_id_index(user_id, exercise_type, level, topic_filter, n)
         
-        # Topic filter: exact match or NULL
-        if topic and topic in VALID_TOPICS:
-            query = query.eq("topic", topic)
-        elif topic is None:
-            query = query.is_("topic", "null")
-        else:
-            # Invalid topic, fallback to NULL
-            query = query.is_("topic", "null")
-        
-        # Calculate 1 day ago in UTC (for comparison with seen_at)
-        one_day_ago = (datetime.now(VN_TIMEZONE) - timedelta(days=1)).astimezone(timezone.utc).isoformat()
-        
-        # Exclude exercises user should not see again:
-        # 1. Completed exercises (completed=TRUE)
-        # 2. Incomplete exercises seen within last 24 hours (completed=FALSE AND seen_at >= one_day_ago)
-        # This prevents users from "memorizing" exercises by repeating them too quickly
-        
-        # Get exercise_ids to exclude
-        history_query = supabase.table("UserExerciseHistory").select("exercise_id, completed, seen_at").eq("user_id", user_id)
-        history_result = history_query.execute()
-        
-        exclude_ids = []
-        if history_result.data:
-            for record in history_result.data:
-                exercise_id = record.get('exercise_id')
-                completed = record.get('completed', False)
-                seen_at = record.get('seen_at')
-                
-                # Always exclude completed exercises
-                if completed:
-                    exclude_ids.append(exercise_id)
-                # Exclude incomplete exercises seen within last 24 hours
-                elif seen_at and seen_at >= one_day_ago:
-                    exclude_ids.append(exercise_id)
-        
-        if exclude_ids:
-            query = query.not_.in_("id", exclude_ids)
-        
-        # Get all matching exercises
-        result = query.execute()
-        
-        if result.data and len(result.data) > 0:
-            # Random select 1 exercise
-            exercise = random.choice(result.data)
-            
-            # Update usage_count
-            try:
-                supabase.table("AIExercises").update({
-                    "usage_count": (exercise.get('usage_count', 0) + 1),
-                    "updated_at": get_vn_now_utc()
-                }).eq("id", exercise['id']).execute()
-            except Exception as e:
-                logger.warning(f"Failed to update usage_count: {e}")
+        if picked:
+            _increment_usage_counts(picked)
+            if mark_seen:
+                mark_exercises_seen(user_id, [e['id'] for e in picked])
             
-            return {
-                'id': exercise['id'],
-                'exercise_data': exercise['exercise_data'],
-                'metadata': exercise.get('metadata', {})
-            }
+            _note_demand(user_id, exercise_type, level, topic, pool_miss=len(picked) < n)
+            return [
+                {
+                    'id': e['id'],
+                    'exercise_data': e['exercise_data'],
+                    'metadata': e.get('metadata', {})
+                }
+                for e in picked
+            ]
         
-        # No unseen exercises found
-        return None
+        # No unseen exercises found -> báo background replenisher bổ sung kho
+        _note_demand(user_id, exercise_type, level, topic, pool_miss=True)
+        return []
         
     except Exception as e:
-        logger.error(f"Error getting unseen exercise: {e}")
+        logger.error(f"Error getting unseen exercises: {e}")
+        return []
+
+# None = chưa biết; False = DB chưa có RPC sample_unseen_exercises (không thử lại trong process này)
+_sample_rpc_available: Optional[bool] = None
+# Lỗi tạm thời (timeout, mất kết nối...) chỉ tắt RPC trong SAMPLE_RPC_RETRY_SECONDS rồi thử lại
+SAMPLE_RPC_RETRY_SECONDS = 60
+_sample_rpc_retry_at = 0.0
+
+def _is_missing_function_error(error: Exception) -> bool:
+    """PostgREST báo function chưa tồn tại (PGRST202 / 'does not exist')"""
+    message = str(error).lower()
+    return 'pgrst202' in message or 'does not exist' in message or 'could not find the function' in message
+
+def _sample_unseen_via_rpc(
+    user_id: int,
+    exercise_type: str,
+    level: str,
+    topic: Optional[str],
+    n: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Gọi RPC sample_unseen_exercises: anti-join với UserExerciseHistory (completed hoặc
+    seen trong SEEN_COOLDOWN_HOURS) và random pick ngay trên DB.
+    
+    Chữ ký RPC (migration chưa có trong repo; thiếu RPC thì dùng _sample_unseen_via_id_index):
+        sample_unseen_exercises(p_user_id bigint, p_exercise_type text, p_level text,
+                                p_topic text, p_limit int, p_cooldown_hours int)
+        RETURNS SETOF (id, exercise_data, metadata, usage_count) -- từ AIExercises
+        SELECT ... FROM "AIExercises" e
+        WHERE e.exercise_type = p_exercise_type AND e.level = p_level
+          AND e.topic IS NOT DISTINCT FROM p_topic
+          AND NOT EXISTS (SELECT 1 FROM "UserExerciseHistory" h
+                          WHERE h.user_id = p_user_id AND h.exercise_id = e.id
+                            AND (h.completed OR h.seen_at >= now() - make_interval(hours => p_cooldown_hours)))
+        ORDER BY random() LIMIT p_limit
+    
+    Returns:
+        List bài tập đã chọn (có thể rỗng) hoặc None nếu RPC không dùng được
+    """
+    global _sample_rpc_available, _sample_rpc_retry_at
+    if _sample_rpc_available is False or time.monotonic() < _sample_rpc_retry_at:
+        return None
+    try:
+        result = supabase.rpc('sample_unseen_exercises', {
+            'p_user_id': int(user_id),
+            'p_exercise_type': exercise_type,
+            'p_level': level,
+            'p_topic': topic,
+            'p_limit': n,
+            'p_cooldown_hours': SEEN_COOLDOWN_HOURS
+        }).execute()
+        _sample_rpc_available = True
+        return [e for e in (result.data or []) if e.get('exercise_data')]
+    except Exception as e:
+        if _is_missing_function_error(e):
+            _sample_rpc_available = False
+            logger.info(f"RPC sample_unseen_exercises unavailable, using id-index sampling: {e}")
+        else:
+            _sample_rpc_retry_at = time.monotonic() + SAMPLE_RPC_RETRY_SECONDS
+            logger.warning(f"RPC sample_unseen_exercises failed, using id-index sampling for {SAMPLE_RPC_RETRY_SECONDS}s: {e}")
         return None
 
+def _sample_unseen_via_id_index(
+    user_id: int,
+    exercise_type: str,
+    level: str,
+    topic: Optional[str],
+    n: int
+) -> List[Dict[str, Any]]:
+    """
+    Fallback không cần RPC: đếm ứng viên (count exact, không tải rows), đọc vài cửa sổ id nhỏ
+    ở offset ngẫu nhiên, lọc bằng SeenExerciseFilter rồi chỉ lấy exercise_data của n bài đã chọn.
+    User đã thấy gần hết kho (hoặc kho nhỏ) thì quét toàn bộ id theo trang.
+    """
+    def candidates(count: Optional[str] = None):
+        query = supabase.table("AIExercises").select("id", count=count).eq("exercise_type", exercise_type).eq("level", level)
+        query = query.eq("topic", topic) if topic else query.is_("topic", "null")
+        return query.order("id")
+    
+    # Lọc bài đã thấy trong memory (bộ lọc session) thay vì gửi danh sách loại trừ lên DB
+    seen_filter = get_seen_filter(user_id)
+    cutoff = _cooldown_cutoff()
+    
+    def unseen(rows):
+        return {row['id'] for row in rows if not seen_filter.is_excluded(row['id'], cutoff)}
+    
+    total = candidates(count="exact").range(0, 0).execute().count or 0
+    if total == 0:
+        return []
+    
+    candidate_ids: set = set()
+    if total > SAMPLE_PROBE_WINDOW:
+        for _ in range(SAMPLE_MAX_PROBES):
+            offset = random.randrange(total - SAMPLE_PROBE_WINDOW + 1)
+            candidate_ids |= unseen(candidates().range(offset, offset + SAMPLE_PROBE_WINDOW - 1).execute().data or [])
+            if len(candidate_ids) >= n:
+                break
+    if len(candidate_ids) < n:
+        candidate_ids = unseen(_fetch_all_pages(candidates))
+    if not candidate_ids:
+        return []
+    
+    picked_ids = random.sample(sorted(candidate_ids), min(n, len(candidate_ids)))
+    result = supabase.table("AIExercises").select(
+        "id, exercise_data, metadata, usage_count"
+    ).in_("id", picked_ids).execute()
+    return [e for e in (result.data or []) if e.get('exercise_data')]
+
+def _increment_usage_counts(exercises: List[Dict[str, Any]]) -> None:
+    """Tăng usage_count cho các bài đã chọn: 1 RPC cho cả batch, fallback update từng bài."""
+    if not exercises:
+        return
+    try:
+        supabase.rpc('increment_exercise_usage', {
+            'p_exercise_ids': [e['id'] for e in exercises]
+        }).execute()
+        return
+    except Exception as e:
+        logger.debug(f"RPC increment_exercise_usage failed, updating one by one: {e}")
+    
+    for exercise in exercises:
+        try:
+            supabase.table("AIExercises").update({
+                "usage_count": (exercise.get('usage_count', 0) + 1),
+                "updated_at": get_vn_now_utc()
+            }).eq("id", exercise['id']).execute()
+        except Exception as e:
+            logger.warning(f"Failed to update usage_count: {e}")
+
 def save_exercise(
     exercise_type: str,
     level: str,
@@ -300,20 +519,56 @@ def mark_exercise_seen(user_id: int, exercise_id: int) -> bool:
         return False
     
     try:
+        seen_at = get_vn_now_utc()
         # Upsert (insert or update if exists)
         supabase.table("UserExerciseHistory").upsert({
             "user_id": user_id,
             "exercise_id": exercise_id,
-            "seen_at": get_vn_now_utc(),
+            "seen_at": seen_at,
             "completed": False
         }, on_conflict="user_id,exercise_id").execute()
         
+        _update_seen_filter(user_id, [exercise_id], seen_at=seen_at)
         return True
         
     except Exception as e:
         logger.error(f"Error marking exercise as seen: {e}")
         return False
 
+def mark_exercises_seen(user_id: int, exercise_ids: List[int]) -> bool:
+    """
+    Đánh dấu user đã thấy nhiều bài tập bằng 1 batched upsert.
+    
+    Args:
+        user_id: User ID
+        exercise_ids: List exercise IDs
+    
+    Returns:
+        True nếu thành công
+    """
+    exercise_ids = [eid for eid in exercise_ids if eid]
+    if not supabase or not user_id or not exercise_ids:
+        return False
+    
+    try:
+        seen_at = get_vn_now_utc()
+        supabase.table("UserExerciseHistory").upsert([
+            {
+                "user_id": user_id,
+                "exercise_id": exercise_id,
+                "seen_at": seen_at,
+                "completed": False
+            }
+            for exercise_id in exercise_ids
+        ], on_conflict="user_id,exercise_id").execute()
+        
+        _update_seen_filter(user_id, exercise_ids, seen_at=seen_at)
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error marking exercises as seen: {e}")
+        return False
+
 def mark_exercise_completed(user_id: int, exercise_id: int, score: Optional[int] = None) -> bool:
     """
     Đánh dấu user đã hoàn thành bài tập này.
@@ -345,6 +600,7 @@ def mark_exercise_completed(user_id: int, exercise_id: int, score: Optional[int]
             on_conflict="user_id,exercise_id"
         ).execute()
         
+        _update_seen_filter(user_id, [exercise_id], completed=True)
         return True
         
     except Exception as e:
@@ -0,0 +1,306 @@
+"""
+Exercise Pool Service
+Background worker bổ sung bài tập vào AIExercises trước khi user cần, để
+get_unseen_exercise hầu như luôn có bài trong kho (ít phải chờ AI tạo trực tiếp).
+
+- get_unseen_exercise ghi nhận nhu cầu (user nào đang luyện type/level/topic nào)
+- Worker so sánh số bài trong kho với mức mục tiêu (tăng theo số user đang hoạt động)
+  và tạo thêm bài khi thiếu
+- Giới hạn số lần gọi AI mỗi phút; bỏ qua bài trùng nội dung (content_hash)
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Tuple
+
+import streamlit as st
+
+from core.database import supabase
+from core.prompts import render_prompt, normalize_whitespace
+
+logger = logging.getLogger(__name__)
+
+REPLENISHER_ENABLED = os.getenv("EXERCISE_REPLENISHER_ENABLED", "1") == "1"
+
+# Loại bài tập được bổ sung tự động: template prompt, schema và số bài mỗi lần gọi AI
+REPLENISH_TYPES = {
+    "dictation": {"template": "dictation_sentence", "schema": "dictation", "feature_type": "listening"},
+    "comprehension": {"template": "listening_comprehension", "schema": "comprehension", "feature_type": "listening"},
+    "reading_question": {"template": "reading_lesson", "schema": "reading_question", "feature_type": "reading"},
+    "grammar_question": {"template": "grammar_questions", "schema": "grammar_question", "feature_type": "grammar",
+                         "batch_size": 5},
+}
+
+POOL_MIN_DEPTH = 5              # Số bài tối thiểu trong kho cho mỗi (type, level, topic) đang được dùng
+POOL_PER_ACTIVE_USER = 3        # Thêm bấy nhiêu bài cho mỗi user đang hoạt động
+POOL_MAX_DEPTH = 60             # Trần số bài cần giữ sẵn
+ACTIVE_WINDOW_SECONDS = 30 * 60 # User được coi là "đang hoạt động" với key trong khoảng này
+DEPTH_CACHE_SECONDS = 120       # Cache số bài trong kho để không count liên tục
+MAX_GENERATIONS_PER_MINUTE = 6  # Rate limit cho worker (không tranh quota với user)
+IDLE_WAKE_SECONDS = 60          # Worker tự kiểm tra lại các key đang có nhu cầu
+RECENT_HASHES_MAX = 2000        # Số content_hash nhớ trong bộ nhớ để chống trùng nhanh
+
+
+def _content_hash(exercise_type: str, exercise_data: Dict[str, Any]) -> str:
+    """Hash nội dung chính của bài tập (không phân biệt hoa thường/khoảng trắng) để chống trùng."""
+    main_text = (
+        exercise_data.get("text")
+        or exercise_data.get("english_content")
+        or exercise_data.get("question")
+        or str(exercise_data)
+    )
+    normalized = normalize_whitespace(main_text).lower()
+    return hashlib.md5(f"{exercise_type}:{normalized}".encode("utf-8")).hexdigest()
+
+
+class ExercisePoolReplenisher:
+    """Theo dõi nhu cầu theo (exercise_type, level, topic) và tạo bài tập nền bằng một daemon thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._demand: Dict[Tuple, Dict[int, float]] = {}   # key -> {user_id: last_request_ts}
+        self._depth_cache: Dict[Tuple, Tuple[float, int]] = {}
+        self._queue: deque = deque()
+        self._queued: set = set()
+        self._recent_hashes: "OrderedDict[str, None]" = OrderedDict()
+        self._forced: set = set()   # Key có user đã xem hết kho -> tạo thêm dù depth đủ target
+        self._generation_times: deque = deque()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.generated_count = 0
+
+    # --- Demand tracking ---
+    def record_demand(self, user_id: int, exercise_type: str, level: str, topic: Optional[str],
+                      pool_miss: bool = False) -> None:
+        """Ghi nhận user vừa lấy bài; pool_miss=True khi kho không còn bài chưa thấy."""
+        if exercise_type not in REPLENISH_TYPES:
+            return
+        key = (exercise_type, level, topic)
+        with self._lock:
+            self._demand.setdefault(key, {})[user_id] = time.time()
+            if pool_miss:
+                # Kho đã cạn với user này (dù tổng số bài có thể đủ target) -> bắt buộc tạo thêm
+                self._depth_cache.pop(key, None)
+                self._forced.add(key)
+        self.enqueue(key, urgent=pool_miss)
+
+    def active_users(self, key: Tuple) -> int:
+        cutoff = time.time() - ACTIVE_WINDOW_SECONDS
+        with self._lock:
+            users = self._demand.get(key, {})
+            for user_id in [u for u, ts in users.items() if ts < cutoff]:
+                del users[user_id]
+            return len(users)
+
+    def target_depth(self, key: Tuple) -> int:
+        active = self.active_users(key)
+        if active == 0:
+            return 0
+        return min(POOL_MAX_DEPTH, POOL_MIN_DEPTH + POOL_PER_ACTIVE_USER * active)
+
+    # --- Queue ---
+    def enqueue(self, key: Tuple, urgent: bool = False) -> None:
+        with self._lock:
+            if key in self._queued:
+                if urgent:
+                    self._queue.remove(key)
+                    self._queue.appendleft(key)
+            else:
+                self._queued.add(key)
+                if urgent:
+                    self._queue.appendleft(key)
+                else:
+                    self._queue.append(key)
+        self.start()
+        self._wake.set()
+
+    def _pop(self) -> Optional[Tuple]:
+        with self._lock:
+            if not self._queue:
+                return None
+            key = self._queue.popleft()
+            self._queued.discard(key)
+            return key
+
+    # --- Worker ---
+    def start(self) -> None:
+        if not REPLENISHER_ENABLED or not supabase:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="exercise-pool-replenisher", daemon=True)
+            self._thread.start()
+            logger.info("Exercise pool replenisher started")
+
+    def _run(self) -> None:
+        while True:
+            key = self._pop()
+            if key is None:
+                self._wake.wait(IDLE_WAKE_SECONDS)
+                self._wake.clear()
+                # Định kỳ kiểm tra lại mọi key còn user hoạt động
+                with self._lock:
+                    keys = list(self._demand.keys())
+                for k in keys:
+                    if self.active_users(k) > 0:
+                        with self._lock:
+                            if k not in self._queued:
+                                self._queued.add(k)
+                                self._queue.append(k)
+                continue
+            try:
+                self._process(key)
+            except Exception as e:
+                logger.error(f"Exercise replenisher error for {key}: {e}")
+
+    def _process(self, key: Tuple) -> None:
+        with self._lock:
+            forced = key in self._forced
+            self._forced.discard(key)
+        target = self.target_depth(key)
+        depth = self.pool_depth(key)
+        if depth is None or (depth >= target and not forced):
+            return
+
+        self._wait_for_rate_limit()
+        saved = self._generate_and_save(key)
+        with self._lock:
+            self._depth_cache[key] = (time.time(), depth + saved)
+        if depth + saved < target:
+            # Vẫn thiếu -> xếp lại cuối hàng (xoay vòng giữa các key)
+            self.enqueue(key)
+
+    def _wait_for_rate_limit(self) -> None:
+        while True:
+            now = time.time()
+            while self._generation_times and self._generation_times[0] < now - 60:
+                self._generation_times.popleft()
+            if len(self._generation_times) < MAX_GENERATIONS_PER_MINUTE:
+                self._generation_times.append(now)
+                return
+            time.sleep(max(0.5, self._generation_times[0] + 60 - now))
+
+    # --- Pool depth ---
+    def pool_depth(self, key: Tuple) -> Optional[int]:
+        """Số bài trong kho cho key (cache DEPTH_CACHE_SECONDS)."""
+        with self._lock:
+            cached = self._depth_cache.get(key)
+        if cached and time.time() - cached[0] < DEPTH_CACHE_SECONDS:
+            return cached[1]
+
+        exercise_type, level, topic = key
+        try:
+            query = supabase.table("AIExercises").select("id", count="exact") \
+                .eq("exercise_type", exercise_type).eq("level", level)
+            query = query.eq("topic", topic) if topic else query.is_("topic", "null")
+            result = query.limit(1).execute()
+            depth = result.count or 0
+        except Exception as e:
+            logger.warning(f"Failed to count exercise pool {key}: {e}")
+            return None
+
+        with self._lock:
+            self._depth_cache[key] = (time.time(), depth)
+        return depth
+
+    # --- Generation ---
+    def _generate_and_save(self, key: Tuple) -> int:
+        from core.llm import generate_response_with_fallback, parse_json_response
+        from services.exercise_cache_service import save_exercise
+
+        exercise_type, level, topic = key
+        config = REPLENISH_TYPES[exercise_type]
+        params = {"level": level, "topic": topic or "Random"}
+        if config.get("batch_size"):
+            params["count"] = config["batch_size"]
+        prompt = render_prompt(config["template"], **params)
+
+        # use_cache=False: AICache sẽ trả lại đúng nội dung cũ cho cùng prompt
+        # use_session=False: worker thread không có script context / st.session_state
+        res = generate_response_with_fallback(prompt, ["ERROR"], feature_type=config["feature_type"],
+                                              use_cache=False, use_session=False)
+        data = parse_json_response(res, schema=config["schema"])
+        if not data:
+            logger.info(f"Replenisher got no valid exercise for {key}")
+            return 0
+
+        items: List[Dict[str, Any]] = data if isinstance(data, list) else [data]
+        saved = 0
+        for item in items:
+            content_hash = _content_hash(exercise_type, item)
+            if self._is_duplicate(content_hash):
+                continue
+            exercise_id = save_exercise(
+                exercise_type=exercise_type,
+                level=level,
+                topic=topic,
+                exercise_data=item,
+                metadata={"content_hash": content_hash, "source": "replenisher"}
+            )
+            if exercise_id:
+                saved += 1
+                self._remember_hash(content_hash)
+        self.generated_count += saved
+        logger.info(f"Replenisher saved {saved}/{len(items)} exercises for {key}")
+        return saved
+
+    def _remember_hash(self, content_hash: str) -> None:
+        with self._lock:
+            self._recent_hashes[content_hash] = None
+            self._recent_hashes.move_to_end(content_hash)
+            while len(self._recent_hashes) > RECENT_HASHES_MAX:
+                self._recent_hashes.popitem(last=False)
+
+    def _is_duplicate(self, content_hash: str) -> bool:
+        """Hash chỉ được nhớ khi đã chắc là có trong DB (trùng hoặc vừa lưu thành công)."""
+        with self._lock:
+            if content_hash in self._recent_hashes:
+                return True
+        try:
+            result = supabase.table("AIExercises").select("id").eq("metadata->>content_hash", content_hash).limit(1).execute()
+        except Exception as e:
+            logger.debug(f"Duplicate check failed (non-critical): {e}")
+            return False
+        if result.data:
+            self._remember_hash(content_hash)
+            return True
+        return False
+
+    def status(self) -> Dict[str, Any]:
+        """Trạng thái worker (dùng cho admin/debug)."""
+        with self._lock:
+            keys = list(self._demand.keys())
+            queued = len(self._queue)
+            alive = bool(self._thread and self._thread.is_alive())
+        return {
+            "running": alive,
+            "queued": queued,
+            "generated": self.generated_count,
+            "pools": [
+                {"exercise_type": k[0], "level": k[1], "topic": k[2],
+                 "active_users": self.active_users(k), "target_depth": self.target_depth(k),
+                 "depth": (self._depth_cache.get(k) or (None, None))[1]}
+                for k in keys
+            ],
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_exercise_replenisher() -> ExercisePoolReplenisher:
+    """Replenisher dùng chung toàn process."""
+    return ExercisePoolReplenisher()
+
+
+def note_exercise_demand(user_id: int, exercise_type: str, level: str, topic: Optional[str],
+                         pool_miss: bool = False) -> None:
+    """Gọi từ get_unseen_exercise; không bao giờ raise."""
+    if not REPLENISHER_ENABLED or not user_id:
+        return
+    try:
+        get_exercise_replenisher().record_demand(user_id, exercise_type, level, topic, pool_miss=pool_miss)
+    except Exception as e:
+        logger.debug(f"Replenisher demand tracking error (non-critical): {e}")
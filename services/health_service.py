@@ -2,6 +2,7 @@ import streamlit as st
 from core.database import supabase
 from core.llm import generate_response_with_fallback
 from core.tts import get_tts_audio
+from services.activity_log_writer import enqueue_activity_log, flush_activity_log
 import time
 from datetime import datetime
 import logging
@@ -119,12 +120,14 @@ def run_system_benchmark():
         supabase.table("Users").select("id", count="exact").limit(1).execute()
 
     def db_write_test():
-        # Sửa lỗi: Ghi vào cột user_id thay vì username
-        supabase.table("ActivityLog").insert({
+        # Đo đường ghi thật: xếp hàng qua ActivityLog writer rồi chờ lô được insert
+        queued = enqueue_activity_log({
             "action_type": "benchmark_test",
             "value": 1,
             "user_id": admin_user_id
-        }).execute()
+        })
+        if not queued or not flush_activity_log(timeout=10):
+            raise TimeoutError("ActivityLog writer did not flush within 10s")
 
     def ai_gen_test():
         generate_response_with_fallback("Hello", ["ERR"])
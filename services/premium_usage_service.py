@@ -209,6 +209,8 @@ def track_premium_ai_usage(user_id: int, feature_type: str, success: bool = True
         
         # PRIORITY 2: No top-up available or top-up failed → use base subscription limit
         # Track to ActivityLog (this counts against base monthly limit)
+        # Ghi đồng bộ (không qua ActivityLog writer): row này tính vào quota tháng
+        # (get_premium_ai_usage_monthly) nên kết quả trả về phải phản ánh insert thật
         supabase.table("ActivityLog").insert({
             "user_id": user_id,
             "action_type": "ai_call_premium",
@@ -1,10 +1,20 @@
 """
 TTS Audio Cache Service
 Service để cache TTS audio files trong Supabase Storage
+
+Thứ tự tra cache: disk cache local (TTSDiskCache, theo text_hash) -> Supabase Storage.
+Audio tải từ Storage hoặc vừa tạo được ghi xuống disk để lần sau không cần network.
 """
+import atexit
 import hashlib
 import logging
-from typing import Optional, Tuple, Dict, Any
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any, Iterator, List
+from core.audio_encoding import encode_compact_mp3, mp3_duration_seconds
 from core.database import supabase
 from core.timezone_utils import get_vn_now_utc
 
@@ -12,9 +22,152 @@ logger = logging.getLogger(__name__)
 
 BUCKET_NAME = "tts-audio"
 
+# Disk cache local (tắt bằng TTS_DISK_CACHE_MAX_MB=0)
+TTS_DISK_CACHE_DIR = os.getenv("TTS_DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tts_audio_cache"))
+TTS_DISK_CACHE_MAX_BYTES = int(float(os.getenv("TTS_DISK_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+# Bucket private -> phát audio qua signed URL thay vì public file_url
+TTS_SIGNED_URLS = os.getenv("TTS_SIGNED_URLS", "0") == "1"
+TTS_SIGNED_URL_EXPIRES_SECONDS = int(os.getenv("TTS_SIGNED_URL_EXPIRES_SECONDS", "3600"))
+
+# Dung lượng tối đa của bucket tts-audio (run_cache_gc xoá entry ít dùng khi vượt)
+TTS_CACHE_MAX_STORAGE_BYTES = int(float(os.getenv("TTS_CACHE_MAX_STORAGE_MB", "1024")) * 1024 * 1024)
+CACHE_SCAN_PAGE_SIZE = 1000  # Supabase trả tối đa 1000 dòng mỗi request
+CACHE_GC_BATCH_SIZE = 100
+TTS_USAGE_FLUSH_SECONDS = 30      # Lượt dùng cache được ghi lên DB theo lô mỗi khoảng này
+CACHE_USAGE_LOOKUP_CHUNK = 200
+
+class TTSDiskCache:
+    """
+    Cache audio dạng file {text_hash}.mp3 trong 1 thư mục, giới hạn tổng dung lượng
+    max_bytes và xoá file ít dùng nhất (LRU theo mtime) khi vượt giới hạn.
+    Ghi file atomic (file tạm + os.replace) nên không bao giờ đọc phải file ghi dở.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # text_hash -> size, cũ nhất trước
+        self._total_bytes = 0
+        self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, text_hash: str) -> str:
+        return os.path.join(self.directory, f"{text_hash}.mp3")
+
+    def _load_index(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".mp3"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            for _, text_hash, size in sorted(entries):
+                self._index[text_hash] = size
+                self._total_bytes += size
+            self._evict()
+        except OSError as e:
+            logger.warning(f"TTS disk cache disabled, cannot use {self.directory}: {e}")
+            self.max_bytes = 0
+
+    def get(self, text_hash: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if text_hash not in self._index:
+                return None
+            self._index.move_to_end(text_hash)
+        path = self._path(text_hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Giữ thứ tự LRU sau khi restart
+            return data or None
+        except OSError:
+            with self._lock:
+                self._total_bytes -= self._index.pop(text_hash, 0)
+            return None
+
+    def put(self, text_hash: str, audio_bytes: bytes) -> None:
+        if not self.enabled or not audio_bytes or len(audio_bytes) > self.max_bytes:
+            return
+        path = self._path(text_hash)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(audio_bytes)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.debug(f"TTS disk cache write failed (non-critical): {e}")
+            return
+        with self._lock:
+            self._total_bytes += len(audio_bytes) - self._index.pop(text_hash, 0)
+            self._index[text_hash] = len(audio_bytes)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Xoá file cũ nhất cho tới khi tổng dung lượng <= max_bytes (gọi khi đang giữ lock hoặc lúc init)."""
+        while self._total_bytes > self.max_bytes and self._index:
+            text_hash, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(text_hash))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+def get_tts_disk_cache() -> TTSDiskCache:
+    """Disk cache dùng chung toàn process."""
+    global _disk_cache
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            _disk_cache = TTSDiskCache(TTS_DISK_CACHE_DIR, TTS_DISK_CACHE_MAX_BYTES)
+        return _disk_cache
+
+_TTS_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+_SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([,.!?;:])')
+_SPACE_AFTER_PUNCT_RE = re.compile(r'([,!?;:])(?=[A-Za-z])')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_tts_text(text: str) -> str:
+    """
+    Dạng chuẩn của text trước khi hash/tạo audio: gộp khoảng trắng, bỏ space trước dấu câu,
+    thêm space sau dấu câu dính chữ, đổi smart quotes sang ASCII.
+    Giữ nguyên hoa/thường vì Edge TTS đọc khác nhau (vd: "US" / "us", "Polish" / "polish").
+    Text đã "sạch" không đổi nên hash của các entry cũ vẫn dùng được.
+    """
+    if not text:
+        return ""
+    text = str(text).translate(_TTS_QUOTES)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", text)
+    return _SPACE_AFTER_PUNCT_RE.sub(r"\1 ", text)
+
 def generate_text_hash(text: str, voice: str) -> str:
     """
-    Generate MD5 hash từ text + voice.
+    Generate MD5 hash từ text (đã normalize_tts_text) + voice.
     
     Args:
         text: Text cần hash
@@ -23,20 +176,96 @@ def generate_text_hash(text: str, voice: str) -> str:
     Returns:
         MD5 hash string
     """
-    combined = f"{text}|{voice}".encode('utf-8')
+    combined = f"{normalize_tts_text(text)}|{voice}".encode('utf-8')
     return hashlib.md5(combined).hexdigest()
 
+class _CacheUsageRecorder:
+    """
+    Gom lượt dùng cache theo text_hash trong bộ nhớ và ghi usage_count/last_used_at lên DB
+    theo lô mỗi TTS_USAGE_FLUSH_SECONDS (daemon thread), để các đường đọc nhanh (disk, URL)
+    vẫn cập nhật thứ hạng GC mà không thêm round trip vào request.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+    
+    def record(self, text_hash: str) -> None:
+        with self._lock:
+            self._pending[text_hash] = self._pending.get(text_hash, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="tts-usage-recorder", daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(TTS_USAGE_FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+    
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or not supabase:
+            return
+        hashes = list(pending)
+        for i in range(0, len(hashes), CACHE_USAGE_LOOKUP_CHUNK):
+            chunk = hashes[i:i + CACHE_USAGE_LOOKUP_CHUNK]
+            try:
+                result = supabase.table("TTSAudioCache").select("text_hash, usage_count").in_("text_hash", chunk).execute()
+                current = {row['text_hash']: row.get('usage_count') or 0 for row in (result.data or [])}
+            except Exception as e:
+                logger.debug(f"Failed to read cache usage (non-critical): {e}")
+                continue
+            now = get_vn_now_utc()
+            for text_hash, count in current.items():
+                _write_cache_usage(text_hash, count + pending[text_hash], now)
+
+
+def _write_cache_usage(text_hash: str, usage_count: int, last_used_at: str) -> None:
+    """Ghi usage_count/last_used_at qua RPC update_tts_cache_usage_count, fallback update trực tiếp."""
+    try:
+        rpc_result = supabase.rpc('update_tts_cache_usage_count', {
+            'p_text_hash': text_hash,
+            'p_usage_count': usage_count,
+            'p_last_used_at': last_used_at
+        }).execute()
+        
+        # If RPC fails, try direct update as fallback
+        if not rpc_result.data or (isinstance(rpc_result.data, str) and rpc_result.data.startswith('ERROR:')):
+            logger.debug(f"RPC update failed, trying direct: {rpc_result.data}")
+            supabase.table("TTSAudioCache").update({
+                "usage_count": usage_count,
+                "last_used_at": last_used_at
+            }).eq("text_hash", text_hash).execute()
+    except Exception as e:
+        # Silently fail - updating usage count is not critical
+        logger.debug(f"Failed to update cache usage: {e}")
+
+
+_usage_recorder = _CacheUsageRecorder()
+atexit.register(_usage_recorder.flush)
+
+
+def record_cache_usage(text_hash: str) -> None:
+    """Tính 1 lượt dùng cho entry (ghi lên DB theo lô, không chặn request)."""
+    if supabase:
+        _usage_recorder.record(text_hash)
+
 def get_cached_audio_url(text: str, voice: str = "en-US-AriaNeural") -> Optional[str]:
     """
-    Chỉ lấy file_url từ cache (không download bytes) - nhanh hơn nhiều.
-    Dùng khi chỉ cần URL để hiển thị audio player.
+    Chỉ lấy URL phát audio từ cache (không download bytes) - nhanh hơn nhiều.
+    Dùng khi chỉ cần URL để hiển thị audio player: browser tải thẳng từ Storage,
+    bytes không đi qua app server.
     
     Args:
         text: Text cần audio
         voice: Voice name
     
     Returns:
-        file_url string hoặc None nếu không có cache
+        URL (public file_url, hoặc signed URL nếu TTS_SIGNED_URLS) hoặc None nếu không có cache
     """
     if not supabase or not text or not text.strip():
         return None
@@ -46,16 +275,23 @@ def get_cached_audio_url(text: str, voice: str = "en-US-AriaNeural") -> Optional
         
         # Query cache metadata (chỉ lấy URL, không download file)
         result = supabase.table("TTSAudioCache").select(
-            "file_url, text_hash"
+            "file_url, file_path, text_hash"
         ).eq("text_hash", text_hash).maybe_single().execute()
         
         # Check if result exists and has data
-        if result and hasattr(result, 'data') and result.data:
-            file_url = result.data.get('file_url')
-            if file_url:
-                return file_url
+        if not result or not hasattr(result, 'data') or not result.data:
+            return None
         
-        return None
+        if TTS_SIGNED_URLS:
+            url = _create_signed_url(result.data.get('file_path'))
+        else:
+            url = result.data.get('file_url')
+            # URL tương đối (fallback khi upload không lấy được public URL) không phát được trên browser
+            if not (url and url.startswith("http")):
+                url = None
+        if url:
+            record_cache_usage(text_hash)
+        return url
         
     except Exception as e:
         # Log error but don't fail - this is a cache lookup, not critical
@@ -65,6 +301,19 @@ def get_cached_audio_url(text: str, voice: str = "en-US-AriaNeural") -> Optional
             logger.error(f"Error getting cached audio URL: {e}")
         return None
 
+def _create_signed_url(file_path: Optional[str]) -> Optional[str]:
+    """Signed URL có hạn TTS_SIGNED_URL_EXPIRES_SECONDS cho file trong bucket."""
+    if not file_path:
+        return None
+    try:
+        signed = supabase.storage.from_(BUCKET_NAME).create_signed_url(file_path, TTS_SIGNED_URL_EXPIRES_SECONDS)
+        if isinstance(signed, dict):
+            return signed.get('signedURL') or signed.get('signedUrl')
+        return signed if isinstance(signed, str) else None
+    except Exception as e:
+        logger.warning(f"Failed to create signed URL for {file_path}: {e}")
+        return None
+
 def get_cached_audio(text: str, voice: str = "en-US-AriaNeural") -> Optional[Tuple[bytes, str]]:
     """
     Lấy cached audio từ database và Supabase Storage.
@@ -76,12 +325,22 @@ def get_cached_audio(text: str, voice: str = "en-US-AriaNeural") -> Optional[Tup
     Returns:
         Tuple (audio_bytes, file_url) hoặc None nếu không có cache
     """
-    if not supabase or not text or not text.strip():
+    if not text or not text.strip():
+        return None
+    
+    text_hash = generate_text_hash(text, voice)
+    
+    # 1. Disk cache local: không cần network (file_url không có sẵn ở tầng này)
+    local_audio = get_tts_disk_cache().get(text_hash)
+    if local_audio:
+        # Vẫn tính lượt dùng để GC (run_cache_gc) không xoá các clip đang được dùng nhiều
+        record_cache_usage(text_hash)
+        return (local_audio, "")
+    
+    if not supabase:
         return None
     
     try:
-        text_hash = generate_text_hash(text, voice)
-        
         # Query cache metadata
         result = supabase.table("TTSAudioCache").select(
             "file_path, file_url, text_hash"
@@ -103,31 +362,9 @@ def get_cached_audio(text: str, voice: str = "en-US-AriaNeural") -> Optional[Tup
             audio_response = supabase.storage.from_(BUCKET_NAME).download(file_path)
             
             if audio_response:
-                # Update usage_count and last_used_at using RPC function
-                try:
-                    # Get current usage_count first
-                    current = supabase.table("TTSAudioCache").select("usage_count").eq("text_hash", text_hash).maybe_single().execute()
-                    current_count = 0
-                    if current and hasattr(current, 'data') and current.data:
-                        current_count = current.data.get('usage_count', 0)
-                    
-                    new_count = current_count + 1
-                    rpc_result = supabase.rpc('update_tts_cache_usage_count', {
-                        'p_text_hash': text_hash,
-                        'p_usage_count': new_count,
-                        'p_last_used_at': get_vn_now_utc()
-                    }).execute()
-                    
-                    # If RPC fails, try direct update as fallback
-                    if not rpc_result.data or (isinstance(rpc_result.data, str) and rpc_result.data.startswith('ERROR:')):
-                        logger.debug(f"RPC update failed, trying direct: {rpc_result.data}")
-                        supabase.table("TTSAudioCache").update({
-                            "usage_count": new_count,
-                            "last_used_at": get_vn_now_utc()
-                        }).eq("text_hash", text_hash).execute()
-                except Exception as e:
-                    # Silently fail - updating usage count is not critical
-                    logger.debug(f"Failed to update cache usage: {e}")
+                get_tts_disk_cache().put(text_hash, audio_response)
+                
+                record_cache_usage(text_hash)
                 
                 return (audio_response, file_url or "")
             
@@ -151,21 +388,36 @@ def cache_audio(
 ) -> Optional[str]:
     """
     Lưu audio vào Supabase Storage và metadata vào database.
+    Audio được encode thành bản compact (MP3 mono bitrate thấp) trước khi lưu nếu có ffmpeg,
+    nên client mặc định tải bản nhỏ; audio_length_seconds lấy từ độ dài thật của audio.
     
     Args:
         text: Text đã được convert sang audio
         voice: Voice name được sử dụng
         audio_bytes: Audio bytes data
-        audio_length_seconds: Length của audio (optional)
+        audio_length_seconds: Length của audio (optional, bị thay bằng độ dài đo được)
     
     Returns:
         file_url nếu thành công, None nếu thất bại
     """
-    if not supabase or not text or not text.strip() or not audio_bytes:
+    if not text or not text.strip() or not audio_bytes:
+        return None
+    
+    encoded = encode_compact_mp3(audio_bytes)
+    if encoded:
+        audio_bytes, duration = encoded
+    else:
+        duration = mp3_duration_seconds(audio_bytes)
+    if duration:
+        audio_length_seconds = max(1, round(duration))
+    
+    text_hash = generate_text_hash(text, voice)
+    get_tts_disk_cache().put(text_hash, audio_bytes)
+    
+    if not supabase:
         return None
     
     try:
-        text_hash = generate_text_hash(text, voice)
         file_path = f"{text_hash}.mp3"
         
         # Upload to Storage
@@ -290,9 +542,41 @@ def verify_audio_exists(text_hash: str) -> bool:
     except Exception:
         return False
 
+# Thứ tự xoá (sắp xếp trên server): ít dùng nhất -> lâu chưa dùng nhất -> file lớn nhất trước;
+# text_hash (unique) ở cuối để phân trang ổn định
+_EVICTION_ORDER = (
+    ("usage_count", {}),
+    ("last_used_at", {"nullsfirst": True}),
+    ("file_size_bytes", {"desc": True}),
+    ("text_hash", {}),
+)
+
+
+def _iter_cache_rows(columns: str, page_size: Optional[int] = None,
+                     order=(("text_hash", {}),)) -> Iterator[Dict[str, Any]]:
+    """
+    Đọc TTSAudioCache theo từng trang để không phải tải cả bảng 1 lần.
+    order: các (cột, kwargs) truyền cho .order(); cột cuối phải unique để phân trang ổn định.
+    """
+    page_size = page_size or CACHE_SCAN_PAGE_SIZE
+    start = 0
+    while True:
+        query = supabase.table("TTSAudioCache").select(columns)
+        for column, options in order:
+            query = query.order(column, **options)
+        result = query.range(start, start + page_size - 1).execute()
+        page = result.data or []
+        yield from page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
 def get_cache_stats() -> Dict[str, Any]:
     """
     Lấy thống kê về cache.
+    Tổng được tính trên server (RPC get_tts_cache_stats); nếu chưa có RPC thì cộng dồn
+    file_size_bytes qua từng trang thay vì tải toàn bộ bảng.
     
     Returns:
         Dict với các thống kê về cache
@@ -301,13 +585,22 @@ def get_cache_stats() -> Dict[str, Any]:
         return {}
     
     try:
-        # Get total count
-        count_result = supabase.table("TTSAudioCache").select("id", count="exact").execute()
-        total_count = count_result.count if hasattr(count_result, 'count') else 0
+        total_count = None
+        total_size = 0
+        try:
+            rpc_result = supabase.rpc('get_tts_cache_stats', {}).execute()
+            row = rpc_result.data[0] if isinstance(rpc_result.data, list) and rpc_result.data else rpc_result.data
+            if isinstance(row, dict):
+                total_count = int(row.get('total_entries') or 0)
+                total_size = int(row.get('total_size_bytes') or 0)
+        except Exception as rpc_error:
+            logger.debug(f"get_tts_cache_stats RPC unavailable, scanning pages: {rpc_error}")
         
-        # Get total size (approximate)
-        size_result = supabase.table("TTSAudioCache").select("file_size_bytes").execute()
-        total_size = sum(item.get('file_size_bytes', 0) for item in (size_result.data or []))
+        if total_count is None:
+            total_count = 0
+            for item in _iter_cache_rows("file_size_bytes"):
+                total_count += 1
+                total_size += item.get('file_size_bytes') or 0
         
         return {
             "total_entries": total_count,
@@ -317,3 +610,99 @@ def get_cache_stats() -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"Error getting cache stats: {e}")
         return {}
+
+
+def select_cache_evictions(budget_bytes: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Chọn các entry cần xoá để tổng dung lượng cache <= budget_bytes.
+    Tổng dung lượng lấy từ get_cache_stats; các row được đọc theo _EVICTION_ORDER (sắp xếp
+    trên server) và dừng ngay khi đã đủ dung lượng cần giải phóng, không tải cả bảng.
+    
+    Args:
+        budget_bytes: Dung lượng tối đa cho phép của bucket tts-audio
+    
+    Returns:
+        (danh sách row cần xoá theo thứ tự xoá, tổng dung lượng hiện tại)
+    """
+    stats = get_cache_stats()
+    total_size = stats.get("total_size_bytes", 0)
+    if not stats or total_size <= budget_bytes:
+        return [], total_size
+    
+    evictions = []
+    remaining = total_size
+    for row in _iter_cache_rows("text_hash, file_path, file_size_bytes, usage_count, last_used_at",
+                                order=_EVICTION_ORDER):
+        evictions.append(row)
+        remaining -= row.get('file_size_bytes') or 0
+        if remaining <= budget_bytes:
+            break
+    return evictions, total_size
+
+
+def _delete_cache_batch(rows: List[Dict[str, Any]]) -> bool:
+    """
+    Xoá metadata trước rồi mới xoá file trong Storage: nếu bước sau lỗi thì chỉ còn file mồ côi,
+    không có row trỏ tới file đã mất (get_cached_audio_url sẽ trả về URL chết).
+    """
+    hashes = [row['text_hash'] for row in rows]
+    paths = [row.get('file_path') or f"{row['text_hash']}.mp3" for row in rows]
+    try:
+        supabase.table("TTSAudioCache").delete().in_("text_hash", hashes).execute()
+    except Exception as e:
+        logger.warning(f"Could not delete TTS cache rows (batch of {len(rows)}): {e}")
+        return False
+    try:
+        supabase.storage.from_(BUCKET_NAME).remove(paths)
+    except Exception as e:
+        logger.warning(f"Deleted {len(rows)} TTS cache rows but could not remove Storage objects: {e}")
+    return True
+
+
+def run_cache_gc(
+    budget_bytes: Optional[int] = None,
+    dry_run: bool = False,
+    batch_size: int = CACHE_GC_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Dọn TTS cache cho tới khi tổng dung lượng <= budget (TTS_CACHE_MAX_STORAGE_MB).
+    Entry bị xoá theo _EVICTION_ORDER; mỗi batch xoá row TTSAudioCache + object trong Storage.
+    
+    Args:
+        budget_bytes: Dung lượng tối đa (default: TTS_CACHE_MAX_STORAGE_BYTES)
+        dry_run: Chỉ báo cáo, không xoá
+        batch_size: Số entry mỗi lần xoá
+    
+    Returns:
+        Dict báo cáo (total_size_bytes, evict_entries, evict_bytes, deleted_entries, deleted_bytes, ...)
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+    if not supabase:
+        return {}
+    
+    budget_bytes = TTS_CACHE_MAX_STORAGE_BYTES if budget_bytes is None else budget_bytes
+    evictions, total_size = select_cache_evictions(budget_bytes)
+    report = {
+        "total_size_bytes": total_size,
+        "budget_bytes": budget_bytes,
+        "evict_entries": len(evictions),
+        "evict_bytes": sum(row.get('file_size_bytes') or 0 for row in evictions),
+        "deleted_entries": 0,
+        "deleted_bytes": 0,
+        "dry_run": dry_run,
+    }
+    if dry_run or not evictions:
+        return report
+    
+    for i in range(0, len(evictions), batch_size):
+        batch = evictions[i:i + batch_size]
+        if _delete_cache_batch(batch):
+            report["deleted_entries"] += len(batch)
+            report["deleted_bytes"] += sum(row.get('file_size_bytes') or 0 for row in batch)
+    
+    logger.info(
+        f"TTS cache GC: deleted {report['deleted_entries']}/{report['evict_entries']} entries, "
+        f"{report['deleted_bytes'] / (1024 * 1024):.2f} MB"
+    )
+    return report
@@ -6,6 +6,7 @@ import logging
 import json
 import re
 from core.timezone_utils import get_vn_start_of_day_utc, get_vn_now_utc
+from services.activity_log_writer import enqueue_activity_log
 
 logger = logging.getLogger(__name__)
 
@@ -179,12 +180,12 @@ def log_activity(user_id: int, action: str, value: int = 0) -> None:
     """Ghi nhật ký hoạt động của người dùng."""
     if not supabase: return
     try:
-        supabase.table("ActivityLog").insert({
+        enqueue_activity_log({
             "user_id": int(user_id),
             "action_type": action,
             "value": int(value),
             "created_at": get_vn_now_utc()
-        }).execute()
+        })
     except Exception as e:
         logger.error(f"Log activity error: {e}")
 
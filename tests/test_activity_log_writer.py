@@ -0,0 +1,84 @@
+"""Unit tests for activity_log_writer."""
+import pytest
+from unittest.mock import patch, MagicMock
+from services import activity_log_writer as alw
+
+
+@pytest.fixture
+def db():
+    """Patched supabase client recording each insert payload."""
+    with patch.object(alw, 'supabase') as mock, patch.object(alw, 'RETRY_BACKOFF_SECONDS', 0):
+        yield mock
+
+
+def _inserted(db):
+    return [c[0][0] for c in db.table.return_value.insert.call_args_list]
+
+
+class TestActivityLogWriter:
+    """Tests for batching, retry and flush."""
+
+    def test_rows_are_batched_into_one_insert(self, db):
+        """Rows queued together land in a single insert after flush."""
+        writer = alw.ActivityLogWriter()
+        for i in range(5):
+            writer.enqueue({"user_id": i, "action_type": "login", "value": 1})
+
+        assert writer.flush(timeout=5)
+        assert [len(batch) for batch in _inserted(db)] == [5]
+
+    def test_failed_batch_retried_then_split(self, db):
+        """A batch that keeps failing is retried, then written row by row so good rows land."""
+        def _execute_for(payload):
+            call = MagicMock()
+            if any(row["user_id"] == 99 for row in payload):
+                call.execute.side_effect = Exception("violates foreign key constraint")
+            return call
+        db.table.return_value.insert.side_effect = _execute_for
+
+        writer = alw.ActivityLogWriter()
+        assert writer._write([{"user_id": 1}, {"user_id": 99}, {"user_id": 2}]) is False
+
+        assert writer.written_count == 2
+        assert writer.failed_count == 1
+        assert len(_inserted(db)) == alw.MAX_RETRIES + 3
+
+    def test_full_queue_writes_synchronously(self, db):
+        """Overflow is inserted in the caller instead of being dropped."""
+        writer = alw.ActivityLogWriter(max_size=1)
+        writer.start = MagicMock()
+        writer.enqueue({"user_id": 1})
+        writer.enqueue({"user_id": 2})
+
+        assert writer.sync_fallback_count == 1
+        assert _inserted(db) == [[{"user_id": 2}]]
+
+    def test_count_pending_includes_queued_rows(self, db):
+        """Queued rows are reported as pending until they are written."""
+        writer = alw.ActivityLogWriter()
+        writer.start = MagicMock()
+        writer.enqueue({"user_id": 1, "action_type": "login", "value": 0})
+        writer.enqueue({"user_id": 1, "action_type": "login", "value": 1})
+        writer.enqueue({"user_id": 2, "action_type": "login", "value": 0})
+
+        assert writer.count_pending(1) == 2
+        assert writer.count_pending(1, "login", failed_only=True) == 1
+        assert writer.count_pending(1, "vocab_review") == 0
+
+    def test_mixed_columns_sent_as_separate_inserts(self, db):
+        """Rows with different column sets are not mixed in one bulk insert."""
+        alw._insert_rows([{"user_id": 1, "metadata": {}}, {"user_id": 2}, {"user_id": 3, "metadata": {}}])
+
+        assert sorted(len(batch) for batch in _inserted(db)) == [1, 2]
+
+
+class TestEnqueueActivityLog:
+    """Tests for the module-level helper."""
+
+    def test_created_at_stamped_at_enqueue(self, db):
+        """created_at reflects when the action happened, not when the batch is written."""
+        writer = MagicMock()
+        with patch.object(alw, 'get_activity_log_writer', return_value=writer):
+            alw.enqueue_activity_log({"user_id": 1, "action_type": "login"})
+
+        assert writer.enqueue.call_args[0][0]["created_at"]
@@ -0,0 +1,58 @@
+"""Unit tests for ai_cache_service cache keys."""
+import pytest
+from services.ai_cache_service import generate_cache_key, generate_prompt_hash
+from core.prompts import register_template, render_prompt
+
+
+@pytest.fixture
+def sample_template():
+    """A throwaway template registered for the test."""
+    return register_template("test_template", 1, """
+        Write about '{topic}' for level {level}.
+        Return JSON: {{"text": "..."}}
+    """, case_insensitive=('topic',))
+
+
+class TestGenerateCacheKey:
+    """Tests for generate_cache_key."""
+
+    def test_raw_prompt_ignores_whitespace(self):
+        """Raw prompts differing only in indentation share a key."""
+        a = "\n    Hello   world\n    Return JSON\n"
+        b = "Hello world\nReturn JSON"
+
+        assert generate_cache_key(a, 'reading') == generate_cache_key(b, 'reading')
+
+    def test_raw_prompt_keyed_by_feature_type(self):
+        """Raw prompts keep feature_type in the key."""
+        assert generate_cache_key("prompt", 'reading') != generate_cache_key("prompt", 'writing')
+
+    def test_template_key_uses_normalized_params(self, sample_template):
+        """Templated prompts are keyed by template id, version and normalized params."""
+        a = render_prompt("test_template", topic="  Travel ", level="B1")
+        b = render_prompt("test_template", topic="travel", level="B1")
+
+        assert generate_cache_key(a, 'reading') == generate_cache_key(b, 'writing')
+
+    def test_template_version_changes_key(self, sample_template):
+        """Bumping the template version produces a new key."""
+        v1 = render_prompt("test_template", topic="travel", level="B1")
+        register_template("test_template", 2, sample_template.text, case_insensitive=('topic',))
+        v2 = render_prompt("test_template", topic="travel", level="B1")
+
+        assert str(v1) == str(v2)
+        assert generate_cache_key(v1) != generate_cache_key(v2)
+
+
+class TestGeneratePromptHash:
+    """Tests for generate_prompt_hash."""
+
+    def test_template_prompt_hash_is_tag(self, sample_template):
+        """Templated prompts store their template tag for invalidation."""
+        prompt = render_prompt("test_template", topic="travel", level="B1")
+
+        assert generate_prompt_hash(prompt) == "tpl:test_template@v1"
+
+    def test_raw_prompt_hash_is_md5(self):
+        """Raw prompts keep the MD5 prompt hash."""
+        assert len(generate_prompt_hash("hello")) == 32
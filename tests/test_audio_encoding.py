@@ -0,0 +1,44 @@
+"""Unit tests for core.audio_encoding."""
+import pytest
+from unittest.mock import patch
+from core import audio_encoding
+
+
+def _cbr_mp3(header, total_bytes):
+    """Fake CBR MP3: one frame header followed by padding."""
+    return header + b"\x00" * (total_bytes - len(header))
+
+
+class TestMp3Duration:
+    """Tests for header-based duration."""
+
+    def test_edge_tts_48k_mono(self):
+        """MPEG-2 Layer III at 48 kbps (edge-tts default): 6000 bytes = 1 s."""
+        audio = _cbr_mp3(b"\xff\xf3\x60\x00", 6000)
+
+        assert audio_encoding.mp3_duration_seconds(audio) == pytest.approx(1.0)
+
+    def test_mpeg1_128k_after_id3_tag(self):
+        """ID3v2 tags are skipped before reading the frame header."""
+        id3 = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10
+        audio = id3 + _cbr_mp3(b"\xff\xfb\x90\x00", 32000)
+
+        assert audio_encoding.mp3_duration_seconds(audio) == pytest.approx(2.0)
+
+    def test_not_mp3(self):
+        """Garbage input gives None instead of a wrong estimate."""
+        assert audio_encoding.mp3_duration_seconds(b"not audio at all") is None
+
+
+class TestEncodeCompact:
+    """Tests for compact encoding fallbacks."""
+
+    def test_missing_ffmpeg_returns_none(self):
+        """Without ffmpeg the original audio is kept."""
+        with patch('pydub.AudioSegment.from_file', side_effect=FileNotFoundError("ffmpeg")):
+            assert audio_encoding.encode_compact_mp3(b"\xff\xf3\x60\x00" * 10) is None
+
+    def test_disabled(self):
+        """TTS_COMPACT_AUDIO=0 skips encoding."""
+        with patch.object(audio_encoding, 'COMPACT_AUDIO_ENABLED', False):
+            assert audio_encoding.encode_compact_mp3(b"audio") is None
@@ -0,0 +1,71 @@
+"""Unit tests for core.auth login lookup."""
+import pytest
+from unittest.mock import patch
+from core import auth
+
+
+@pytest.fixture
+def db():
+    """Patched supabase client where the exact username match misses."""
+    with patch.object(auth, 'supabase') as mock:
+        mock.table.return_value.select.return_value.eq.return_value.execute.return_value.data = []
+        yield mock
+
+
+class TestFindUserByUsername:
+    """Tests for case-insensitive login lookup."""
+
+    def test_rpc_lookup_without_full_scan(self, db):
+        """A case-insensitive match comes from the RPC; Users is never listed in full."""
+        db.rpc.return_value.execute.return_value.data = [{'id': 1, 'username': 'Alice'}]
+
+        assert auth._find_user_by_username('alice')['id'] == 1
+        db.rpc.assert_called_with('find_user_by_username_ci', {'p_username': 'alice'})
+        selects = [c[0][0] for c in db.table.return_value.select.call_args_list]
+        assert "username, id" not in selects
+
+    def test_ilike_fallback_when_rpc_missing(self, db):
+        """Without the RPC, one ilike query (no wildcards) is used."""
+        db.rpc.side_effect = Exception("function find_user_by_username_ci does not exist")
+        ilike = db.table.return_value.select.return_value.ilike
+        ilike.return_value.limit.return_value.execute.return_value.data = [{'id': 2, 'username': 'Bob'}]
+
+        assert auth._find_user_by_username('bob')['id'] == 2
+        ilike.assert_called_with("username", "bob")
+
+    def test_wildcards_never_reach_ilike(self, db):
+        """'%' or '_' in the input cannot match other accounts."""
+        db.rpc.side_effect = Exception("function find_user_by_username_ci does not exist")
+
+        assert auth._find_user_by_username('a%') is None
+        db.table.return_value.select.return_value.ilike.assert_not_called()
+
+    def test_ambiguous_match_refused(self, db):
+        """Two accounts differing only by case do not log in via the fallback."""
+        db.rpc.return_value.execute.return_value.data = [{'id': 1}, {'id': 2}]
+
+        assert auth._find_user_by_username('alice') is None
+
+
+class TestCheckLogin:
+    """Tests for check_login with LoginLimiter."""
+
+    def test_blocked_user_skips_lookup(self, db):
+        """A blocked username is answered before any Users query, keeping the limiter message."""
+        blocked = {'allowed': False, 'message': 'Vui lòng thử lại sau 7 phút.'}
+        with patch.object(auth, 'check_session_timeout', return_value=False), \
+                patch.object(auth, 'st') as mock_st, \
+                patch.object(auth.LoginLimiter, 'check_attempts', return_value=blocked):
+            mock_st.session_state = type('State', (), {})()
+            assert auth.check_login('alice', 'x') == "TOO_MANY_ATTEMPTS"
+            assert mock_st.session_state.login_error_message == blocked['message']
+        db.table.assert_not_called()
+
+    def test_failed_login_is_logged(self, db):
+        """A failed login records a failed attempt."""
+        db.rpc.return_value.execute.return_value.data = []
+        with patch.object(auth, 'check_session_timeout', return_value=False), \
+                patch.object(auth.LoginLimiter, 'check_attempts', return_value={'allowed': True}), \
+                patch.object(auth.LoginLimiter, 'log_attempt') as log_attempt:
+            assert auth.check_login('nobody', 'x') is None
+        log_attempt.assert_called_with('nobody', success=False)
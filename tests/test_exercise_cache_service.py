@@ -0,0 +1,283 @@
+"""Unit tests for exercise_cache_service."""
+import pytest
+from unittest.mock import patch, MagicMock
+from services import exercise_cache_service as ecs
+
+
+class _FakeQuery:
+    """Minimal PostgREST query over in-memory rows (eq / is_ / in_ / order / range / count).
+
+    Columns missing from a row match any eq filter, so tests only list the columns they care about.
+    """
+
+    def __init__(self, rows, columns, count=None):
+        self.rows = list(rows)
+        self.columns = [c.strip() for c in columns.split(",")]
+        self.count = count
+        self.start, self.end = 0, None
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r.get(column, value) == value]
+        return self
+
+    def is_(self, column, value):
+        self.rows = [r for r in self.rows if r.get(column) is None]
+        return self
+
+    def in_(self, column, values):
+        self.rows = [r for r in self.rows if r.get(column) in values]
+        return self
+
+    def order(self, column, **kwargs):
+        self.rows.sort(key=lambda r: r[column])
+        return self
+
+    def range(self, start, end):
+        self.start, self.end = start, end
+        return self
+
+    def execute(self):
+        result = MagicMock()
+        result.count = len(self.rows) if self.count else None
+        page = self.rows[self.start:None if self.end is None else self.end + 1]
+        result.data = [{c: r.get(c) for c in self.columns} for r in page]
+        return result
+
+
+class _FakeTable(MagicMock):
+    """Table mock whose select() runs against in-memory rows; writes stay plain MagicMocks."""
+
+    def __init__(self, rows=(), **kwargs):
+        super().__init__(**kwargs)
+        self.select.side_effect = lambda columns, count=None: _FakeQuery(rows, columns, count)
+
+
+def _table_router(tables):
+    """supabase.table(name) -> the MagicMock registered for that table."""
+    return lambda name: tables.setdefault(name, MagicMock())
+
+
+def _rpc_router(handlers):
+    """supabase.rpc(name, params) -> handler(params) or raise if unknown."""
+    def _rpc(name, params=None):
+        if name not in handlers:
+            raise Exception(f"function {name} does not exist")
+        call = MagicMock()
+        call.execute.return_value.data = handlers[name](params)
+        return call
+    return _rpc
+
+
+@pytest.fixture
+def db():
+    """Patched supabase client with one mock per table; no RPCs installed by default."""
+    tables = {}
+    with patch.object(ecs, 'supabase') as mock, patch.object(ecs, '_note_demand'), \
+            patch.object(ecs, '_sample_rpc_available', None), patch.object(ecs, '_sample_rpc_retry_at', 0.0), \
+            patch.object(ecs, 'st') as mock_st:
+        mock_st.session_state = {}
+        tables["UserExerciseHistory"] = _FakeTable()
+        mock.tables = tables
+        mock.table.side_effect = _table_router(tables)
+        mock.rpc.side_effect = _rpc_router({})
+        yield mock
+
+
+def _set_candidates(db, rows):
+    """AIExercises rows returned by the id-index path."""
+    db.tables["AIExercises"] = _FakeTable([{'metadata': {}, **r} for r in rows])
+
+
+def _set_history(db, rows):
+    db.tables["UserExerciseHistory"] = _FakeTable(rows)
+
+
+class TestGetUnseenExercises:
+    """Tests for the bulk get_unseen_exercises."""
+
+    def test_returns_distinct_exercises_with_single_batch_upsert(self, db):
+        """n exercises are sampled and marked seen in one upsert."""
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'metadata': {}, 'usage_count': 0}
+            for i in range(1, 6)
+        ])
+
+        result = ecs.get_unseen_exercises(1, "grammar_question", "A1", "Travel", n=3)
+
+        assert len(result) == 3
+        assert len({e['id'] for e in result}) == 3
+        history = db.table("UserExerciseHistory")
+        assert history.upsert.call_count == 1
+        rows = history.upsert.call_args[0][0]
+        assert sorted(r['exercise_id'] for r in rows) == sorted(e['id'] for e in result)
+
+    def test_id_index_only_fetches_content_of_picked(self, db):
+        """The fallback path downloads exercise_data only for the sampled ids."""
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in range(1, 21)
+        ])
+
+        result = ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1, mark_seen=False)
+
+        selects = [c[0][0] for c in db.table("AIExercises").select.call_args_list]
+        assert [s for s in selects if s != "id"] == ["id, exercise_data, metadata, usage_count"]
+        assert len(result) == 1
+
+    def test_excludes_completed_and_recently_seen(self, db):
+        """Completed and recently seen exercises are filtered out in memory."""
+        _set_history(db, [
+            {'user_id': 1, 'exercise_id': 1, 'completed': True, 'seen_at': '2000-01-01T00:00:00+00:00'},
+            {'user_id': 1, 'exercise_id': 2, 'completed': False, 'seen_at': '2999-01-01T00:00:00+00:00'},
+            {'user_id': 1, 'exercise_id': 3, 'completed': False, 'seen_at': '2000-01-01T00:00:00+00:00'},
+        ])
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in (1, 2, 3)
+        ])
+
+        result = ecs.get_unseen_exercises(1, "grammar_question", "A1", "Travel", n=3)
+
+        assert [e['id'] for e in result] == [3]
+
+    def test_returns_fewer_when_pool_is_short(self, db):
+        """Fewer candidates than requested returns what is available."""
+        _set_candidates(db, [{'id': 7, 'exercise_data': {'question': 'Q'}, 'usage_count': 2}])
+
+        result = ecs.get_unseen_exercises(1, "grammar_question", "A1", None, n=5, mark_seen=False)
+
+        assert [e['id'] for e in result] == [7]
+        db.table("UserExerciseHistory").upsert.assert_not_called()
+
+    def test_usage_count_falls_back_when_rpc_missing(self, db):
+        """Without the RPC, usage_count is updated per exercise."""
+        _set_candidates(db, [{'id': 7, 'exercise_data': {'question': 'Q'}, 'usage_count': 2}])
+
+        ecs.get_unseen_exercises(1, "grammar_question", "A1", None, n=1)
+
+        update_payload = db.table("AIExercises").update.call_args[0][0]
+        assert update_payload['usage_count'] == 3
+
+    def test_random_offset_reads_only_small_windows(self, db):
+        """With a large pool the fallback reads a count and one id window, not every id."""
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in range(1, 101)
+        ])
+
+        with patch.object(ecs, 'SAMPLE_PROBE_WINDOW', 5):
+            result = ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1, mark_seen=False)
+
+        assert len(result) == 1
+        assert [c[0][0] for c in db.table("AIExercises").select.call_args_list].count("id") == 2
+
+    def test_history_and_ids_are_paginated(self, db):
+        """Rows past PostgREST's max-rows page are still read (history and candidate ids)."""
+        _set_history(db, [
+            {'user_id': 1, 'exercise_id': i, 'completed': True, 'seen_at': None} for i in range(1, 6)
+        ])
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in range(1, 7)
+        ])
+
+        with patch.object(ecs, 'PAGE_SIZE', 2):
+            result = ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1, mark_seen=False)
+
+        assert [e['id'] for e in result] == [6]
+
+    def test_single_wrapper_does_not_mark_seen(self, db):
+        """get_unseen_exercise keeps its contract: callers mark seen themselves."""
+        _set_candidates(db, [{'id': 7, 'exercise_data': {'question': 'Q'}, 'usage_count': 0}])
+
+        result = ecs.get_unseen_exercise(1, "dictation", "A1", None)
+
+        assert result['id'] == 7
+        db.table("UserExerciseHistory").upsert.assert_not_called()
+
+
+class TestServerSideSampling:
+    """Tests for the sample_unseen_exercises RPC path."""
+
+    def test_rpc_result_used_without_table_queries(self, db):
+        """When the RPC exists, history and candidates are never downloaded."""
+        db.rpc.side_effect = _rpc_router({
+            'sample_unseen_exercises': lambda p: [
+                {'id': 42, 'exercise_data': {'text': 'Hi'}, 'metadata': {}, 'usage_count': 0}
+            ][:p['p_limit']],
+            'increment_exercise_usage': lambda p: None,
+        })
+
+        result = ecs.get_unseen_exercises(1, "dictation", "A1", "Invalid Topic", n=1, mark_seen=False)
+
+        assert [e['id'] for e in result] == [42]
+        params = next(c[0][1] for c in db.rpc.call_args_list if c[0][0] == 'sample_unseen_exercises')
+        assert params['p_topic'] is None
+        assert params['p_cooldown_hours'] == ecs.SEEN_COOLDOWN_HOURS
+        db.table.assert_not_called()
+
+    def test_missing_rpc_is_not_retried(self, db):
+        """After the RPC is found missing, later calls go straight to the id-index."""
+        _set_candidates(db, [])
+
+        ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+        ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+
+        sample_calls = [c for c in db.rpc.call_args_list if c[0][0] == 'sample_unseen_exercises']
+        assert len(sample_calls) == 1
+
+    def test_transient_error_retried_after_cooldown(self, db):
+        """A timeout only disables the RPC for SAMPLE_RPC_RETRY_SECONDS."""
+        _set_candidates(db, [])
+        db.rpc.side_effect = Exception("canceling statement due to statement timeout")
+
+        with patch('services.exercise_cache_service.time.monotonic', return_value=100.0):
+            ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+            ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+        with patch('services.exercise_cache_service.time.monotonic', return_value=100.0 + ecs.SAMPLE_RPC_RETRY_SECONDS):
+            ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+
+        sample_calls = [c for c in db.rpc.call_args_list if c[0][0] == 'sample_unseen_exercises']
+        assert len(sample_calls) == 2
+        assert ecs._sample_rpc_available is not False
+
+
+class TestSeenExerciseFilter:
+    """Tests for the per-session seen filter."""
+
+    def test_history_loaded_once_per_session(self, db):
+        """Repeated lookups reuse the session filter instead of re-reading history."""
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in range(1, 4)
+        ])
+
+        ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+        ecs.get_unseen_exercises(1, "dictation", "A1", None, n=1)
+
+        assert db.table("UserExerciseHistory").select.call_count == 1
+
+    def test_marked_exercises_are_excluded_locally(self, db):
+        """Exercises marked seen/completed in this session are not offered again."""
+        _set_candidates(db, [
+            {'id': i, 'exercise_data': {'question': f'Q{i}'}, 'usage_count': 0} for i in range(1, 4)
+        ])
+        ecs.get_seen_filter(1)
+
+        ecs.mark_exercise_seen(1, 1)
+        ecs.mark_exercise_completed(1, 2, score=80)
+        result = ecs.get_unseen_exercises(1, "dictation", "A1", None, n=3)
+
+        assert [e['id'] for e in result] == [3]
+
+    def test_seen_again_after_completion_resets_completed(self):
+        """mark_seen mirrors the DB upsert, which stores completed=False."""
+        seen_filter = ecs.SeenExerciseFilter([{'exercise_id': 5, 'completed': True}])
+
+        seen_filter.mark_seen(5, '2000-01-01T00:00:00+00:00')
+
+        assert not seen_filter.is_excluded(5)
+
+
+class TestMarkExercisesSeen:
+    """Tests for mark_exercises_seen."""
+
+    def test_empty_list_is_noop(self, db):
+        """No ids -> no database call."""
+        assert ecs.mark_exercises_seen(1, []) is False
+        db.table.assert_not_called()
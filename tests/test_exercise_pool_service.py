@@ -0,0 +1,115 @@
+"""Unit tests for exercise_pool_service."""
+import pytest
+from unittest.mock import patch, MagicMock
+from services.exercise_pool_service import (
+    ExercisePoolReplenisher,
+    POOL_MIN_DEPTH,
+    POOL_PER_ACTIVE_USER,
+    _content_hash,
+)
+
+
+@pytest.fixture
+def replenisher():
+    """Replenisher whose worker thread never starts."""
+    r = ExercisePoolReplenisher()
+    r.start = MagicMock()
+    return r
+
+
+class TestDemandTracking:
+    """Tests for demand tracking and target depth."""
+
+    def test_target_depth_scales_with_active_users(self, replenisher):
+        """Target depth grows with the number of distinct active users."""
+        key = ("dictation", "A1", "Travel")
+        assert replenisher.target_depth(key) == 0
+
+        replenisher.record_demand(1, *key)
+        replenisher.record_demand(2, *key)
+        replenisher.record_demand(2, *key)
+
+        assert replenisher.active_users(key) == 2
+        assert replenisher.target_depth(key) == POOL_MIN_DEPTH + 2 * POOL_PER_ACTIVE_USER
+
+    def test_queue_deduplicates_keys(self, replenisher):
+        """A key is queued only once; pool misses jump to the front."""
+        replenisher.record_demand(1, "dictation", "A1", "Travel")
+        replenisher.record_demand(1, "comprehension", "A1", "Travel")
+        replenisher.record_demand(2, "dictation", "A1", "Travel")
+        replenisher.record_demand(1, "comprehension", "A1", "Travel", pool_miss=True)
+
+        assert list(replenisher._queue) == [("comprehension", "A1", "Travel"), ("dictation", "A1", "Travel")]
+
+    def test_unsupported_type_is_ignored(self, replenisher):
+        """Exercise types without a generator are not tracked."""
+        replenisher.record_demand(1, "podcast_script", "A1", None)
+
+        assert not replenisher._queue
+
+
+class TestProcess:
+    """Tests for the replenish step."""
+
+    def test_generates_when_below_target(self, replenisher):
+        """A pool below target triggers one generation and re-queues the key."""
+        key = ("dictation", "A1", "Travel")
+        replenisher.record_demand(1, *key)
+        replenisher._pop()
+
+        with patch.object(replenisher, 'pool_depth', return_value=0), \
+             patch.object(replenisher, '_generate_and_save', return_value=1) as mock_gen:
+            replenisher._process(key)
+
+        mock_gen.assert_called_once_with(key)
+        assert key in replenisher._queued
+
+    def test_skips_full_pool(self, replenisher):
+        """A pool at target depth is left alone."""
+        key = ("dictation", "A1", "Travel")
+        replenisher.record_demand(1, *key)
+
+        with patch.object(replenisher, 'pool_depth', return_value=100), \
+             patch.object(replenisher, '_generate_and_save') as mock_gen:
+            replenisher._process(key)
+
+        mock_gen.assert_not_called()
+
+    def test_pool_miss_forces_generation_on_full_pool(self, replenisher):
+        """A user who has seen the whole pool gets new content even at target depth."""
+        key = ("dictation", "A1", "Travel")
+        replenisher.record_demand(1, *key, pool_miss=True)
+
+        with patch.object(replenisher, 'pool_depth', return_value=100), \
+             patch.object(replenisher, '_wait_for_rate_limit'), \
+             patch.object(replenisher, '_generate_and_save', return_value=1) as mock_gen:
+            replenisher._process(key)
+            replenisher._process(key)
+
+        mock_gen.assert_called_once_with(key)
+
+
+class TestDuplicateCheck:
+    """Tests for content-hash deduplication."""
+
+    def test_hash_not_remembered_before_db_check(self, replenisher):
+        """A new hash is only remembered once saved, so a failed save can be retried."""
+        with patch('services.exercise_pool_service.supabase') as mock_supabase:
+            mock_supabase.table.return_value.select.return_value.eq.return_value \
+                .limit.return_value.execute.return_value.data = []
+
+            assert replenisher._is_duplicate("h1") is False
+            assert replenisher._is_duplicate("h1") is False
+
+    def test_recent_hashes_bounded(self, replenisher):
+        """The in-memory hash set keeps only the most recent entries."""
+        with patch('services.exercise_pool_service.RECENT_HASHES_MAX', 3):
+            for i in range(5):
+                replenisher._remember_hash(f"h{i}")
+
+        assert list(replenisher._recent_hashes) == ["h2", "h3", "h4"]
+
+
+def test_content_hash_ignores_case_and_whitespace():
+    """Content hash is stable across casing and whitespace."""
+    assert _content_hash("dictation", {"text": "Hello  World"}) == _content_hash("dictation", {"text": "hello world "})
@@ -0,0 +1,154 @@
+"""Unit tests for core.llm (circuit breaker, streaming)."""
+from unittest.mock import patch, MagicMock
+from core.llm import ModelHealth, _backoff_delay, _pick_model, get_model_health, generate_response_stream
+
+
+class TestModelHealth:
+    """Tests for ModelHealth state transitions."""
+
+    def test_opens_after_error_rate_threshold(self):
+        """Breaker opens once the rolling error rate crosses the threshold."""
+        health = ModelHealth('test-model', min_calls=4, error_rate_threshold=0.5)
+        health.record(True, 0.1)
+        health.record(False, 0.1)
+        health.record(True, 0.1)
+        assert health.state == ModelHealth.CLOSED
+        health.record(False, 0.1)
+
+        assert health.state == ModelHealth.OPEN
+        assert health.allow_request() is False
+
+    def test_half_open_allows_single_probe(self):
+        """After the open period only one probe request is allowed."""
+        health = ModelHealth('test-model', min_calls=1, open_seconds=0)
+        health.record(False, 0.1)
+        assert health.state == ModelHealth.OPEN
+
+        assert health.allow_request() is True
+        assert health.state == ModelHealth.HALF_OPEN
+        assert health.allow_request() is False
+
+    def test_probe_success_closes_breaker(self):
+        """A successful probe closes the breaker and resets the window."""
+        health = ModelHealth('test-model', min_calls=1, open_seconds=0)
+        health.record(False, 0.1)
+        health.allow_request()
+        health.record(True, 0.2)
+
+        assert health.state == ModelHealth.CLOSED
+        assert health.snapshot()['error_rate'] == 0.0
+
+    def test_probe_failure_reopens_breaker(self):
+        """A failed probe puts the breaker back into the open state."""
+        health = ModelHealth('test-model', min_calls=1, open_seconds=0)
+        health.record(False, 0.1)
+        health.allow_request()
+        health.record(False, 0.1)
+
+        assert health.state == ModelHealth.OPEN
+
+    def test_unrecorded_probe_expires(self):
+        """A probe that never reports back does not block the model forever."""
+        health = ModelHealth('test-model', min_calls=1, open_seconds=0, probe_timeout=10)
+        with patch('core.llm.time.monotonic', return_value=1000.0):
+            health.record(False, 0.1)
+            assert health.allow_request() is True
+            assert health.allow_request() is False
+        with patch('core.llm.time.monotonic', return_value=1010.0):
+            assert health.allow_request() is True
+
+
+class TestRetryHelpers:
+    """Tests for backoff and model selection helpers."""
+
+    def test_backoff_delay_is_capped(self):
+        """Jittered delay never exceeds the cap."""
+        for attempt in range(10):
+            assert 0 <= _backoff_delay(attempt, base=0.5, cap=2.0) <= 2.0
+
+    def test_pick_model_skips_open_breaker(self):
+        """Models with an open breaker are skipped in favour of the next one."""
+        primary = get_model_health('primary-test')
+        primary.state = ModelHealth.OPEN
+        primary.opened_at = float('inf')
+
+        assert _pick_model(('primary-test', 'secondary-test')) == 'secondary-test'
+
+    def test_pick_model_returns_none_when_all_open(self):
+        """Returns None when every breaker in the chain is open."""
+        health = get_model_health('only-test')
+        health.state = ModelHealth.OPEN
+        health.opened_at = float('inf')
+
+        assert _pick_model(('only-test',)) is None
+
+
+class TestGenerateResponseStream:
+    """Tests for generate_response_stream."""
+
+    def test_cache_hit_yields_cached_text(self):
+        """A cache hit yields the cached text without calling Gemini."""
+        with patch('core.llm._get_cached_text', return_value='cached answer'), \
+             patch('core.llm._get_gemini_client') as mock_client:
+            chunks = list(generate_response_stream('prompt'))
+
+        assert chunks == ['cached answer']
+        mock_client.assert_not_called()
+
+    def test_streams_chunks_and_caches_full_text(self):
+        """Chunks are yielded in order and the full text is cached at the end."""
+        with patch('core.llm._get_cached_text', return_value=None), \
+             patch('core.llm._get_gemini_client', return_value=MagicMock()), \
+             patch('core.llm._before_ai_call'), \
+             patch('core.llm._pick_model', return_value='stream-test'), \
+             patch('core.llm._stream_model_text', return_value=iter(['Hel', 'lo'])), \
+             patch('core.llm._after_ai_success') as mock_success:
+            chunks = list(generate_response_stream('prompt', feature_type='writing'))
+
+        assert chunks == ['Hel', 'lo']
+        assert mock_success.call_count == 1
+        assert mock_success.call_args[0][:3] == ('prompt', 'Hello', 'writing')
+
+    def test_abandoned_stream_records_probe_result(self):
+        """Closing the stream after the first chunk still reports the half-open probe."""
+        health = get_model_health('abandon-test')
+        health.state = ModelHealth.HALF_OPEN
+        health._probe_in_flight = False
+        with patch('core.llm._get_cached_text', return_value=None), \
+             patch('core.llm._get_gemini_client', return_value=MagicMock()), \
+             patch('core.llm._before_ai_call'), \
+             patch('core.llm._pick_model', side_effect=lambda: 'abandon-test' if health.allow_request() else None), \
+             patch('core.llm._stream_model_text', return_value=iter(['Hel', 'lo'])):
+            stream = generate_response_stream('prompt')
+            assert next(stream) == 'Hel'
+            stream.close()
+
+        assert health.state == ModelHealth.CLOSED
+        assert health.allow_request() is True
+
+    def test_falls_back_when_all_breakers_open(self):
+        """Yields a fallback response when no model is available."""
+        with patch('core.llm._get_cached_text', return_value=None), \
+             patch('core.llm._get_gemini_client', return_value=MagicMock()), \
+             patch('core.llm._before_ai_call'), \
+             patch('core.llm._pick_model', return_value=None):
+            chunks = list(generate_response_stream('prompt', ['fallback']))
+
+        assert chunks == ['fallback']
+
+
+class TestSessionFreeCalls:
+    """Tests for use_session=False (background threads)."""
+
+    def test_no_session_state_access(self):
+        """A session-free call never reads or writes st.session_state."""
+        import core.llm as llm
+        with patch('core.llm._get_cached_text', return_value=None), \
+             patch('core.llm._get_gemini_client', return_value=MagicMock()), \
+             patch('core.llm._pick_model', return_value='m'), \
+             patch('core.llm._call_model_with_health', return_value=(True, 'ok')), \
+             patch('core.llm.record_llm_call'), \
+             patch.object(llm, 'st') as mock_st:
+            assert llm.generate_response_with_fallback('p', use_cache=False, use_session=False) == 'ok'
+
+        assert not mock_st.session_state.mock_calls
@@ -0,0 +1,100 @@
+"""Unit tests for core.llm_output JSON extraction and schema validation."""
+from core.llm_output import extract_json, extract_partial_fields, repair_json, validate_schema
+
+
+class TestExtractJson:
+    """Tests for extract_json."""
+
+    def test_nested_object_in_code_block(self):
+        """Nested objects inside a markdown block are returned whole."""
+        raw = 'Here you go:\n```json\n{"a": {"b": [1, {"c": 2}]}, "d": "x"}\n```\nThanks!'
+
+        assert extract_json(raw) == {"a": {"b": [1, {"c": 2}]}, "d": "x"}
+
+    def test_brackets_inside_strings_are_ignored(self):
+        """Braces inside string values do not end the match early."""
+        raw = 'Result: {"text": "use {curly} and [square] brackets", "n": 1} done {not json}'
+
+        assert extract_json(raw) == {"text": "use {curly} and [square] brackets", "n": 1}
+
+    def test_skips_prose_braces(self):
+        """Non-JSON braces before the payload are skipped."""
+        raw = 'Note {this is prose} then [{"question": "Q?"}]'
+
+        assert extract_json(raw) == [{"question": "Q?"}]
+
+    def test_repairs_trailing_commas(self):
+        """Trailing commas before closing brackets are removed."""
+        assert extract_json('{"options": ["A", "B",], "answer": "A",}') == {"options": ["A", "B"], "answer": "A"}
+
+    def test_repairs_smart_quotes(self):
+        """Smart quote delimiters are normalized."""
+        assert extract_json('{“text”: “hello”}') == {"text": "hello"}
+
+    def test_python_style_dict(self):
+        """Single-quoted dicts are accepted as a last resort."""
+        assert extract_json("{'mnemonic': 'abc', 'story': 'xyz'}") == {"mnemonic": "abc", "story": "xyz"}
+
+    def test_invalid_outer_object_does_not_return_inner(self):
+        """A broken top-level value is rejected whole, not replaced by a nested fragment."""
+        assert extract_json('{"a": {"b": 1}, "c": [1,2,}') is None
+
+    def test_truncated_outer_object_does_not_return_inner(self):
+        """A truncated answer does not yield one of its inner arrays."""
+        raw = '{"title": "Lesson", "questions": [{"q": 1}], "text": "The story beg'
+
+        assert extract_json(raw) is None
+
+    def test_no_json_returns_none(self):
+        """Returns None when there is no JSON value."""
+        assert extract_json("ERROR") is None
+        assert extract_json("") is None
+
+    def test_repair_json_rejects_garbage(self):
+        """repair_json reports failure on unparseable input."""
+        assert repair_json("{not: json") == (False, None)
+
+
+class TestValidateSchema:
+    """Tests for validate_schema."""
+
+    def test_valid_dictation(self):
+        """A complete dictation object passes."""
+        data = {"text": "Hello there.", "translation": "Xin chào."}
+
+        assert validate_schema(data, "dictation") == data
+
+    def test_missing_key_fails(self):
+        """Missing required keys fail validation."""
+        assert validate_schema({"text": "Hello"}, "dictation") is None
+
+    def test_array_drops_invalid_items(self):
+        """Invalid array items are dropped, valid ones kept."""
+        data = [
+            {"question": "Q1", "options": ["a", "b"], "answer": "a"},
+            {"question": "Q2"},
+        ]
+
+        assert validate_schema(data, "grammar_question") == [data[0]]
+
+    def test_array_below_min_items_fails(self):
+        """Arrays with no valid items fail validation."""
+        assert validate_schema([{"question": "Q2"}], "grammar_question") is None
+
+
+class TestExtractPartialFields:
+    """Tests for reading prose fields out of a JSON stream."""
+
+    def test_unterminated_field_returns_text_so_far(self):
+        """A field still being streamed is returned up to the last complete character."""
+        partial = '{"title": "Cats", "english_content": "Cats sleep.\\nThey \\"purr'
+
+        assert extract_partial_fields(partial, ["title", "english_content", "quiz"]) == {
+            "title": "Cats",
+            "english_content": 'Cats sleep.\nThey "purr',
+        }
+
+    def test_cut_escape_sequence_is_dropped(self):
+        """An escape cut in the middle is not shown as raw backslashes."""
+        assert extract_partial_fields('{"comment": "caf\\u00', ["comment"]) == {"comment": "caf"}
+
@@ -0,0 +1,52 @@
+"""Unit tests for core.llm_telemetry."""
+import pytest
+from unittest.mock import MagicMock
+from core.llm_telemetry import LLMTelemetry, estimate_cost_usd, extract_usage
+
+
+class TestLLMTelemetry:
+    """Tests for LLMTelemetry aggregation."""
+
+    def test_summary_groups_by_feature_and_page(self):
+        """Events are aggregated per (feature_type, page)."""
+        telemetry = LLMTelemetry()
+        telemetry.record(feature_type='reading', page='reading_page', latency_ms=100, attempts=1)
+        telemetry.record(feature_type='reading', page='reading_page', latency_ms=300, attempts=2)
+        telemetry.record(feature_type='reading', page='reading_page', latency_ms=5, cache_hit=True)
+        telemetry.record(feature_type='writing', page='writing_page', latency_ms=50, attempts=1)
+
+        summary = {row['feature_type']: row for row in telemetry.summary()}
+
+        reading = summary['reading']
+        assert reading['requests'] == 3
+        assert reading['cache_hit_rate'] == pytest.approx(1 / 3, abs=0.001)
+        assert reading['p50_ms'] in (100, 300)
+        assert reading['p99_ms'] == 300
+        assert reading['retries'] == 1
+        assert telemetry.summary()[0]['feature_type'] == 'reading'
+
+    def test_ring_buffer_is_bounded(self):
+        """Only the most recent events are kept."""
+        telemetry = LLMTelemetry(max_events=3)
+        for i in range(5):
+            telemetry.record(latency_ms=i)
+
+        assert [e['latency_ms'] for e in telemetry.events()] == [2, 3, 4]
+
+
+class TestUsageHelpers:
+    """Tests for token and cost helpers."""
+
+    def test_extract_usage_reads_metadata(self):
+        """Token counts come from usage_metadata."""
+        response = MagicMock()
+        response.usage_metadata.prompt_token_count = 10
+        response.usage_metadata.candidates_token_count = 20
+        response.usage_metadata.total_token_count = 30
+
+        assert extract_usage(response) == {'prompt_tokens': 10, 'response_tokens': 20, 'total_tokens': 30}
+
+    def test_unknown_model_costs_nothing(self):
+        """Models without pricing are costed at zero."""
+        assert estimate_cost_usd('unknown-model', 1000, 1000) == 0
+        assert estimate_cost_usd('gemini-2.5-flash', 1_000_000, 0) == pytest.approx(0.30)
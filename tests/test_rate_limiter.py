@@ -0,0 +1,175 @@
+"""Unit tests for core.rate_limiter token buckets."""
+import pytest
+from unittest.mock import patch, MagicMock
+from core import rate_limiter as rl
+from core.rate_limiter import RateLimiter
+
+
+def _rpc_router(handlers, calls):
+    """supabase.rpc(name, params) -> handler(params) or raise if unknown; records calls."""
+    def _rpc(name, params=None):
+        calls.append((name, params))
+        if name not in handlers:
+            raise Exception(f"function {name} does not exist")
+        call = MagicMock()
+        call.execute.return_value.data = [handlers[name](params)]
+        return call
+    return _rpc
+
+
+@pytest.fixture
+def db():
+    """Fresh buckets and a patched supabase client; yields (mock, rpc calls)."""
+    calls = []
+    with patch.object(rl, '_buckets', {}), patch.object(rl, '_sync_rpc_retry_at', 0.0), \
+            patch.object(rl, '_last_bucket_prune', 0.0), patch.object(rl, 'supabase') as mock:
+        mock.rpc.side_effect = _rpc_router({
+            'check_rate_limit': lambda p: {'allowed': True, 'remaining': p['p_max_requests'] - 1},
+        }, calls)
+        yield mock, calls
+
+
+class TestCheckLimit:
+    """Tests for local decisions and periodic sync."""
+
+    def test_decisions_made_in_memory_between_syncs(self, db):
+        """Only the first request in a sync interval reaches the database."""
+        mock, calls = db
+        mock.rpc.side_effect = _rpc_router({
+            'sync_rate_limit': lambda p: {'allowed': True, 'remaining': p['p_max_requests'] - 1},
+        }, calls)
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            results = [RateLimiter.check_limit(1, 'learn_vocab', max_requests=5) for _ in range(7)]
+
+        assert [r['allowed'] for r in results] == [True] * 5 + [False] * 2
+        assert [name for name, _ in calls] == ['sync_rate_limit']
+        assert 'giây' in results[-1]['message']
+
+    def test_fallback_reports_every_allowed_request(self, db):
+        """Without sync_rate_limit each allowed request is recorded by check_rate_limit."""
+        mock, calls = db
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            results = [RateLimiter.check_limit(1, 'learn_vocab', max_requests=5) for _ in range(7)]
+
+        assert [r['allowed'] for r in results] == [True] * 5 + [False] * 2
+        assert [name for name, _ in calls] == ['sync_rate_limit'] + ['check_rate_limit'] * 5
+
+    def test_sync_rpc_retried_after_cooldown(self, db):
+        """A failed sync_rate_limit call is not latched off forever."""
+        mock, calls = db
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            RateLimiter.check_limit(1, 'learn_vocab')
+        mock.rpc.side_effect = _rpc_router({
+            'sync_rate_limit': lambda p: {'allowed': True, 'remaining': 50},
+        }, calls)
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0 + rl.SYNC_RPC_RETRY_SECONDS):
+            RateLimiter.check_limit(1, 'learn_vocab')
+
+        assert calls[-1][0] == 'sync_rate_limit'
+
+    def test_idle_full_buckets_are_pruned(self, db):
+        """Buckets unused for a whole window are dropped; active ones stay."""
+        mock, calls = db
+        mock.rpc.side_effect = _rpc_router({
+            'sync_rate_limit': lambda p: {'allowed': True, 'remaining': 50},
+        }, calls)
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            RateLimiter.check_limit(1, 'learn_vocab')
+            RateLimiter.check_limit(2, 'learn_vocab')
+        with patch('core.rate_limiter.time.monotonic', return_value=170.0):
+            RateLimiter.check_limit(2, 'learn_vocab')
+
+        assert set(rl._buckets) == {(2, 'learn_vocab')}
+
+    def test_tokens_refill_over_window(self, db):
+        """Tokens come back proportionally to elapsed time."""
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            for _ in range(5):
+                RateLimiter.check_limit(1, 'learn_vocab', max_requests=5)
+        with patch('core.rate_limiter.time.monotonic', return_value=112.0):
+            assert RateLimiter.check_limit(1, 'learn_vocab', max_requests=5)['allowed']
+
+    def test_database_remaining_narrows_local_bucket(self, db):
+        """Requests counted by other processes (DB remaining) shrink the local bucket."""
+        mock, calls = db
+        mock.rpc.side_effect = _rpc_router({
+            'sync_rate_limit': lambda p: {'allowed': True, 'remaining': 1},
+        }, calls)
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            results = [RateLimiter.check_limit(1, 'pvp_create', max_requests=10) for _ in range(3)]
+
+        assert [r['allowed'] for r in results] == [True, True, False]
+        assert calls[0][1]['p_request_count'] == 1
+
+    def test_pending_requests_reported_at_next_sync(self, db):
+        """Requests allowed locally are sent as one count at the next sync."""
+        mock, calls = db
+        mock.rpc.side_effect = _rpc_router({
+            'sync_rate_limit': lambda p: {'allowed': True, 'remaining': 50},
+        }, calls)
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            for _ in range(4):
+                RateLimiter.check_limit(1, 'learn_vocab')
+        with patch('core.rate_limiter.time.monotonic', return_value=100.0 + rl.RATE_LIMIT_SYNC_SECONDS):
+            RateLimiter.check_limit(1, 'learn_vocab')
+
+        assert [p['p_request_count'] for _, p in calls] == [1, 4]
+
+    def test_database_error_fails_open(self, db):
+        """A broken database never blocks users."""
+        mock, calls = db
+        mock.rpc.side_effect = Exception("connection reset")
+
+        assert RateLimiter.check_limit(1, 'learn_vocab')['allowed']
+
+
+@pytest.fixture
+def login_db():
+    """Fresh login caches and a patched supabase client."""
+    with patch.object(rl, '_login_failures', {}), patch.object(rl, '_login_blocked_until', {}), \
+            patch.object(rl, 'supabase') as mock:
+        mock.rpc.return_value.execute.return_value.data = [{'allowed': True, 'attempts_remaining': 5}]
+        yield mock
+
+
+class TestLoginLimiter:
+    """Tests for the local negative-result cache."""
+
+    def test_repeated_failures_blocked_locally(self, login_db):
+        """After max_attempts local failures, check_attempts answers without the database."""
+        for _ in range(5):
+            rl.LoginLimiter.log_attempt('Alice', success=False)
+        login_db.rpc.reset_mock()
+
+        first = rl.LoginLimiter.check_attempts('alice', max_attempts=5)
+        second = rl.LoginLimiter.check_attempts('ALICE', max_attempts=5)
+
+        assert first['allowed'] is False and second['allowed'] is False
+        login_db.rpc.assert_not_called()
+
+    def test_database_block_is_cached(self, login_db):
+        """A block reported by the database is reused for later checks."""
+        login_db.rpc.return_value.execute.return_value.data = [{'allowed': False, 'message': 'blocked'}]
+
+        rl.LoginLimiter.check_attempts('bob')
+        rl.LoginLimiter.check_attempts('bob')
+
+        assert login_db.rpc.call_count == 1
+
+    def test_checks_do_not_leave_empty_entries(self, login_db):
+        """Checking a username with no failures stores nothing, so pruning never sees an empty list."""
+        with patch.object(rl, '_LOGIN_CACHE_MAX_KEYS', 2):
+            for name in ('a', 'b', 'c'):
+                rl.LoginLimiter.check_attempts(name)
+            rl.LoginLimiter.log_attempt('d', success=False)
+
+        assert list(rl._login_failures) == ['d']
+
+    def test_success_clears_failures(self, login_db):
+        """A successful login resets the local failure count."""
+        for _ in range(4):
+            rl.LoginLimiter.log_attempt('carol', success=False)
+        rl.LoginLimiter.log_attempt('carol', success=True)
+        rl.LoginLimiter.log_attempt('carol', success=False)
+
+        assert rl.LoginLimiter.check_attempts('carol', max_attempts=5)['allowed'] is True
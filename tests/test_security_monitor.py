@@ -0,0 +1,97 @@
+"""Unit tests for SecurityMonitor sliding-window counters."""
+import pytest
+from unittest.mock import patch, MagicMock
+from core import security_monitor as sm
+from core.security_monitor import SecurityMonitor, SlidingWindowCounter
+
+
+@pytest.fixture
+def monitor():
+    """Fresh in-memory counters and a patched supabase client; yields DB count calls.
+
+    The current action is modelled as still queued in the ActivityLog writer (pending = 1).
+    """
+    db_counts = []
+    with patch.object(sm, '_counters', {}), patch.object(sm, '_rehydrated', set()), \
+            patch.object(sm, '_last_db_check', {}), patch.object(sm, 'supabase', MagicMock()), \
+            patch.object(SecurityMonitor, '_db_count', side_effect=lambda *a, **k: db_counts.append(a) or 0), \
+            patch.object(sm, 'count_pending_activity_logs', return_value=1), \
+            patch.object(SecurityMonitor, '_handle_suspicious_activity') as handle:
+        yield db_counts, handle
+
+
+class TestSlidingWindowCounter:
+    """Tests for the ring-buffer counter."""
+
+    def test_events_expire_after_window(self):
+        """Only events inside the window are counted."""
+        counter = SlidingWindowCounter(60)
+        counter.add(1000.0)
+        counter.add(1030.0, n=2)
+
+        assert counter.count(1030.0) == 3
+        assert counter.count(1065.0) == 2
+        assert counter.count(1100.0) == 0
+
+    def test_long_window_uses_coarse_buckets(self):
+        """A 10-minute window still uses a bounded number of buckets."""
+        counter = SlidingWindowCounter(600)
+
+        assert counter.size == SlidingWindowCounter.BUCKETS
+        counter.add(0.0)
+        assert counter.count(590.0) == 1
+
+
+class TestCheckSuspiciousPatterns:
+    """Tests for threshold checks without per-action queries."""
+
+    def test_database_only_for_rehydrate_below_threshold(self, monitor):
+        """Normal traffic queries ActivityLog once (rehydrate), not on every action."""
+        db_counts, handle = monitor
+        with patch('core.security_monitor.time.time', return_value=1000.0):
+            for _ in range(30):
+                SecurityMonitor._check_suspicious_patterns(1, 'vocab_review', True)
+
+        assert len(db_counts) == 1
+        handle.assert_not_called()
+
+    def test_near_threshold_confirms_with_database(self, monitor):
+        """Crossing 80% of the threshold triggers a DB check, whose count decides the alert."""
+        db_counts, handle = monitor
+        threshold = SecurityMonitor.SUSPICIOUS_PATTERNS['rapid_actions']['threshold']
+        near = int(threshold * SecurityMonitor.NEAR_THRESHOLD_RATIO)
+        with patch('core.security_monitor.time.time', return_value=1000.0):
+            for _ in range(near):
+                SecurityMonitor._check_suspicious_patterns(1, 'vocab_review', True)
+        assert len(db_counts) == 1
+
+        with patch('core.security_monitor.time.time', return_value=1010.0):
+            SecurityMonitor._check_suspicious_patterns(1, 'vocab_review', True)
+            SecurityMonitor._check_suspicious_patterns(1, 'vocab_review', True)
+        assert len(db_counts) == 2  # Re-check throttled to once per DB_RECHECK_SECONDS
+        handle.assert_not_called()
+
+        with patch.object(SecurityMonitor, '_db_count', return_value=threshold + 5), \
+                patch('core.security_monitor.time.time', return_value=1020.0):
+            SecurityMonitor._check_suspicious_patterns(1, 'vocab_review', True)
+
+        assert handle.call_args[0][1] == 'rapid_actions'
+
+    def test_rehydrated_count_seeds_counter(self, monitor):
+        """After a restart the DB count plus the queued current action is loaded into the counter."""
+        with patch.object(SecurityMonitor, '_db_count', return_value=30), \
+                patch('core.security_monitor.time.time', return_value=1000.0):
+            SecurityMonitor._check_suspicious_patterns(7, 'vocab_review', True)
+
+        assert sm._counters[(7, 'actions')].count(1000.0) == 31
+
+    def test_queued_rows_count_toward_threshold(self, monitor):
+        """Rows not yet written by the ActivityLog writer are added to the DB count."""
+        _, handle = monitor
+        threshold = SecurityMonitor.SUSPICIOUS_PATTERNS['rapid_actions']['threshold']
+        with patch.object(SecurityMonitor, '_db_count', return_value=threshold - 2), \
+                patch.object(sm, 'count_pending_activity_logs', return_value=5), \
+                patch('core.security_monitor.time.time', return_value=1000.0):
+            SecurityMonitor._check_suspicious_patterns(7, 'vocab_review', True)
+
+        assert handle.call_args[0][1] == 'rapid_actions'
@@ -0,0 +1,203 @@
+"""Unit tests for core.tts."""
+import asyncio
+from unittest.mock import patch
+from core import tts
+
+
+def _long_text(sentences=6, length=2500):
+    """Text that splits into several chunks, one distinct sentence each."""
+    return " ".join(f"S{i} " + "x" * length + "." for i in range(sentences))
+
+
+class TestChunkedSynthesis:
+    """Tests for long-text chunk synthesis in text_to_speech."""
+
+    def test_chunks_run_concurrently_and_keep_order(self):
+        """Chunks overlap (bounded by CHUNK_CONCURRENCY) and are joined in order."""
+        running = {'now': 0, 'peak': 0}
+
+        async def fake_communicate(text_chunk, voice, max_retries=3, retry_count=0):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            # Later chunks finish first to prove reassembly follows input order
+            await asyncio.sleep(0.01 * (10 - int(text_chunk.split()[0][1:])))
+            running['now'] -= 1
+            return text_chunk.split()[0].encode()
+
+        text = _long_text()
+        chunks = tts._split_text_chunks(text)
+        with patch.object(tts, '_try_communicate', fake_communicate):
+            audio = asyncio.run(tts.text_to_speech(text, use_cache=False))
+
+        assert audio == b"".join(c.split()[0].encode() for c in chunks)
+        assert 1 < running['peak'] <= tts.CHUNK_CONCURRENCY
+
+    def test_partial_failure_caches_chunks_not_whole_text(self):
+        """Successful chunks are cached individually; the incomplete result is not."""
+        async def fake_communicate(text_chunk, voice, max_retries=3, retry_count=0):
+            return None if text_chunk.startswith("S1 ") else b"a"
+
+        cached = []
+        text = _long_text(sentences=4)
+        with patch.object(tts, '_try_communicate', fake_communicate), \
+                patch('services.tts_cache_service.get_cached_audio', return_value=None), \
+                patch('services.tts_cache_service.cache_audio', side_effect=lambda t, *a: cached.append(t)):
+            audio = asyncio.run(tts.text_to_speech(text))
+
+        assert audio
+        assert text not in cached
+        assert len(cached) == len(tts._split_text_chunks(text)) - 1
+
+    def test_cached_chunks_are_not_resynthesized(self):
+        """Chunks already in cache skip Edge TTS."""
+        calls = []
+
+        async def fake_communicate(text_chunk, voice, max_retries=3, retry_count=0):
+            calls.append(text_chunk)
+            return b"new"
+
+        text = _long_text(sentences=4)
+        chunks = tts._split_text_chunks(text)
+        cache = {chunks[0]: (b"old", "")}
+        with patch.object(tts, '_try_communicate', fake_communicate), \
+                patch('services.tts_cache_service.get_cached_audio', side_effect=lambda t, v: cache.get(t)), \
+                patch('services.tts_cache_service.cache_audio'):
+            audio = asyncio.run(tts.text_to_speech(text))
+
+        assert chunks[0] not in calls
+        assert audio.startswith(b"old")
+
+
+class TestDialogueSynthesis:
+    """Tests for text_to_speech_dialogue."""
+
+    def _run(self, script, cache):
+        synthesized = []
+
+        async def fake_communicate(text_chunk, voice, max_retries=3, retry_count=0):
+            synthesized.append((text_chunk, voice))
+            return f"[{voice}:{text_chunk}]".encode()
+
+        def fake_cache_audio(text, voice, audio_bytes, length=None):
+            cache[(text, voice)] = (audio_bytes, "")
+
+        with patch.object(tts, '_try_communicate', fake_communicate), \
+                patch('services.tts_cache_service.get_cached_audio', side_effect=lambda t, v: cache.get((t, v))), \
+                patch('services.tts_cache_service.cache_audio', side_effect=fake_cache_audio):
+            audio = asyncio.run(tts.text_to_speech_dialogue(script, "M", "F"))
+        return audio, synthesized
+
+    def test_lines_keep_order_and_voices(self):
+        """Lines are assembled in script order with the mapped voice."""
+        audio, _ = self._run("Male: Hello there. Female: Hi, how are you?", {})
+
+        assert audio == b"[M:Hello there.][F:Hi, how are you?]"
+
+    def test_edited_line_reuses_other_lines(self):
+        """Changing one line only synthesizes that line again."""
+        cache = {}
+        self._run("Male: Hello there. Female: Hi, how are you?", cache)
+
+        audio, synthesized = self._run("Male: Hello there. Female: Hi, nice to meet you.", cache)
+
+        assert synthesized == [("Hi, nice to meet you.", "F")]
+        assert audio == b"[M:Hello there.][F:Hi, nice to meet you.]"
+
+    def test_cache_key_covers_whole_script(self):
+        """Scripts sharing the first 100 characters get different keys."""
+        opening = "Male: " + "a" * 120
+        assert tts._dialogue_cache_key(opening + " Female: one.", "M", "F") != \
+            tts._dialogue_cache_key(opening + " Female: two.", "M", "F")
+
+
+class TestBackgroundLoop:
+    """Tests for the shared TTS event loop and sync wrappers."""
+
+    def test_sync_wrapper_runs_on_background_loop(self):
+        """get_tts_audio works even when the caller already has a running loop."""
+        async def fake_tts(text, voice="v", max_retries=3, use_cache=True, **kwargs):
+            return asyncio.get_running_loop()
+
+        async def caller():
+            return tts.get_tts_audio("hi")
+
+        with patch.object(tts, 'text_to_speech', fake_tts):
+            loop_used = asyncio.run(caller())
+
+        assert loop_used is tts.get_tts_loop()
+
+    def test_timeout_returns_none(self):
+        """A clip slower than the timeout yields None instead of blocking."""
+        async def slow_tts(text, voice="v", max_retries=3, use_cache=True, **kwargs):
+            await asyncio.sleep(5)
+            return b"late"
+
+        with patch.object(tts, 'text_to_speech', slow_tts):
+            assert tts.get_tts_audio("hi", timeout=0.05) is None
+
+
+class TestAudioSource:
+    """Tests for URL-first audio delivery."""
+
+    def test_cached_clip_returns_url(self):
+        """A cached clip is served by URL without synthesizing bytes."""
+        with patch('services.tts_cache_service.get_cached_audio_url', return_value='https://x/a.mp3'), \
+                patch.object(tts, 'get_tts_audio') as mock_bytes:
+            assert tts.get_tts_audio_source("hello") == 'https://x/a.mp3'
+            mock_bytes.assert_not_called()
+
+    def test_uncached_clip_falls_back_to_bytes(self):
+        """Without a URL the clip is generated and returned as bytes."""
+        with patch('services.tts_cache_service.get_cached_audio_url', return_value=None), \
+                patch.object(tts, 'get_tts_audio', return_value=b"audio"):
+            assert tts.get_tts_audio_source("hello") == b"audio"
+
+
+class TestSegmentFutures:
+    """Tests for progressive segment synthesis."""
+
+    def test_first_segment_ready_before_later_ones(self):
+        """Futures resolve independently so the first segment can play early."""
+        async def fake_tts(text, voice="v", max_retries=3, use_cache=True, **kwargs):
+            await asyncio.sleep(0.01 if text == "first" else 0.3)
+            return text.encode()
+
+        with patch.object(tts, 'text_to_speech', fake_tts):
+            futures = tts.tts_segment_futures([("first", "v", None), ("second", "v", None)])
+            assert tts.wait_for_audio(futures[0], timeout=1) == b"first"
+            assert not futures[1].done()
+            assert tts.wait_for_audio(futures[1], timeout=2) == b"second"
+
+    def test_fallback_voice_used_when_primary_fails(self):
+        """A segment that fails with the main voice retries with the fallback voice."""
+        async def fake_tts(text, voice="v", max_retries=3, use_cache=True, **kwargs):
+            return None if voice == "main" else voice.encode()
+
+        with patch.object(tts, 'text_to_speech', fake_tts):
+            futures = tts.tts_segment_futures([("hi", "main", "backup")])
+            assert tts.wait_for_audio(futures[0], timeout=2) == b"backup"
+
+
+class TestSentenceCache:
+    """Tests for sentence-level caching."""
+
+    def test_shared_sentence_reused_across_texts(self):
+        """A sentence cached for one passage is not synthesized again for another."""
+        cache = {}
+        synthesized = []
+
+        async def fake_communicate(text_chunk, voice, max_retries=3, retry_count=0):
+            synthesized.append(text_chunk)
+            return text_chunk.encode()
+
+        def fake_cache_audio(text, voice, audio_bytes, length=None):
+            cache[text] = (audio_bytes, "")
+
+        with patch.object(tts, '_try_communicate', fake_communicate), \
+                patch('services.tts_cache_service.get_cached_audio', side_effect=lambda t, v: cache.get(t)), \
+                patch('services.tts_cache_service.cache_audio', side_effect=fake_cache_audio):
+            asyncio.run(tts.text_to_speech("I like tea. It is hot.", sentence_cache=True))
+            audio = asyncio.run(tts.text_to_speech("It is hot.  Drink it now!", sentence_cache=True))
+
+        assert synthesized == ["I like tea.", "It is hot.", "Drink it now!"]
+        assert audio == b"It is hot.Drink it now!"
@@ -0,0 +1,255 @@
+"""Unit tests for tts_cache_service."""
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+from services import tts_cache_service as tcs
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    """A small disk cache installed as the process-wide one."""
+    cache = tcs.TTSDiskCache(str(tmp_path), max_bytes=100)
+    with patch.object(tcs, '_disk_cache', cache):
+        yield cache
+
+
+class TestTTSDiskCache:
+    """Tests for the local disk tier."""
+
+    def test_put_then_get(self, disk_cache, tmp_path):
+        """Audio is stored as <hash>.mp3 with no temp files left behind."""
+        disk_cache.put("abc", b"audio")
+
+        assert disk_cache.get("abc") == b"audio"
+        assert os.listdir(tmp_path) == ["abc.mp3"]
+
+    def test_evicts_least_recently_used(self, disk_cache):
+        """Going over the byte budget removes the least recently read entry."""
+        disk_cache.put("a", b"x" * 40)
+        disk_cache.put("b", b"x" * 40)
+        disk_cache.get("a")
+        disk_cache.put("c", b"x" * 40)
+
+        assert disk_cache.get("b") is None
+        assert disk_cache.get("a") and disk_cache.get("c")
+        assert disk_cache.stats()["size_bytes"] == 80
+
+    def test_index_rebuilt_from_directory(self, disk_cache, tmp_path):
+        """A new instance picks up files written by a previous process."""
+        disk_cache.put("abc", b"audio")
+
+        reopened = tcs.TTSDiskCache(str(tmp_path), max_bytes=100)
+
+        assert reopened.get("abc") == b"audio"
+
+    def test_disabled_with_zero_budget(self, tmp_path):
+        """max_bytes=0 turns the tier off."""
+        cache = tcs.TTSDiskCache(str(tmp_path / "off"), max_bytes=0)
+        cache.put("abc", b"audio")
+
+        assert cache.get("abc") is None
+
+
+class TestGetCachedAudio:
+    """Tests for get_cached_audio tiers."""
+
+    def test_disk_hit_skips_supabase(self, disk_cache):
+        """A disk hit returns without touching the database or Storage."""
+        disk_cache.put(tcs.generate_text_hash("hello", "v"), b"audio")
+
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            assert tcs.get_cached_audio("hello", "v") == (b"audio", "")
+            mock_supabase.table.assert_not_called()
+
+    def test_storage_download_fills_disk(self, disk_cache):
+        """Audio downloaded from Storage is written to disk for the next call."""
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            mock_supabase.table.return_value.select.return_value.eq.return_value \
+                .maybe_single.return_value.execute.return_value.data = {'file_path': 'h.mp3', 'file_url': 'u'}
+            mock_supabase.storage.from_.return_value.download.return_value = b"remote"
+
+            assert tcs.get_cached_audio("hello", "v") == (b"remote", "u")
+
+        assert disk_cache.get(tcs.generate_text_hash("hello", "v")) == b"remote"
+
+
+class TestGetCachedAudioUrl:
+    """Tests for metadata-only URL lookup."""
+
+    def _mock_row(self, mock_supabase, row):
+        mock_supabase.table.return_value.select.return_value.eq.return_value \
+            .maybe_single.return_value.execute.return_value.data = row
+
+    def test_public_url_returned_without_download(self):
+        """Cached clips resolve to their public URL; Storage is not downloaded."""
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            self._mock_row(mock_supabase, {'file_url': 'https://x/tts.mp3', 'file_path': 'h.mp3'})
+
+            assert tcs.get_cached_audio_url("hello") == 'https://x/tts.mp3'
+            mock_supabase.storage.from_.return_value.download.assert_not_called()
+
+    def test_relative_url_is_not_playable(self):
+        """The manual '/storage/...' fallback URL is ignored so callers use bytes."""
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            self._mock_row(mock_supabase, {'file_url': '/storage/v1/object/public/tts-audio/h.mp3'})
+
+            assert tcs.get_cached_audio_url("hello") is None
+
+    def test_signed_url_when_enabled(self):
+        """Private buckets get a signed URL for the stored file."""
+        with patch.object(tcs, 'supabase') as mock_supabase, patch.object(tcs, 'TTS_SIGNED_URLS', True):
+            self._mock_row(mock_supabase, {'file_url': 'https://x/tts.mp3', 'file_path': 'h.mp3'})
+            mock_supabase.storage.from_.return_value.create_signed_url.return_value = {'signedURL': 'https://x/signed'}
+
+            assert tcs.get_cached_audio_url("hello") == 'https://x/signed'
+
+
+class TestNormalizeTtsText:
+    """Tests for TTS text normalization before hashing."""
+
+    def test_spacing_variants_share_hash(self):
+        """Whitespace and punctuation spacing differences map to one cache entry."""
+        variants = ["Hello , world !  ", "Hello, world!", " Hello,world!", "Hello,\n world !"]
+
+        assert len({tcs.generate_text_hash(v, "v") for v in variants}) == 1
+
+    def test_smart_quotes_normalized(self):
+        """Typographic quotes hash like ASCII quotes."""
+        assert tcs.normalize_tts_text("It’s “fine”") == "It's \"fine\""
+
+    def test_clean_text_keeps_legacy_hash(self):
+        """Already-clean text hashes exactly as before, so existing entries stay valid."""
+        import hashlib
+        assert tcs.generate_text_hash("Hello there.", "v") == hashlib.md5(b"Hello there.|v").hexdigest()
+
+    def test_case_is_preserved(self):
+        """Case changes pronunciation (acronyms), so it is not folded."""
+        assert tcs.generate_text_hash("US", "v") != tcs.generate_text_hash("us", "v")
+
+
+class TestCacheAudioEncoding:
+    """Tests for compact variants in cache_audio."""
+
+    def test_compact_variant_stored_with_real_duration(self, disk_cache):
+        """The compact encoding is what gets uploaded and cached locally."""
+        with patch.object(tcs, 'supabase') as mock_supabase, \
+                patch.object(tcs, 'encode_compact_mp3', return_value=(b"small", 2.6)):
+            mock_supabase.storage.from_.return_value.get_public_url.return_value = "https://x/h.mp3"
+
+            tcs.cache_audio("hello", "v", b"original audio bytes")
+
+            uploaded = mock_supabase.storage.from_.return_value.upload.call_args[0][1]
+            rpc_params = mock_supabase.rpc.call_args[0][1]
+
+        assert uploaded == b"small"
+        assert rpc_params['p_file_size_bytes'] == len(b"small")
+        assert rpc_params['p_audio_length_seconds'] == 3
+        assert disk_cache.get(tcs.generate_text_hash("hello", "v")) == b"small"
+
+
+class TestCacheGC:
+    """Tests for the storage-budget garbage collector."""
+
+    # Already in _EVICTION_ORDER, as the server returns them
+    ROWS = [
+        {'text_hash': 'old', 'file_path': 'old.mp3', 'file_size_bytes': 30, 'usage_count': 1, 'last_used_at': '2026-01-01'},
+        {'text_hash': 'new', 'file_path': 'new.mp3', 'file_size_bytes': 30, 'usage_count': 1, 'last_used_at': '2026-01-04'},
+        {'text_hash': 'hot', 'file_path': 'hot.mp3', 'file_size_bytes': 40, 'usage_count': 9, 'last_used_at': '2026-01-05'},
+    ]
+
+    def _mock_rows(self, mock_supabase, rows):
+        """Any .order() chain returns the same query; range() pages through rows."""
+        query = mock_supabase.table.return_value.select.return_value
+        query.order.return_value = query
+        query.range.side_effect = lambda start, end: MagicMock(
+            execute=MagicMock(return_value=MagicMock(data=rows[start:end + 1])))
+        mock_supabase.rpc.side_effect = Exception("function get_tts_cache_stats does not exist")
+        return query
+
+    def test_evicts_cold_entries_until_under_budget(self):
+        """Rows are read in server-side eviction order; only what is needed is deleted."""
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            query = self._mock_rows(mock_supabase, self.ROWS)
+
+            report = tcs.run_cache_gc(budget_bytes=70)
+
+            hashes = mock_supabase.table.return_value.delete.return_value.in_.call_args[0][1]
+            removed = mock_supabase.storage.from_.return_value.remove.call_args[0][0]
+            ordered_by = [c[0][0] for c in query.order.call_args_list]
+
+        assert hashes == ['old']
+        assert removed == ['old.mp3']
+        assert report['deleted_bytes'] == 30
+        assert ordered_by[-4:] == ['usage_count', 'last_used_at', 'file_size_bytes', 'text_hash']
+
+    def test_stops_reading_once_budget_is_met(self):
+        """Only the pages needed to free enough space are fetched."""
+        with patch.object(tcs, 'supabase') as mock_supabase, patch.object(tcs, 'CACHE_SCAN_PAGE_SIZE', 1):
+            query = self._mock_rows(mock_supabase, self.ROWS)
+
+            evictions, total = tcs.select_cache_evictions(70)
+            eviction_pages = query.range.call_count - 4  # 4 pages for the stats scan
+
+        assert [r['text_hash'] for r in evictions] == ['old']
+        assert total == 100
+        assert eviction_pages == 1
+
+    def test_dry_run_deletes_nothing(self):
+        """Dry-run reports the plan without touching rows or Storage."""
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            self._mock_rows(mock_supabase, self.ROWS)
+
+            report = tcs.run_cache_gc(budget_bytes=10, dry_run=True)
+
+            mock_supabase.table.return_value.delete.assert_not_called()
+            mock_supabase.storage.from_.return_value.remove.assert_not_called()
+
+        assert report['evict_entries'] == 3
+        assert report['deleted_entries'] == 0
+
+    def test_invalid_batch_size_rejected(self):
+        """batch_size < 1 is an error instead of a silent no-op."""
+        with pytest.raises(ValueError):
+            tcs.run_cache_gc(budget_bytes=0, batch_size=0)
+
+    def test_stats_scan_pages_when_rpc_missing(self):
+        """Without the stats RPC, sizes are summed page by page."""
+        with patch.object(tcs, 'supabase') as mock_supabase, patch.object(tcs, 'CACHE_SCAN_PAGE_SIZE', 2):
+            self._mock_rows(mock_supabase, self.ROWS)
+
+            stats = tcs.get_cache_stats()
+
+        assert stats['total_entries'] == 3
+        assert stats['total_size_bytes'] == 100
+
+
+class TestCacheUsage:
+    """Tests for usage tracking on the fast read paths."""
+
+    def test_disk_and_url_hits_record_usage(self, disk_cache):
+        """Disk-tier and URL hits count as usage so GC keeps hot clips."""
+        disk_cache.put(tcs.generate_text_hash("hello", "v"), b"audio")
+        with patch.object(tcs, 'supabase') as mock_supabase, patch.object(tcs, 'record_cache_usage') as record:
+            mock_supabase.table.return_value.select.return_value.eq.return_value \
+                .maybe_single.return_value.execute.return_value.data = {'file_url': 'https://x/a.mp3'}
+            tcs.get_cached_audio("hello", "v")
+            tcs.get_cached_audio_url("bye", "v")
+
+        assert [c[0][0] for c in record.call_args_list] == [
+            tcs.generate_text_hash("hello", "v"), tcs.generate_text_hash("bye", "v")]
+
+    def test_flush_adds_pending_counts(self):
+        """Pending hits are added to the stored usage_count in one batch read."""
+        recorder = tcs._CacheUsageRecorder()
+        recorder._pending = {'a': 3}
+        with patch.object(tcs, 'supabase') as mock_supabase:
+            mock_supabase.table.return_value.select.return_value.in_.return_value \
+                .execute.return_value.data = [{'text_hash': 'a', 'usage_count': 5}]
+            mock_supabase.rpc.return_value.execute.return_value.data = 'SUCCESS'
+
+            recorder.flush()
+
+            params = mock_supabase.rpc.call_args[0][1]
+
+        assert params['p_usage_count'] == 8
+        assert recorder._pending == {}
@@ -64,11 +64,13 @@ class TestLogActivity:
         mock_supabase.table.return_value.insert.return_value.execute.return_value = mock_insert
         
         # Act
-        with patch('services.user_service.supabase', mock_supabase):
+        with patch('services.user_service.supabase', mock_supabase), \
+                patch('services.user_service.enqueue_activity_log') as mock_enqueue:
             log_activity(1, 'quiz_complete', 10)
         
-        # Assert
-        mock_supabase.table.assert_called_with('ActivityLog')
+        # Assert - row is queued for the background ActivityLog writer
+        row = mock_enqueue.call_args[0][0]
+        assert row['action_type'] == 'quiz_complete' and row['value'] == 10
     
     def test_log_activity_with_zero_value(self, mock_supabase):
         """Test logging activity with zero value."""
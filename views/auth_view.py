@@ -26,6 +26,9 @@ def render_auth_page():
                     user = check_login(u, p)
                     if user == "LOCKED":
                         st.error("Tài khoản đã bị khóa.")
+                    elif user == "TOO_MANY_ATTEMPTS":
+                        st.error(st.session_state.pop('login_error_message', None)
+                                 or "Bạn đã đăng nhập sai quá nhiều lần. Vui lòng thử lại sau.")
                     elif user:
                         st.session_state.logged_in = True
                         st.session_state.user_info = user
@@ -4,7 +4,7 @@ import pandas as pd
 from typing import List, Dict, Any
 import logging
 
-from core.tts import get_tts_audio
+from core.tts import get_tts_audio_source
 from core.vocab_utils import normalize_meaning, get_vietnamese_meaning, format_pronunciation
 
 logger = logging.getLogger(__name__)
@@ -183,9 +183,9 @@ def render_word_detail_card(word_data: Dict[str, Any], index: int) -> None:
             # Audio button - TTS is already cached, so rerun is fast
             if st.button("🔊", key=f"audio_{index}_{word_data.get('id', index)}", help="Phát âm"):
                 # TTS uses cache internally, so this is fast
-                audio_bytes = get_tts_audio(word_data['word'])
-                if audio_bytes:
-                    st.audio(audio_bytes, format='audio/mp3', autoplay=True)
+                audio_source = get_tts_audio_source(word_data['word'])
+                if audio_source:
+                    st.audio(audio_source, format='audio/mp3', autoplay=True)
         
         # Meaning
         st.markdown(f"**Nghĩa:** *{word_data['meaning']}*")
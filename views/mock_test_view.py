@@ -108,7 +108,7 @@ def render_listening_section(data: Dict[str, Any]) -> Dict[int, str]:
     Returns:
         Dictionary of user answers
     """
-    from core.tts import get_tts_audio
+    from core.tts import get_tts_audio_source
     import logging
     
     logger = logging.getLogger(__name__)
@@ -120,7 +120,7 @@ def render_listening_section(data: Dict[str, Any]) -> Dict[int, str]:
     with st.spinner("Đang tạo âm thanh..."):
         if 'exam_audio_bytes' not in st.session_state:
             try:
-                st.session_state.exam_audio_bytes = get_tts_audio(data['script'])
+                st.session_state.exam_audio_bytes = get_tts_audio_source(data['script'])
             except Exception as e:
                 logger.error(f"TTS Error: {e}")
                 st.session_state.exam_audio_bytes = None
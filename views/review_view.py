@@ -62,11 +62,11 @@ def render_study_config(account_type: str, vocab_df: pd.DataFrame, progress_df:
 def render_word_card(row: pd.Series, index: int) -> None:
     """Render a simple, readable vocabulary word card."""
     is_new = row.get('type') == 'new'
-    from core.tts import get_tts_audio
+    from core.tts import get_tts_audio_source
     import base64
     
     # Pre-load audio for instant playback
-    audio_bytes = get_tts_audio(row['word'])
+    audio_source = get_tts_audio_source(row['word'])
     
     # Get data
     pronunciation = row.get('pronunciation', '')
@@ -95,11 +95,11 @@ def render_word_card(row: pd.Series, index: int) -> None:
         st.divider()
         
         # TTS Button - Working with fallback
-        if audio_bytes:
+        if audio_source:
             unique_id = f"tts_{abs(hash(row['word']))}"
             
             # Use native st.audio for guaranteed playback
-            st.audio(audio_bytes, format='audio/mp3')
+            st.audio(audio_source, format='audio/mp3')
         
         # Example
         if example and example != 'N/A':